@@ -0,0 +1,377 @@
+"""
+Almacén de snapshots diarios de manual evaluations
+Guarda cada exportación diaria como base completa + deltas por manualEvaluationId,
+con política de retención, para que el disco crezca con los cambios y no con
+los días de historia.
+Además mantiene un índice de versiones (válida desde / válida hasta) que permite
+consultar el estado de las evaluaciones a cualquier fecha sin reconstruir snapshots.
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+import pandas as pd
+from funciones_google import escritura_atomica
+from registro import obtener_logger
+
+logger = obtener_logger("almacen_snapshots")
+
+# Configuración del almacén
+RUTA_SNAPSHOTS = os.path.join("temp_archives", "snapshots")
+ARCHIVO_MANIFIESTO = "manifiesto.json"
+ARCHIVO_INDICE = "indice_versiones.pkl"
+COLUMNA_CLAVE = "manualEvaluationId"
+COLUMNA_ELIMINADO = "_eliminado"
+COLUMNA_DESDE = "valido_desde"
+COLUMNA_HASTA = "valido_hasta"
+VERSION_ABIERTA = "9999-12-31"  # valido_hasta de la versión vigente
+MAX_DELTAS_POR_BASE = 14   # Cadena máxima de deltas antes de escribir una nueva base
+DIAS_RETENCION = 90
+
+# Exportaciones crudas: 2025-05-21T09-05-23-manual-evaluations.csv
+_PATRON_EXPORTACION = re.compile(r"^(\d{4}-\d{2}-\d{2})T[\d-]+-manual-evaluations\.csv$")
+
+_lock = threading.Lock()
+_ultimo_reconstruido = {}  # fecha -> DataFrame (memoiza la última reconstrucción)
+
+
+def _ruta(nombre):
+    return os.path.join(RUTA_SNAPSHOTS, nombre)
+
+def _leer_manifiesto():
+    ruta = _ruta(ARCHIVO_MANIFIESTO)
+    if not os.path.exists(ruta):
+        return {"snapshots": []}
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _escribir_manifiesto(manifiesto):
+    os.makedirs(RUTA_SNAPSHOTS, exist_ok=True)
+    with escritura_atomica(_ruta(ARCHIVO_MANIFIESTO)) as ruta_temporal:
+        with open(ruta_temporal, "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f, indent=2)
+
+def _leer_crudo(origen):
+    """
+    Lee una exportación como texto para comparar filas sin pérdidas.
+    Retorna (DataFrame indexado por COLUMNA_CLAVE, orden original de columnas).
+    """
+    if isinstance(origen, pd.DataFrame):
+        df = origen.astype(str)
+    else:
+        df = pd.read_csv(origen, dtype=str, keep_default_na=False)
+    columnas = list(df.columns)
+    return df.drop_duplicates(subset=COLUMNA_CLAVE, keep="last").set_index(COLUMNA_CLAVE), columnas
+
+def _escribir_tabla(df, nombre):
+    with escritura_atomica(_ruta(nombre)) as ruta_temporal:
+        df.to_csv(ruta_temporal, compression="gzip")
+
+def _leer_tabla(nombre):
+    return pd.read_csv(_ruta(nombre), dtype=str, keep_default_na=False,
+                       index_col=COLUMNA_CLAVE, compression="gzip")
+
+def _calcular_delta(anterior, actual):
+    """Filas nuevas o modificadas (completas) + IDs eliminados marcados"""
+    comunes = actual.index.intersection(anterior.index)
+    hash_actual = pd.util.hash_pandas_object(actual.loc[comunes], index=False)
+    hash_anterior = pd.util.hash_pandas_object(
+        anterior.loc[comunes].reindex(columns=actual.columns), index=False
+    )
+    modificados = comunes[hash_actual.values != hash_anterior.values]
+    nuevos = actual.index.difference(anterior.index)
+    eliminados = anterior.index.difference(actual.index)
+
+    delta = actual.loc[nuevos.append(modificados)].copy()
+    delta[COLUMNA_ELIMINADO] = "0"
+    if len(eliminados):
+        bajas = pd.DataFrame(index=eliminados, columns=actual.columns).fillna("")
+        bajas[COLUMNA_ELIMINADO] = "1"
+        delta = pd.concat([delta, bajas])
+    delta.index.name = COLUMNA_CLAVE
+    return delta
+
+def _aplicar_delta(df, delta):
+    eliminados = delta.index[delta[COLUMNA_ELIMINADO] == "1"]
+    cambios = delta[delta[COLUMNA_ELIMINADO] != "1"].drop(columns=COLUMNA_ELIMINADO)
+    df = df.drop(index=eliminados.intersection(df.index))
+    df = df.drop(index=cambios.index.intersection(df.index))
+    return pd.concat([df, cambios.reindex(columns=df.columns)])
+
+def _reconstruir(manifiesto, fecha):
+    """Reconstruye el snapshot vigente a `fecha` (último con fecha <= fecha)"""
+    entradas = [e for e in manifiesto["snapshots"] if e["fecha"] <= fecha]
+    if not entradas:
+        return None
+
+    objetivo = entradas[-1]
+    if objetivo["fecha"] in _ultimo_reconstruido:
+        return _ultimo_reconstruido[objetivo["fecha"]]
+
+    # Última base de la cadena y deltas posteriores hasta el objetivo
+    inicio = max(i for i, e in enumerate(entradas) if e["tipo"] == "base")
+    df = _leer_tabla(entradas[inicio]["archivo"])
+    for entrada in entradas[inicio + 1:]:
+        df = _aplicar_delta(df, _leer_tabla(entrada["archivo"]))
+
+    _ultimo_reconstruido.clear()
+    _ultimo_reconstruido[objetivo["fecha"]] = df
+    return df
+
+def _leer_indice():
+    ruta = _ruta(ARCHIVO_INDICE)
+    if not os.path.exists(ruta):
+        return None
+    return pd.read_pickle(ruta)
+
+def _escribir_indice(indice):
+    with escritura_atomica(_ruta(ARCHIVO_INDICE)) as ruta_temporal:
+        indice.to_pickle(ruta_temporal)
+
+def _registrar_en_indice(indice, fecha, delta):
+    """
+    Cierra las versiones vigentes de los IDs presentes en `delta` y abre
+    versiones nuevas (desde `fecha`) para las filas nuevas o modificadas.
+    """
+    if indice is None:
+        indice = pd.DataFrame(columns=[COLUMNA_CLAVE, COLUMNA_DESDE, COLUMNA_HASTA])
+
+    abiertas = (indice[COLUMNA_HASTA] == VERSION_ABIERTA) & indice[COLUMNA_CLAVE].isin(delta.index)
+    indice.loc[abiertas, COLUMNA_HASTA] = fecha
+
+    altas = delta[delta[COLUMNA_ELIMINADO] != "1"].drop(columns=COLUMNA_ELIMINADO).reset_index()
+    altas[COLUMNA_DESDE] = fecha
+    altas[COLUMNA_HASTA] = VERSION_ABIERTA
+
+    indice = pd.concat([indice, altas], ignore_index=True)
+    return indice.sort_values([COLUMNA_CLAVE, COLUMNA_DESDE], kind="stable").reset_index(drop=True)
+
+def _deshacer_en_indice(indice, fecha):
+    """Revierte los cambios que registró el snapshot de `fecha` (último del índice)"""
+    if indice is None:
+        return None
+    indice = indice[indice[COLUMNA_DESDE] != fecha].copy()
+    indice.loc[indice[COLUMNA_HASTA] == fecha, COLUMNA_HASTA] = VERSION_ABIERTA
+    return indice
+
+def _delta_completo(actual):
+    """Delta equivalente a dar de alta todas las filas de un snapshot"""
+    delta = actual.copy()
+    delta[COLUMNA_ELIMINADO] = "0"
+    return delta
+
+def _construir_indice(manifiesto):
+    """Índice de versiones completo a partir de los snapshots del manifiesto"""
+    indice, anterior = None, None
+    for entrada in manifiesto["snapshots"]:
+        actual = _reconstruir(manifiesto, entrada["fecha"])
+        delta = _delta_completo(actual) if anterior is None else _calcular_delta(anterior, actual)
+        indice = _registrar_en_indice(indice, entrada["fecha"], delta)
+        anterior = actual
+    return indice
+
+def guardar_snapshot(fecha, origen):
+    """
+    Agrega el snapshot de `fecha` (YYYY-MM-DD) desde una ruta CSV o DataFrame crudo.
+    Se guarda como delta contra el snapshot anterior, o como base completa si es
+    el primero o la cadena de deltas alcanzó MAX_DELTAS_POR_BASE.
+    """
+    with _lock:
+        manifiesto = _leer_manifiesto()
+        snapshots = manifiesto["snapshots"]
+        actual, columnas = _leer_crudo(origen)
+
+        if snapshots and fecha < snapshots[-1]["fecha"]:
+            raise ValueError(f"Snapshot {fecha} anterior al último almacenado ({snapshots[-1]['fecha']})")
+        indice = _leer_indice()
+        if snapshots and fecha == snapshots[-1]["fecha"]:
+            # Reemplazo del día: se descarta la entrada previa
+            entrada = snapshots.pop()
+            _ultimo_reconstruido.clear()
+            indice = _deshacer_en_indice(indice, fecha)
+            if not any(e["archivo"] == entrada["archivo"] for e in snapshots):
+                os.remove(_ruta(entrada["archivo"]))
+
+        if indice is None and snapshots:
+            # Almacén creado antes del índice de versiones
+            indice = _construir_indice(manifiesto)
+
+        os.makedirs(RUTA_SNAPSHOTS, exist_ok=True)
+        deltas_en_cadena = 0
+        for e in reversed(snapshots):
+            if e["tipo"] == "base":
+                break
+            deltas_en_cadena += 1
+
+        if snapshots:
+            delta = _calcular_delta(_reconstruir(manifiesto, snapshots[-1]["fecha"]), actual)
+        else:
+            delta = _delta_completo(actual)
+
+        if not snapshots or deltas_en_cadena >= MAX_DELTAS_POR_BASE:
+            tipo, tabla = "base", actual
+        else:
+            tipo, tabla = "delta", delta
+
+        nombre = f"{fecha}_{tipo}.csv.gz"
+        _escribir_tabla(tabla, nombre)
+        snapshots.append({"fecha": fecha, "tipo": tipo, "archivo": nombre, "filas": len(tabla), "columnas": columnas})
+        _escribir_indice(_registrar_en_indice(indice, fecha, delta))
+        _escribir_manifiesto(manifiesto)
+
+        _ultimo_reconstruido.clear()
+        _ultimo_reconstruido[fecha] = actual
+        logger.info("Snapshot %s guardado como %s", fecha, tipo, extra={"etapa": "snapshot", "filas": len(tabla)})
+        return nombre
+
+def reconstruir_snapshot(fecha):
+    """
+    Retorna la exportación cruda vigente a `fecha` (YYYY-MM-DD) como DataFrame
+    de texto, o un DataFrame vacío si no hay datos. Tiene las mismas filas y
+    columnas (en el orden de columnas de la exportación); el orden de las filas
+    puede diferir del archivo original.
+    """
+    with _lock:
+        manifiesto = _leer_manifiesto()
+        df = _reconstruir(manifiesto, fecha)
+    if df is None:
+        return pd.DataFrame()
+    df = df.reset_index()
+    entrada = [e for e in manifiesto["snapshots"] if e["fecha"] <= fecha][-1]
+    # Entradas guardadas antes de registrar el orden conservan el de la tabla
+    columnas = entrada.get("columnas")
+    return df[columnas] if columnas and set(columnas) == set(df.columns) else df
+
+def listar_snapshots():
+    """Lista las entradas del manifiesto (fecha, tipo, archivo, filas)"""
+    return pd.DataFrame(_leer_manifiesto()["snapshots"])
+
+def aplicar_retencion(dias_retencion=DIAS_RETENCION):
+    """
+    Elimina snapshots con más de `dias_retencion` días respecto al más reciente.
+    Si el primer snapshot conservado es un delta, se reescribe como base.
+    """
+    with _lock:
+        manifiesto = _leer_manifiesto()
+        snapshots = manifiesto["snapshots"]
+        if not snapshots:
+            return 0
+
+        limite = (pd.Timestamp(snapshots[-1]["fecha"]) - pd.Timedelta(days=dias_retencion)).strftime("%Y-%m-%d")
+        conservados = [e for e in snapshots if e["fecha"] >= limite]
+        descartados = [e for e in snapshots if e["fecha"] < limite]
+        if not descartados:
+            return 0
+
+        primero = conservados[0]
+        if primero["tipo"] != "base":
+            df = _reconstruir(manifiesto, primero["fecha"])
+            nombre = f"{primero['fecha']}_base.csv.gz"
+            _escribir_tabla(df, nombre)
+            descartados.append(dict(primero))
+            primero.update({"tipo": "base", "archivo": nombre, "filas": len(df)})
+
+        manifiesto["snapshots"] = conservados
+        indice = _leer_indice()
+        if indice is not None:
+            # Versiones que ya no son visibles en ninguna fecha conservada se eliminan;
+            # las vigentes al primer snapshot conservado empiezan en esa fecha
+            indice = indice[indice[COLUMNA_HASTA] > primero["fecha"]].reset_index(drop=True)
+            indice.loc[indice[COLUMNA_DESDE] < primero["fecha"], COLUMNA_DESDE] = primero["fecha"]
+            _escribir_indice(indice)
+        _escribir_manifiesto(manifiesto)
+        for entrada in descartados:
+            try:
+                os.remove(_ruta(entrada["archivo"]))
+            except OSError as e:
+                logger.warning("No se pudo eliminar snapshot %s: %s", entrada['archivo'], e)
+
+        _ultimo_reconstruido.clear()
+        logger.info("Retención aplicada: %s archivos de snapshot eliminados", len(descartados))
+        return len(descartados)
+
+def estado_a_fecha(fecha, ids=None):
+    """
+    Consulta de viaje en el tiempo: retorna la fila vigente de cada
+    manualEvaluationId en el snapshot de `fecha` (YYYY-MM-DD), resuelta sobre
+    el índice de versiones sin reconstruir ni releer exportaciones.
+    `ids` restringe la consulta a un subconjunto de manualEvaluationId.
+    """
+    indice = _leer_indice()
+    if indice is None:
+        return pd.DataFrame()
+
+    vigentes = (indice[COLUMNA_DESDE] <= fecha) & (indice[COLUMNA_HASTA] > fecha)
+    if ids is not None:
+        vigentes &= indice[COLUMNA_CLAVE].isin(ids)
+    return indice[vigentes].drop(columns=[COLUMNA_DESDE, COLUMNA_HASTA]).reset_index(drop=True)
+
+def historial_evaluacion(manual_evaluation_id):
+    """Todas las versiones almacenadas de una evaluación, con su intervalo de validez"""
+    indice = _leer_indice()
+    if indice is None:
+        return pd.DataFrame()
+    return indice[indice[COLUMNA_CLAVE] == manual_evaluation_id].reset_index(drop=True)
+
+def reconstruir_indice():
+    """Regenera el índice de versiones recorriendo los snapshots del manifiesto"""
+    with _lock:
+        indice = _construir_indice(_leer_manifiesto())
+        if indice is not None:
+            _escribir_indice(indice)
+        return 0 if indice is None else len(indice)
+
+def fecha_de_exportacion(nombre_archivo):
+    """Fecha YYYY-MM-DD de una exportación cruda según su nombre, o None"""
+    coincidencia = _PATRON_EXPORTACION.match(os.path.basename(nombre_archivo))
+    return coincidencia.group(1) if coincidencia else None
+
+def importar_exportaciones(carpeta="temp_archives", eliminar_originales=True):
+    """
+    Ingresa al almacén las exportaciones crudas sueltas de `carpeta`
+    (en orden cronológico). Con `eliminar_originales` se borra cada CSV
+    recién almacenado; las exportaciones anteriores al último snapshot no
+    pueden ingresarse y se conservan con una advertencia.
+    """
+    ultimo = _leer_manifiesto()["snapshots"]
+    ultima_fecha = ultimo[-1]["fecha"] if ultimo else ""
+    importados = 0
+
+    for nombre in sorted(os.listdir(carpeta)):
+        fecha = fecha_de_exportacion(nombre)
+        if fecha is None:
+            continue
+
+        ruta = os.path.join(carpeta, nombre)
+        if fecha < ultima_fecha:
+            logger.warning("Exportación %s anterior al último snapshot (%s): se conserva sin importar",
+                           nombre, ultima_fecha, extra={"etapa": "snapshot"})
+            continue
+
+        guardar_snapshot(fecha, ruta)
+        ultima_fecha = fecha
+        importados += 1
+        if eliminar_originales:
+            os.remove(ruta)
+
+    return importados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa exportaciones sueltas al almacén de snapshots")
+    parser.add_argument("carpeta", nargs="?", default="temp_archives",
+                        help="Carpeta con exportaciones AAAA-MM-DDT...-manual-evaluations.csv")
+    parser.add_argument("--conservar", action="store_true", help="No eliminar los CSV importados")
+    argumentos = parser.parse_args()
+
+    importados = importar_exportaciones(argumentos.carpeta, eliminar_originales=not argumentos.conservar)
+    aplicar_retencion()
+    logger.info("Exportaciones importadas: %s", importados, extra={"etapa": "snapshot"})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
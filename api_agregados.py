@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+API HTTP de solo lectura con los agregados del dashboard en JSON
+Sirve los mismos datos precalculados que usa Streamlit (caché por versión de
+la fuente y almacén local) para que otros equipos no dependan de la interfaz.
+Cada respuesta lleva ETag; si el cliente envía If-None-Match y la versión no
+cambió se responde 304 sin cuerpo.
+
+Uso:
+    python api_agregados.py --puerto 8502
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import cache_datos
+import data_manager
+import motor_consultas
+from registro import obtener_logger
+
+logger = obtener_logger("api_agregados")
+
+PUERTO_POR_DEFECTO = 8502
+ESPACIO_RESPUESTAS = "api_agregados"
+
+
+def _version_evaluaciones():
+    return data_manager.version_vigente()
+
+def _version_traspaso():
+    """La tabla de traspaso se actualiza cuando la página de monitoreo carga el Sheet"""
+    ruta = os.path.join(motor_consultas.RUTA_ALMACEN, motor_consultas.TABLAS["traspaso"])
+    if not motor_consultas.disponible() or not os.path.exists(ruta):
+        return None
+    return f"traspaso@{os.path.getmtime(ruta)}"
+
+def resoluciones_por_mes():
+    """Casos por mes local y resolución (todas las evaluaciones)"""
+    df = data_manager.obtener_datos_principales(incluir_analistas=False)
+    if df.empty:
+        return []
+    conteo = df[df["mes_local"] > 0].groupby(["mes_local", "resolucion_riesgo"], observed=True).size()
+    return [
+        {"mes": data_manager.etiqueta_mes(mes), "resolucion": resolucion, "cantidad": int(cantidad)}
+        for (mes, resolucion), cantidad in conteo.items()
+    ]
+
+def casos_por_dia():
+    """Casos, aprobados y rechazados por día local, desde los resúmenes diarios"""
+    resumenes = data_manager.obtener_resumenes(incluir_analistas=False)
+    return [
+        {"fecha": dia.isoformat(), "casos": r.casos, "aprobados": r.aprobados, "rechazados": r.rechazados}
+        for dia, r in sorted(resumenes["por_dia"].items())
+    ]
+
+def analistas_por_mes():
+    """Operaciones por analista y mes (resolución más reciente por RUT, como en el dashboard)"""
+    df = data_manager.obtener_datos_principales(incluir_analistas=True)
+    if df.empty or "analista_riesgo" not in df.columns:
+        return []
+    df = data_manager.deduplicar_por_rut(df)
+    df = df[(df["analista_riesgo"] != "Desconocido") & (df["mes_local"] > 0)]
+    conteo = df.groupby(["mes_local", "analista_riesgo"]).size()
+    return [
+        {"mes": data_manager.etiqueta_mes(mes), "analista": analista, "operaciones": int(cantidad)}
+        for (mes, analista), cantidad in conteo.items()
+    ]
+
+def traspaso_por_mes():
+    """Evaluaciones One vs Producto por mes, desde el almacén local"""
+    df = motor_consultas.ejecutar_consulta("traspaso_por_mes")
+    return json.loads(df.to_json(orient="records"))
+
+# Ruta -> (función de cálculo, función de versión de su fuente)
+RUTAS = {
+    "/resoluciones_por_mes": (resoluciones_por_mes, _version_evaluaciones),
+    "/casos_por_dia": (casos_por_dia, _version_evaluaciones),
+    "/analistas_por_mes": (analistas_por_mes, _version_evaluaciones),
+    "/traspaso_por_mes": (traspaso_por_mes, _version_traspaso),
+}
+
+
+def obtener_respuesta(ruta):
+    """
+    Cuerpo JSON y ETag de una ruta para la versión vigente de su fuente.
+    El cuerpo se serializa una sola vez por versión (caché compartido).
+    """
+    calcular, obtener_version = RUTAS[ruta]
+    version = obtener_version()
+    if version is None:
+        return None, None
+
+    def serializar():
+        datos = calcular()
+        if not datos:
+            return None
+        return json.dumps({"version": str(version), "datos": datos}, ensure_ascii=False).encode("utf-8")
+
+    cuerpo = cache_datos.obtener_o_calcular(f"{ESPACIO_RESPUESTAS}{ruta.replace('/', '_')}", version, serializar)
+    if cuerpo is None:
+        return None, None
+    return cuerpo, f'"{hashlib.sha1(cuerpo).hexdigest()}"'
+
+
+class ManejadorAgregados(BaseHTTPRequestHandler):
+    """Atiende GET sobre las rutas de RUTAS (otros métodos responden 501)"""
+
+    def do_GET(self):
+        ruta = urlparse(self.path).path.rstrip("/") or "/"
+
+        if ruta == "/":
+            self._responder_json(200, {"rutas": sorted(RUTAS)})
+            return
+        if ruta not in RUTAS:
+            self._responder_json(404, {"error": f"Ruta no encontrada: {ruta}"})
+            return
+
+        try:
+            cuerpo, etag = obtener_respuesta(ruta)
+        except Exception as e:
+            logger.error("Error al calcular %s: %s", ruta, e)
+            self._responder_json(500, {"error": "Error interno al calcular el agregado"})
+            return
+
+        if cuerpo is None:
+            self._responder_json(503, {"error": "Datos no disponibles por el momento"})
+            return
+
+        if etag in [e.strip() for e in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"max-age={cache_datos.INTERVALO_REVALIDACION}")
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _responder_json(self, estado, contenido):
+        cuerpo = json.dumps(contenido, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        logger.debug(formato, *args, extra={"etapa": "api", "cliente": self.address_string()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API JSON de solo lectura con agregados del dashboard")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=PUERTO_POR_DEFECTO)
+    argumentos = parser.parse_args()
+
+    servidor = ThreadingHTTPServer((argumentos.host, argumentos.puerto), ManejadorAgregados)
+    logger.info("API de agregados en http://%s:%s/", argumentos.host, argumentos.puerto)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Deteniendo API de agregados")
+    finally:
+        servidor.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
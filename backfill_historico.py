@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Carga histórica (backfill) de exportaciones manual_evaluation desde Drive
+Recorre todas las carpetas año -> mes bajo ID_CARPETA_RAIZ, descarga y procesa
+sus CSV en un pool acotado de procesos y fusiona el resultado en el almacén
+local (DuckDB), conservando por evaluación la versión más reciente.
+Al terminar informa el rendimiento (archivos/s y MB/s).
+
+Uso:
+    python backfill_historico.py --procesos 4 --desde 2024-01 --hasta 2025-06
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from funciones_google import listar_archivos_carpeta, bajar_archivo_por_id
+import motor_consultas
+from data_manager import ID_CARPETA_RAIZ, RUTA_TEMP, procesar_datos_manual_evaluation
+from registro import obtener_logger, medir
+
+logger = obtener_logger("backfill_historico")
+
+RUTA_DESCARGAS = os.path.join(RUTA_TEMP, "backfill")
+PROCESOS_POR_DEFECTO = min(4, os.cpu_count() or 1)
+HILOS_LISTADO = 8            # Listados de carpetas en paralelo (solo E/S)
+ARCHIVOS_POR_COMPACTACION = 20  # Resultados acumulados antes de deduplicar en memoria
+
+
+def _subcarpetas(id_carpeta, digitos):
+    """Subcarpetas cuyo nombre es un número de `digitos` cifras (año o mes)"""
+    carpeta = listar_archivos_carpeta(id_carpeta)
+    if carpeta.empty:
+        return carpeta
+    nombres = carpeta["Nombre"].astype(str)
+    return carpeta[nombres.str.fullmatch(rf"\d{{{digitos}}}") & (carpeta["Tipo"] == "application/vnd.google-apps.folder")]
+
+def descubrir_carpetas_mes(desde=None, hasta=None):
+    """
+    Carpetas de mes disponibles en Drive como lista de (AAAA-MM, ID),
+    opcionalmente acotadas a [desde, hasta] (textos AAAA-MM).
+    """
+    anios = _subcarpetas(ID_CARPETA_RAIZ, 4)
+    with ThreadPoolExecutor(HILOS_LISTADO) as hilos:
+        listados = hilos.map(lambda fila: (fila[0], _subcarpetas(fila[1], 2)), zip(anios["Nombre"], anios["ID"]))
+        meses = [
+            (f"{anio}-{mes}", id_mes)
+            for anio, carpeta_anio in listados
+            for mes, id_mes in zip(carpeta_anio["Nombre"], carpeta_anio["ID"])
+        ]
+    return sorted(
+        (mes, id_mes) for mes, id_mes in meses
+        if (desde is None or mes >= desde) and (hasta is None or mes <= hasta)
+    )
+
+def listar_exportaciones(carpetas_mes, solo_ultima=False):
+    """
+    CSV de cada carpeta de mes en orden cronológico (columnas de
+    listar_archivos_carpeta más `Mes`). Con `solo_ultima` se toma solo la
+    exportación más reciente de cada mes (las exportaciones son acumulativas).
+    """
+    def listar(mes, id_mes):
+        carpeta = listar_archivos_carpeta(id_mes)
+        if carpeta.empty:
+            return carpeta
+        carpeta = carpeta[carpeta["Tipo"] == "text/csv"].assign(Mes=mes)
+        carpeta["Fecha Creación"] = pd.to_datetime(carpeta["Fecha Creación"], utc=True, errors="coerce")
+        carpeta = carpeta.sort_values("Fecha Creación")
+        return carpeta.tail(1) if solo_ultima else carpeta
+
+    with ThreadPoolExecutor(HILOS_LISTADO) as hilos:
+        listados = [l for l in hilos.map(lambda c: listar(*c), carpetas_mes) if not l.empty]
+    if not listados:
+        return pd.DataFrame(columns=["Nombre", "ID", "Tipo", "Fecha Creación", "Mes"])
+    return pd.concat(listados, ignore_index=True).sort_values("Fecha Creación", kind="mergesort")
+
+def _procesar_exportacion(id_archivo, orden):
+    """
+    Trabajo de un proceso: descarga una exportación a su propia carpeta,
+    la procesa y la elimina. Retorna (orden, DataFrame, bytes descargados).
+    """
+    destino = os.path.join(RUTA_DESCARGAS, id_archivo)
+    try:
+        ruta = bajar_archivo_por_id(id_archivo, destino)
+        if ruta is None:
+            raise ValueError(f"No se pudo descargar el archivo {id_archivo}")
+        tamano = os.path.getsize(ruta)
+        df = procesar_datos_manual_evaluation(ruta)
+        if df.empty:
+            # procesar_datos_manual_evaluation registra el error y retorna vacío
+            raise ValueError(f"No se pudo procesar el archivo {id_archivo}")
+        return orden, df, tamano
+    finally:
+        shutil.rmtree(destino, ignore_errors=True)
+
+def _compactar(partes):
+    """Une resultados parciales dejando la versión más reciente de cada evaluación"""
+    df = pd.concat(partes, ignore_index=True)
+    df = df.sort_values(["fecha_creacion", "_orden_archivo"], kind="mergesort", na_position="first")
+    return df.drop_duplicates("manualEvaluationId", keep="last")
+
+def ejecutar_backfill(desde=None, hasta=None, procesos=PROCESOS_POR_DEFECTO, solo_ultima=False):
+    """
+    Descarga y procesa en paralelo todas las exportaciones del rango y las
+    fusiona en el almacén local. Retorna las métricas de rendimiento.
+    """
+    with medir(logger, "backfill_listado") as campos:
+        exportaciones = listar_exportaciones(descubrir_carpetas_mes(desde, hasta), solo_ultima)
+        campos["archivos"] = len(exportaciones)
+
+    metricas = {"archivos": 0, "fallidos": 0, "bytes": 0, "filas": 0, "segundos": 0.0}
+    if exportaciones.empty:
+        logger.warning("No se encontraron exportaciones para el backfill", extra={"etapa": "backfill"})
+        return metricas
+
+    inicio = time.perf_counter()
+    partes, pendientes_compactar = [], 0
+    # spawn: con fork los hijos heredan el registro sin su hilo de escritura y sus logs se pierden
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futuros = {
+            pool.submit(_procesar_exportacion, id_archivo, orden): nombre
+            for orden, (id_archivo, nombre) in enumerate(zip(exportaciones["ID"], exportaciones["Nombre"]))
+        }
+        for futuro in as_completed(futuros):
+            try:
+                orden, df, tamano = futuro.result()
+            except Exception as e:
+                metricas["fallidos"] += 1
+                logger.error("Exportación omitida en backfill (%s): %s", futuros[futuro], e, extra={"etapa": "backfill"})
+                continue
+
+            metricas["archivos"] += 1
+            metricas["bytes"] += tamano
+            partes.append(df.assign(_orden_archivo=orden))
+            pendientes_compactar += 1
+            if pendientes_compactar >= ARCHIVOS_POR_COMPACTACION:
+                partes, pendientes_compactar = [_compactar(partes)], 0
+
+            transcurrido = time.perf_counter() - inicio
+            logger.info(
+                "Backfill %d/%d archivos", metricas["archivos"] + metricas["fallidos"], len(futuros),
+                extra={
+                    "etapa": "backfill", "nombre_archivo": futuros[futuro], "bytes": tamano,
+                    "archivos_s": round(metricas["archivos"] / transcurrido, 2),
+                    "mb_s": round(metricas["bytes"] / 1e6 / transcurrido, 2),
+                }
+            )
+
+    if partes:
+        df_historico = _compactar(partes).drop(columns="_orden_archivo")
+        with medir(logger, "backfill_fusion", filas=len(df_historico)):
+            motor_consultas.fusionar_evaluaciones(df_historico)
+        metricas["filas"] = len(df_historico)
+
+    metricas["segundos"] = round(time.perf_counter() - inicio, 2)
+    metricas["archivos_s"] = round(metricas["archivos"] / max(metricas["segundos"], 1e-9), 2)
+    metricas["mb_s"] = round(metricas["bytes"] / 1e6 / max(metricas["segundos"], 1e-9), 2)
+    logger.info("Backfill terminado", extra={"etapa": "backfill", **metricas})
+    return metricas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga histórica de exportaciones de Drive al almacén local")
+    parser.add_argument("--desde", help="Primer mes a cargar (AAAA-MM)")
+    parser.add_argument("--hasta", help="Último mes a cargar (AAAA-MM)")
+    parser.add_argument("--procesos", type=int, default=PROCESOS_POR_DEFECTO)
+    parser.add_argument("--solo-ultima", action="store_true",
+                        help="Solo la exportación más reciente de cada mes")
+    argumentos = parser.parse_args()
+
+    if not motor_consultas.disponible():
+        logger.error("DuckDB no está instalado; el backfill necesita el almacén local")
+        return 1
+
+    metricas = ejecutar_backfill(argumentos.desde, argumentos.hasta, argumentos.procesos, argumentos.solo_ultima)
+    return 0 if metricas["archivos"] and not metricas["fallidos"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
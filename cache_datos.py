@@ -0,0 +1,310 @@
+"""
+Módulo de caché en dos niveles para el dashboard de riesgo
+Nivel 1: LRU acotado en memoria del proceso (compartido por todas las sesiones)
+Nivel 2: archivos en disco que sobreviven a reinicios del servidor
+Las entradas se identifican por la versión de la fuente (ID + fecha de Drive),
+no por tiempo de expiración.
+La última versión confirmada de cada espacio también se guarda en disco: tras
+un reinicio se sirve de inmediato (si sus datos están en disco) mientras se
+revalida contra Drive en segundo plano.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from funciones_google import escritura_atomica
+from registro import obtener_logger
+
+logger = obtener_logger("cache_datos")
+
+# Configuración del caché
+RUTA_CACHE = "cache_datos"
+MAX_ENTRADAS_MEMORIA = 16
+INTERVALO_REVALIDACION = 300  # Segundos entre consultas de versión a Drive
+ARCHIVO_VERSION = "version.json"  # Última versión confirmada del espacio
+
+
+class CacheLRU:
+    """Caché LRU acotado en memoria, seguro para múltiples hilos"""
+
+    def __init__(self, max_entradas=MAX_ENTRADAS_MEMORIA):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            if clave not in self._datos:
+                return None
+            self._datos.move_to_end(clave)
+            return self._datos[clave]
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def eliminar_espacio(self, espacio):
+        """Elimina todas las entradas cuyo espacio coincide"""
+        with self._lock:
+            for clave in [c for c in self._datos if c[0] == espacio]:
+                del self._datos[clave]
+
+
+class _Vuelo:
+    """Cálculo en curso al que pueden esperar otros hilos"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor = None
+        self.error = None
+
+
+_memoria = CacheLRU()
+_versiones = {}  # espacio -> (version, instante de consulta)
+_lock_versiones = threading.Lock()
+_vuelos = {}  # clave -> _Vuelo en curso
+_lock_vuelos = threading.Lock()
+_revalidacion_inmediata = set()  # espacios cuya próxima versión se consulta sin servir la anterior
+
+
+def _ruta_espacio(espacio):
+    return os.path.join(RUTA_CACHE, espacio)
+
+def _ruta_entrada(espacio, version):
+    nombre = hashlib.sha1(str(version).encode("utf-8")).hexdigest()
+    return os.path.join(_ruta_espacio(espacio), f"{nombre}.pkl")
+
+def _es_valido(valor):
+    """No se cachean resultados vacíos (errores de carga)"""
+    if valor is None:
+        return False
+    return not getattr(valor, "empty", False)
+
+def _ruta_version(espacio):
+    return os.path.join(_ruta_espacio(espacio), ARCHIVO_VERSION)
+
+def _leer_version_persistida(espacio):
+    try:
+        with open(_ruta_version(espacio), "r", encoding="utf-8") as f:
+            return json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _guardar_version_persistida(espacio, version):
+    try:
+        os.makedirs(_ruta_espacio(espacio), exist_ok=True)
+        with escritura_atomica(_ruta_version(espacio)) as ruta_temporal:
+            with open(ruta_temporal, "w", encoding="utf-8") as f:
+                json.dump({"version": version, "confirmada": time.time()}, f)
+    except Exception as e:
+        logger.warning("No se pudo guardar la versión de %s: %s", espacio, e)
+
+def existe(espacio, version):
+    """Indica si hay un valor para la versión en memoria o en disco (sin cargarlo)"""
+    return _memoria.obtener((espacio, version)) is not None or os.path.exists(_ruta_entrada(espacio, version))
+
+def obtener(espacio, version):
+    """
+    Busca un valor en memoria y luego en disco.
+    Si se encuentra en disco se promueve al nivel de memoria.
+    """
+    clave = (espacio, version)
+    valor = _memoria.obtener(clave)
+    if valor is not None:
+        return valor
+
+    ruta = _ruta_entrada(espacio, version)
+    if not os.path.exists(ruta):
+        return None
+
+    try:
+        with open(ruta, "rb") as f:
+            valor = pickle.load(f)
+        _memoria.guardar(clave, valor)
+        return valor
+    except Exception as e:
+        logger.warning("Entrada de caché en disco ilegible (%s): %s", ruta, e)
+        return None
+
+def guardar(espacio, version, valor):
+    """
+    Guarda un valor en ambos niveles. En disco solo se conserva
+    la versión más reciente de cada espacio.
+    """
+    if not _es_valido(valor):
+        return
+
+    _memoria.guardar((espacio, version), valor)
+
+    try:
+        carpeta = _ruta_espacio(espacio)
+        os.makedirs(carpeta, exist_ok=True)
+        ruta = _ruta_entrada(espacio, version)
+
+        with escritura_atomica(ruta) as ruta_temporal:
+            with open(ruta_temporal, "wb") as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # Eliminar versiones anteriores del mismo espacio
+        for nombre in os.listdir(carpeta):
+            ruta_vieja = os.path.join(carpeta, nombre)
+            if ruta_vieja != ruta and nombre.endswith(".pkl"):
+                os.remove(ruta_vieja)
+    except Exception as e:
+        logger.warning("No se pudo escribir caché en disco para %s: %s", espacio, e)
+
+def ejecutar_una_vez(clave, funcion):
+    """
+    Ejecuta `funcion` una sola vez para llamadas concurrentes con la misma clave.
+    El primer hilo calcula; los demás esperan y reciben el mismo resultado
+    (o la misma excepción).
+    """
+    with _lock_vuelos:
+        vuelo = _vuelos.get(clave)
+        es_lider = vuelo is None
+        if es_lider:
+            vuelo = _Vuelo()
+            _vuelos[clave] = vuelo
+
+    if not es_lider:
+        vuelo.evento.wait()
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.valor
+
+    try:
+        vuelo.valor = funcion()
+        return vuelo.valor
+    except BaseException as e:
+        vuelo.error = e
+        raise
+    finally:
+        with _lock_vuelos:
+            _vuelos.pop(clave, None)
+        vuelo.evento.set()
+
+def obtener_o_calcular(espacio, version, funcion):
+    """
+    Retorna el valor cacheado para la versión o lo calcula con `funcion`.
+    Si varias sesiones piden la misma versión a la vez, solo una la calcula.
+    """
+    valor = obtener(espacio, version)
+    if valor is not None:
+        return valor
+
+    def calcular():
+        # Otro hilo pudo haber terminado mientras esperábamos el turno
+        existente = obtener(espacio, version)
+        if existente is not None:
+            return existente
+        nuevo = funcion()
+        guardar(espacio, version, nuevo)
+        return nuevo
+
+    return ejecutar_una_vez(("valor", espacio, version), calcular)
+
+def _consultar_version(espacio, sonda, al_cambiar=None):
+    """
+    Ejecuta la sonda y publica la versión (memoria y disco). Si la versión
+    cambió, `al_cambiar(anterior, nueva)` prepara sus datos antes de publicarla.
+    """
+    version = sonda()
+    with _lock_versiones:
+        registro = _versiones.get(espacio)
+    anterior = registro[0] if registro else None
+
+    if version is None:
+        if registro is not None:
+            # Drive no respondió: se sigue sirviendo la versión conocida hasta el próximo intervalo
+            with _lock_versiones:
+                _versiones[espacio] = (anterior, time.monotonic())
+        return anterior
+
+    if al_cambiar is not None and anterior is not None and version != anterior:
+        try:
+            al_cambiar(anterior, version)
+        except Exception as e:
+            logger.warning("No se pudo preparar la versión nueva de %s: %s", espacio, e)
+
+    with _lock_versiones:
+        _versiones[espacio] = (version, time.monotonic())
+    if version != _leer_version_persistida(espacio):
+        _guardar_version_persistida(espacio, version)
+    return version
+
+def _revalidar_en_segundo_plano(espacio, sonda, al_cambiar):
+    """Lanza la consulta de versión en un hilo (una sola en curso por espacio)"""
+    def revalidar_hilo():
+        try:
+            ejecutar_una_vez(("version", espacio), lambda: _consultar_version(espacio, sonda, al_cambiar))
+        except Exception as e:
+            logger.warning("Error al revalidar la versión de %s: %s", espacio, e)
+
+    with _lock_vuelos:
+        if ("version", espacio) in _vuelos:
+            return
+    threading.Thread(target=revalidar_hilo, name=f"revalidar-{espacio}", daemon=True).start()
+
+def version_vigente(espacio, sonda, al_cambiar=None, es_utilizable=None):
+    """
+    Retorna la versión actual de la fuente de un espacio.
+    `sonda` consulta solo metadatos en Drive y se ejecuta como máximo
+    una vez cada INTERVALO_REVALIDACION segundos por espacio.
+
+    Con una versión conocida vencida (o la persistida tras un reinicio, si
+    `es_utilizable(version)` lo confirma) se retorna esa versión de inmediato y
+    la sonda corre en segundo plano; la nueva versión se publica cuando
+    `al_cambiar` terminó de preparar sus datos. Sin versión conocida, o tras
+    `revalidar`, la consulta es sincrónica.
+    """
+    with _lock_versiones:
+        inmediata = espacio in _revalidacion_inmediata
+        registro = None if inmediata else _versiones.get(espacio)
+
+    if registro is None and not inmediata:
+        persistida = _leer_version_persistida(espacio)
+        if persistida is not None and (es_utilizable is None or es_utilizable(persistida)):
+            registro = (persistida, float("-inf"))
+            with _lock_versiones:
+                _versiones.setdefault(espacio, registro)
+            logger.info("Arranque en caliente con versión persistida", extra={"etapa": "version", "espacio": espacio})
+
+    if registro is not None:
+        if time.monotonic() - registro[1] >= INTERVALO_REVALIDACION:
+            _revalidar_en_segundo_plano(espacio, sonda, al_cambiar)
+        return registro[0]
+
+    version = ejecutar_una_vez(("version", espacio), lambda: _consultar_version(espacio, sonda))
+    if version is not None:
+        with _lock_versiones:
+            _revalidacion_inmediata.discard(espacio)
+    return version
+
+def revalidar(espacio):
+    """
+    Fuerza una consulta sincrónica de versión en el próximo acceso.
+    Los datos solo se recargan si la fuente cambió en Drive.
+    """
+    with _lock_versiones:
+        _versiones.pop(espacio, None)
+        _revalidacion_inmediata.add(espacio)
+
+def invalidar(espacio):
+    """Descarta todas las entradas de un espacio en memoria y disco"""
+    revalidar(espacio)
+    _memoria.eliminar_espacio(espacio)
+
+    carpeta = _ruta_espacio(espacio)
+    if os.path.isdir(carpeta):
+        for nombre in os.listdir(carpeta):
+            try:
+                os.remove(os.path.join(carpeta, nombre))
+            except OSError as e:
+                logger.warning("No se pudo eliminar entrada de caché %s: %s", nombre, e)
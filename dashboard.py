@@ -1,14 +1,28 @@
 # dashboard_riesgo.py - Nueva arquitectura con data_manager modular
 # ----------------------------------------------------------------------------
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from statsmodels.tsa.seasonal import seasonal_decompose
 import os
+import logging
+from time import perf_counter
 from datetime import datetime, date, time
-from data_manager import cargar_datos
+from data_manager import (
+    cargar_datos, refrescar_datos, procesar_datos_manual_evaluation,
+    obtener_resumenes, deduplicar_por_rut, obtener_historial, historial_rut,
+    ZONA_HORARIA, RESOLUCIONES, RESOLUCION_APROBADA, clave_dia, clave_mes, etiqueta_mes,
+)
+from resumenes_probabilisticos import TDigest, ResumenDiario, BORDES_MONTO, BORDES_RATIO
+import motor_consultas
+import almacen_snapshots
+import vista_cliente
+from registro import obtener_logger, medir
+
+logger = obtener_logger("dashboard")
 
 # ------------------ Configuracion y estilos -------------------
 st.set_page_config(
@@ -55,25 +69,51 @@ TICK_FONT_SIZE = 14
 LEGEND_FONT_SIZE = 16
 ANALYST_TICK_SIZE = 16
 MARGINS = dict(l=80, r=80, t=100, b=80)
+DIA_ESPECIFICO = "📅 Dia especifico"
+INTERVALO_FECHAS = "📊 Intervalo de fechas"
 
 # ------------------ Funciones auxiliares -------------------
-@st.cache_data(ttl=3600)  # Cache por 1 hora
 def mostrar_informacion_actualizacion():
     """Muestra información sobre el estado de actualización de datos"""
     ahora = datetime.now()
     hora_limite = time(10, 0)  # 10:00 AM
-    
+
     if ahora.time() >= hora_limite:
         status = "🟢 Datos actualizados (después de 10:00 AM)"
     else:
         status = "🟡 Datos del día anterior (antes de 10:00 AM)"
-    
+
     return status, ahora.strftime('%H:%M')
 
+# ------------------ Latencia de reruns por control -------------------
+def registrar_control(nombre):
+    """Callback on_change: recuerda qué control disparó el próximo rerun"""
+    st.session_state["control_rerun"] = nombre
+
+def control_de_rerun():
+    """Control que disparó la ejecución actual (se consume una sola vez)"""
+    return st.session_state.pop("control_rerun", None)
+
+def medir_fragmento(ambito):
+    """
+    Mide la ejecución de un fragmento. Si el fragmento se re-ejecuta solo
+    (lo disparó uno de sus controles) se registra en INFO con el control;
+    como parte de una ejecución completa de la página, en DEBUG.
+    """
+    control = control_de_rerun()
+    nivel = logging.INFO if control else logging.DEBUG
+    return medir(logger, "rerun", nivel=nivel, ambito=ambito, control=control or "pagina")
+
+inicio_pagina = perf_counter()
+control_pagina = control_de_rerun() or "carga"
+
 # ------------------ Carga de datos principal -------------------
-@st.cache_data(ttl=1800)  # Cache por 30 minutos
 def cargar_datos_dashboard(incluir_analistas=False):
-    """Función principal para cargar datos usando el nuevo data_manager"""
+    """
+    Función principal para cargar datos usando el nuevo data_manager.
+    El caché (por versión de la fuente) vive en data_manager y es compartido
+    entre sesiones: el DataFrame retornado no debe modificarse en el lugar.
+    """
     try:
         df = cargar_datos(incluir_analistas=incluir_analistas)
         if df.empty:
@@ -102,7 +142,8 @@ with col1:
 
 with col2:
     if st.button("🔄 Actualizar Datos", type="primary"):
-        st.cache_data.clear()
+        # Solo revalida la versión en Drive; no vacía el caché de otros usuarios
+        refrescar_datos()
         st.rerun()
 
 with col3:
@@ -112,10 +153,11 @@ with col3:
 # ------------------ Sidebar: Configuracion -------------------
 st.sidebar.markdown("## ⚙️ Configuracion")
 
-# Filtros de datos
+# Filtros de datos (cambia el conjunto de datos: re-ejecuta la pagina completa)
 unicos_graf = st.sidebar.checkbox(
     "🔍 Filtro resolución única más actual por cliente (ESTADO ACTUAL o FINAL del CLIENTE)",
-    help="Mantiene solo el registro más reciente por RUT"
+    help="Mantiene solo el registro más reciente por RUT",
+    key="unicos_graf", on_change=registrar_control, args=("unicos_graf",)
 )
 
 # Cargar datos con el nuevo sistema
@@ -124,88 +166,102 @@ with st.spinner("Cargando datos desde Google Drive..."):
 
 # Procesar filtros únicos si está habilitado
 if unicos_graf:
-    df_graf = (
-        df_graf.sort_values("fecha_creacion", ascending=False)
-        .drop_duplicates("rut", keep="first")
-        .reset_index(drop=True)
-    )
+    df_graf = deduplicar_por_rut(df_graf)
 else:
     # Si no se usa el filtro único, asegurar que la columna existe para evitar errores
     if "analista_riesgo" not in df_graf.columns:
-        df_graf["analista_riesgo"] = "N/A"
+        df_graf = df_graf.assign(analista_riesgo="N/A")
 
-# ------------------ Sidebar: Filtros de fecha -------------------
-st.sidebar.markdown("## 📅 Filtros de Tiempo")
+resumenes = obtener_resumenes(incluir_analistas=unicos_graf)
+historial = obtener_historial(incluir_analistas=unicos_graf)
 
-tipo_consulta = st.sidebar.radio(
-    "Tipo de consulta:",
-    ("📊 Intervalo de fechas", "📅 Dia especifico"),
-    help="Selecciona el tipo de analisis temporal"
+modo_cliente = st.sidebar.checkbox(
+    "⚡ Filtrado en el navegador",
+    help="Envia una vez los conteos diarios por resolucion y filtra las fechas en el navegador, "
+         "sin volver al servidor (solo KPIs y graficos de resoluciones y evolucion)",
+    key="modo_cliente", on_change=registrar_control, args=("modo_cliente",)
 )
 
-if tipo_consulta == "📊 Intervalo de fechas":
-    start_date = st.sidebar.date_input("📅 Fecha inicio")
-    end_date = st.sidebar.date_input("📅 Fecha fin")
-    
-    if not (start_date and end_date):
-        st.error("⚠️ Selecciona ambas fechas para continuar")
-        st.stop()
-    
-    # Convertir fechas a UTC para comparación
-    start_datetime = pd.to_datetime(start_date).tz_localize('UTC')
-    end_datetime = pd.to_datetime(end_date).tz_localize('UTC') + pd.Timedelta(days=1)
-    
-    df_filtered = df_graf[
-        (df_graf["fecha_creacion"] >= start_datetime) &
-        (df_graf["fecha_creacion"] < end_datetime)
-    ].copy()
-    
-    intervalo_texto = f"{start_date} - {end_date}"
-    
-else:
-    single_day = st.sidebar.date_input("📅 Selecciona el dia")
-    if not single_day:
-        st.error("⚠️ Selecciona un dia")
-        st.stop()
-      # Convertir fecha a UTC para comparación
-    start_datetime = pd.to_datetime(single_day).tz_localize('UTC')
-    end_datetime = start_datetime + pd.Timedelta(days=1)
-    
-    df_filtered = df_graf[
-        (df_graf["fecha_creacion"] >= start_datetime) &
-        (df_graf["fecha_creacion"] < end_datetime)
-    ].copy()
-    
-    intervalo_texto = f"{single_day}"
-
-# Crear campo de mes para agrupación (convertir UTC a local para display)
-df_filtered["mes"] = df_filtered["fecha_creacion"].dt.tz_convert(None).dt.to_period("M").astype(str)
+st.sidebar.caption(
+    "Los filtros de periodo y el mes del grafico circular estan en el panel principal: "
+    "al cambiarlos solo se recalculan los paneles que dependen de ellos"
+)
+
+# ------------------ Configuracion de graficos -------------------
+color_map = {
+    "Aprobado": "#77DD77",
+    "Aprobado con propuesta": "#FDFD96",
+    "Devuelto a comercial": "#FFB347",
+    "Rechazado": "#FF6961",
+    "Desconocido": "#AAAAAA",
+}
+
+orden_categorias = RESOLUCIONES
+
+# ------------------ Filtros de periodo -------------------
+def seleccionar_periodo():
+    """Controles de periodo; retorna (dia_inicio, dia_fin, tipo_consulta, intervalo_texto) o None"""
+    col_tipo, col_fechas = st.columns([1, 2])
+
+    with col_tipo:
+        tipo_consulta = st.radio(
+            "Tipo de consulta:",
+            (INTERVALO_FECHAS, DIA_ESPECIFICO),
+            help="Selecciona el tipo de analisis temporal",
+            key="tipo_consulta", on_change=registrar_control, args=("tipo_consulta",)
+        )
+
+    with col_fechas:
+        if tipo_consulta == INTERVALO_FECHAS:
+            col_inicio, col_fin = st.columns(2)
+            start_date = col_inicio.date_input(
+                "📅 Fecha inicio", key="fecha_inicio",
+                on_change=registrar_control, args=("fecha_inicio",)
+            )
+            end_date = col_fin.date_input(
+                "📅 Fecha fin", key="fecha_fin",
+                on_change=registrar_control, args=("fecha_fin",)
+            )
+
+            if not (start_date and end_date):
+                st.error("⚠️ Selecciona ambas fechas para continuar")
+                return None
+            return start_date, end_date, tipo_consulta, f"{start_date} - {end_date}"
+
+        single_day = st.date_input(
+            "📅 Selecciona el dia", key="dia_especifico",
+            on_change=registrar_control, args=("dia_especifico",)
+        )
+        if not single_day:
+            st.error("⚠️ Selecciona un dia")
+            return None
+        return single_day, single_day, tipo_consulta, f"{single_day}"
 
 # ------------------ Metricas principales -------------------
-if not df_filtered.empty:
+def mostrar_metricas(resumen_rango):
+    """KPIs desde resúmenes diarios precalculados: se fusionan los días del rango"""
     col1, col2, col3, col4 = st.columns(4)
-    
+
     with col1:
         st.metric(
             "📊 Total de Casos",
-            df_filtered.shape[0],
-            help="Numero total de casos en el periodo seleccionado"
+            resumen_rango.casos,
+            help=f"Numero total de casos en el periodo seleccionado "
+                 f"(~{resumen_rango.ruts.estimar():.0f} clientes distintos)"
         )
-    
+
     with col2:
-        aprobados = len(df_filtered[df_filtered["resolucion_riesgo"].isin(["Aprobado", "100% aprobado"])])
-        tasa_aprobacion = (aprobados / len(df_filtered) * 100) if len(df_filtered) > 0 else 0
+        tasa_aprobacion = (resumen_rango.aprobados / resumen_rango.casos * 100) if resumen_rango.casos > 0 else 0
         st.metric(
             "✅ Tasa de Aprobacion",
             f"{tasa_aprobacion:.1f}%",
             help="Porcentaje de casos aprobados"
         )
-    
+
     with col3:
-        if unicos_graf and "analista_riesgo" in df_filtered.columns:
-            # Contar solo analistas conocidos (no "Desconocido")
-            analistas_conocidos = df_filtered[df_filtered["analista_riesgo"] != "Desconocido"]
-            analistas_activos = analistas_conocidos["analista_riesgo"].nunique() if not analistas_conocidos.empty else 0
+        if unicos_graf:
+            # HyperLogLog de analistas conocidos (no "Desconocido")
+            analistas_activos = round(resumen_rango.analistas.estimar())
             st.metric(
                 "👥 Analistas Activos",
                 analistas_activos,
@@ -213,45 +269,23 @@ if not df_filtered.empty:
             )
         else:
             st.metric("👥 Analistas", "N/A", help="Requiere filtro por estado actual del cliente")
-    
+
     with col4:
-        if len(df_filtered) > 0:
-            periodo_dias = (df_filtered["fecha_creacion"].max() - df_filtered["fecha_creacion"].min()).days + 1
-            promedio_diario = len(df_filtered) / periodo_dias if periodo_dias > 0 else 0
+        if resumen_rango.casos > 0:
+            periodo_dias = (resumen_rango.ultima - resumen_rango.primera).days + 1
+            promedio_diario = resumen_rango.casos / periodo_dias if periodo_dias > 0 else 0
             st.metric(
                 "📈 Promedio Diario",
                 f"{promedio_diario:.1f}",
                 help="Promedio de casos por dia"
             )
-else:
-    st.warning("⚠️ No hay datos para el periodo seleccionado")
-    st.stop()
-
-# ------------------ Configuracion de graficos -------------------
-color_map = {
-    "Desconocido": "#AAAAAA",
-    "0": "#CCCCCC",
-    "Aprobado": "#77DD77",
-    "100% aprobado": "#77DD77",
-    "Aprobado con propuesta": "#FDFD96",
-    "Aprobado con Propuesta": "#FDFD96",
-    "Devuelto a comercial": "#FFB347",
-    "Devuelto Comercial": "#FFB347",
-    "Rechazado": "#FF6961",
-}
-
-orden_categorias = ["0", "Aprobado", "100% aprobado", "Aprobado con propuesta", 
-                   "Aprobado con Propuesta", "Devuelto a comercial", 
-                   "Devuelto Comercial", "Rechazado", "Desconocido"]
 
 # ------------------ Generacion de graficos -------------------
-missing_graphs = []
-
-# Grafico 1: Resoluciones por mes
-show_graph1 = False
-if not df_filtered.empty and df_filtered["mes"].nunique() > 0:
-    df_c = df_filtered.groupby(["mes", "resolucion_riesgo"]).size().reset_index(name="cantidad")
-    tot_mes = df_filtered.groupby("mes").size().to_dict()
+def grafico_resoluciones(df_filtered):
+    """Grafico 1: Resoluciones por mes (porcentaje dentro de cada mes)"""
+    df_c = df_filtered.groupby(["mes_local", "resolucion_riesgo"], observed=True).size().reset_index(name="cantidad")
+    df_c["mes"] = df_c["mes_local"].map(etiqueta_mes)
+    tot_mes = df_filtered.groupby("mes_local").size().rename(etiqueta_mes).to_dict()
     df_c["porcentaje"] = df_c.apply(
         lambda r: (r["cantidad"] / tot_mes[r["mes"]]) * 100, axis=1
     )
@@ -262,180 +296,467 @@ if not df_filtered.empty and df_filtered["mes"].nunique() > 0:
         df_c, x="mes_lbl", y="porcentaje", text="texto",
         color="resolucion_riesgo", barmode="group",
         color_discrete_map=color_map, template="plotly_white",
+        title=f"📊 Resoluciones por Periodo (Total: {df_filtered.shape[0]})",
     )
     fig_bar.update_traces(textposition="outside", marker_line_width=0)
     fig_bar.update_layout(
-        margin=MARGINS, title_font_size=SUBPLOT_TITLE_SZ,
+        height=450, margin=MARGINS, title_font_size=SUBPLOT_TITLE_SZ,
         xaxis_title="Periodo", yaxis_title="Porcentaje (%)",
-        font=dict(size=TICK_FONT_SIZE),
+        font=dict(size=TICK_FONT_SIZE), showlegend=False,
     )
-    show_graph1 = True
-else:
-    missing_graphs.append("Resoluciones por Mes")
-
-# Grafico 2: Distribucion por mes seleccionado
-available_months = sorted(df_filtered["mes"].unique())
-selected_month = st.sidebar.selectbox("📊 Mes para grafico circular", available_months)
+    return fig_bar
+
+@st.fragment
+def panel_torta(df_filtered):
+    """Grafico 2: Distribucion por mes seleccionado (su selector solo re-ejecuta este panel)"""
+    with medir_fragmento("torta"):
+        available_months = sorted(df_filtered["mes_local"].unique())
+        clave_mes_pie = st.selectbox(
+            "📊 Mes para grafico circular", available_months, format_func=etiqueta_mes,
+            key="mes_torta", on_change=registrar_control, args=("mes_torta",)
+        )
+        if clave_mes_pie is None:
+            st.info("⚠️ Sin datos para el mes")
+            return
 
-show_graph2 = False
-if selected_month in df_filtered["mes"].unique():
-    df_pie = df_filtered[df_filtered["mes"] == selected_month]
-    if not df_pie.empty:
+        selected_month = etiqueta_mes(clave_mes_pie)
+        df_pie = df_filtered[df_filtered["mes_local"] == clave_mes_pie]
         counts = df_pie["resolucion_riesgo"].value_counts()
-        if counts.sum() > 0:
-            pie_trace = go.Pie(
-                labels=counts.index, values=counts,
-                textinfo="percent+label", hole=0.3,
-                marker=dict(colors=[color_map.get(k, "#CCCCCC") for k in counts.index]),
-            )
-            show_graph2 = True
-        else:
-            missing_graphs.append(f"Distribucion para {selected_month}")
+        counts = counts[counts > 0]
+        if counts.sum() == 0:
+            st.info(f"ℹ️ Sin datos para la distribucion de {selected_month}")
+            return
+
+        fig_pie = go.Figure(go.Pie(
+            labels=counts.index, values=counts,
+            textinfo="percent+label", hole=0.3,
+            marker=dict(colors=[color_map.get(k, "#CCCCCC") for k in counts.index]),
+        ))
+        fig_pie.update_layout(
+            height=380, margin=MARGINS, template="plotly_white",
+            title=f"🥧 Distribucion en {selected_month}", title_font_size=SUBPLOT_TITLE_SZ,
+            font=dict(size=TICK_FONT_SIZE), showlegend=False,
+        )
+        st.plotly_chart(fig_pie, use_container_width=True)
+
+def grafico_evolucion(df_filtered, tipo_consulta, intervalo_texto):
+    """Grafico 3: Series de tiempo (por hora en un dia, por dia en un intervalo)"""
+    fig_tiempo = go.Figure()
+    if tipo_consulta == DIA_ESPECIFICO:
+        # Agrupar por hora
+        serie_raw = df_filtered.groupby("hora_local").size()
+        serie = serie_raw.reindex(range(24), fill_value=0)
+        fig_tiempo.add_trace(go.Bar(
+            x=serie.index, y=serie.values,
+            name="Casos por hora", marker_color="#87CEEB",
+        ))
+        x_title = "Hora"
     else:
-        missing_graphs.append(f"Distribucion para {selected_month}")
-
-# Grafico 3: Series de tiempo
-show_graph3 = False
-trend_trace = None
-if tipo_consulta == "📅 Dia especifico":
-    # Agrupar por hora
-    serie_raw = df_filtered.groupby(df_filtered["fecha_creacion"].dt.hour).size()
-    serie = serie_raw.reindex(range(24), fill_value=0)
-    df_cases = serie.reset_index()
-    df_cases.columns = ["Hora", "Casos"]
-    
-    bar_trace = go.Bar(
-        x=df_cases["Hora"], y=df_cases["Casos"],
-        name="Casos por hora", marker_color="#87CEEB",
-    )
-    show_graph3 = True
-else:
-    # Agrupar por dia
-    serie_raw = df_filtered.groupby(df_filtered["fecha_creacion"].dt.date).size()
-    if not serie_raw.empty:
-        serie_raw.index = pd.to_datetime(serie_raw.index)
+        # Agrupar por dia
+        serie_raw = df_filtered.groupby("dia_local").size()
+        serie_raw.index = pd.to_datetime(serie_raw.index.astype(str), format="%Y%m%d")
         serie = serie_raw.reindex(
             pd.date_range(serie_raw.index.min(), serie_raw.index.max(), freq="D"),
             fill_value=0
         )
-        
-        df_cases = serie.reset_index()
-        df_cases.columns = ["Fecha", "Casos"]
-        
-        bar_trace = go.Bar(
-            x=df_cases["Fecha"], y=df_cases["Casos"],
+        fig_tiempo.add_trace(go.Bar(
+            x=serie.index, y=serie.values,
             name="Casos diarios", marker_color="#87CEEB", opacity=0.7,
-        )
-        
+        ))
+
         # Tendencia si hay suficientes datos
         if len(serie) >= 8:
-            trend = seasonal_decompose(serie, model="additive", period=4).trend
-            df_trend = trend.reset_index()
-            df_trend.columns = ["Fecha", "Tendencia"]
-            df_trend.dropna(inplace=True)
-            
-            trend_trace = go.Scatter(
-                x=df_trend["Fecha"], y=df_trend["Tendencia"],
+            trend = seasonal_decompose(serie, model="additive", period=4).trend.dropna()
+            fig_tiempo.add_trace(go.Scatter(
+                x=trend.index, y=trend.values,
                 mode="lines+markers", name="Tendencia",
                 line=dict(color="red", width=3),
+            ))
+
+        # Anomalias detectadas en el refresco (volumen o tasa de rechazo)
+        for fecha_texto, anomalias_dia in sorted(resumenes.get("anomalias", {}).items()):
+            fecha_anomalia = pd.Timestamp(fecha_texto)
+            if fecha_anomalia not in serie.index:
+                continue
+            detalle = "<br>".join(
+                f"{'Volumen' if a['metrica'] == 'volumen' else 'Tasa de rechazo'}: "
+                f"{a['valor']} (esperado {a['esperado']}, z={a['z']})"
+                for a in anomalias_dia
             )
-        
-        show_graph3 = True
+            fig_tiempo.add_annotation(
+                x=fecha_anomalia, y=serie[fecha_anomalia],
+                text="⚠️", hovertext=detalle, showarrow=True, arrowhead=2,
+                arrowcolor="#FF6961", ax=0, ay=-30,
+            )
+        x_title = "Fecha"
+
+    fig_tiempo.update_layout(
+        height=450, margin=MARGINS, template="plotly_white",
+        title=f"📈 Evolucion Temporal ({intervalo_texto})", title_font_size=SUBPLOT_TITLE_SZ,
+        xaxis_title=x_title, yaxis_title="Numero de Casos",
+        font=dict(size=TICK_FONT_SIZE), showlegend=False,
+    )
+    return fig_tiempo
 
-# Grafico 4: Analistas
-show_graph4 = False
-if unicos_graf and "analista_riesgo" in df_filtered.columns and df_filtered["analista_riesgo"].notna().any():
+def grafico_analistas(df_filtered):
+    """Grafico 4: Operaciones por analista (None si no aplica)"""
+    if not (unicos_graf and "analista_riesgo" in df_filtered.columns and df_filtered["analista_riesgo"].notna().any()):
+        return None
     # Filtrar analistas conocidos (no "Desconocido")
     df_analistas = df_filtered[df_filtered["analista_riesgo"] != "Desconocido"]
-    if not df_analistas.empty:
-        df_a = df_analistas.groupby("analista_riesgo").size().reset_index(name="operaciones")
-        if not df_a.empty:
-            fig_analista = px.bar(
-                df_a, x="operaciones", y="analista_riesgo",
-                text="operaciones", orientation="h", template="plotly_white",
-            )
-            fig_analista.update_traces(textposition="outside", marker_color="#4169E1")
-            fig_analista.update_layout(
-                margin=MARGINS, font=dict(size=TICK_FONT_SIZE),
-                xaxis_title="", yaxis_title="",
+    if df_analistas.empty:
+        return None
+
+    df_a = df_analistas.groupby("analista_riesgo").size().reset_index(name="operaciones")
+    fig_analista = px.bar(
+        df_a, x="operaciones", y="analista_riesgo",
+        text="operaciones", orientation="h", template="plotly_white",
+        title="👥 Productividad por Analista",
+    )
+    fig_analista.update_traces(textposition="outside", marker_color="#4169E1")
+    fig_analista.update_layout(
+        height=450, margin=MARGINS, font=dict(size=TICK_FONT_SIZE),
+        title_font_size=SUBPLOT_TITLE_SZ, xaxis_title="", yaxis_title="",
+    )
+    fig_analista.update_yaxes(tickfont=dict(size=ANALYST_TICK_SIZE))
+    return fig_analista
+
+def mostrar_analisis_visual(df_filtered, tipo_consulta, intervalo_texto):
+    """Panel de graficos: cada grafico es independiente para poder re-ejecutarlo por separado"""
+    st.markdown("---")
+    st.markdown(f"## 📈 Analisis Visual - {intervalo_texto}")
+
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        st.plotly_chart(grafico_resoluciones(df_filtered), use_container_width=True)
+    with col2:
+        panel_torta(df_filtered)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.plotly_chart(grafico_evolucion(df_filtered, tipo_consulta, intervalo_texto), use_container_width=True)
+    with col2:
+        fig_analista = grafico_analistas(df_filtered)
+        if fig_analista is not None:
+            st.plotly_chart(fig_analista, use_container_width=True)
+        else:
+            st.info("⚠️ Operaciones por Analista: requiere filtro unico")
+
+# ------------------ Tiempos de respuesta (SLA) -------------------
+def mostrar_sla(resumen_rango, resumenes_rango, dia_inicio, dia_fin):
+    st.markdown("---")
+    st.markdown("## ⏱️ Tiempos de Respuesta (SLA)")
+
+    if resumen_rango.tiempo_respuesta.total == 0:
+        st.info("ℹ️ Sin tiempos de respuesta para el periodo seleccionado")
+        return
+
+    p50, p90, p99 = resumen_rango.tiempo_respuesta.cuantiles([0.5, 0.9, 0.99])
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("⏱️ p50", f"{p50:.0f} min", help="Mediana del tiempo entre ingreso y resolucion")
+    col2.metric("⏱️ p90", f"{p90:.0f} min")
+    col3.metric("⏱️ p99", f"{p99:.0f} min")
+
+    df_sla = pd.DataFrame(
+        [(dia, *resumen.tiempo_respuesta.cuantiles([0.5, 0.9, 0.99]))
+         for dia, resumen in sorted(resumenes_rango.items()) if resumen.tiempo_respuesta.total > 0],
+        columns=["Fecha", "p50", "p90", "p99"],
+    )
+    fig_sla = go.Figure()
+    for columna, color in [("p50", "#77DD77"), ("p90", "#FFB347"), ("p99", "#FF6961")]:
+        fig_sla.add_trace(go.Scatter(
+            x=df_sla["Fecha"], y=df_sla[columna],
+            mode="lines+markers", name=columna, line=dict(color=color, width=3),
+        ))
+    fig_sla.update_layout(
+        height=400, margin=MARGINS, template="plotly_white",
+        xaxis_title="Fecha", yaxis_title="Minutos",
+        font=dict(size=TICK_FONT_SIZE),
+    )
+    st.plotly_chart(fig_sla, use_container_width=True)
+
+    if resumenes["por_analista_dia"]:
+        digests_analista = {}
+        for (dia, analista), digest in resumenes["por_analista_dia"].items():
+            if dia_inicio <= dia <= dia_fin and analista != "Desconocido":
+                digests_analista.setdefault(analista, []).append(digest)
+
+        filas = []
+        for analista, digests in digests_analista.items():
+            fusion = TDigest.fusionar_todos(digests)
+            filas.append((analista, int(fusion.total), *fusion.cuantiles([0.5, 0.9, 0.99]).round(1)))
+
+        if filas:
+            st.dataframe(
+                pd.DataFrame(filas, columns=["Analista", "Casos", "p50 (min)", "p90 (min)", "p99 (min)"])
+                .sort_values("Casos", ascending=False),
+                use_container_width=True, hide_index=True
             )
-            show_graph4 = True
-else:
-    missing_graphs.append("Operaciones por Analista")
+    st.caption("Percentiles aproximados (t-digest) sobre las evaluaciones del periodo")
 
-# ------------------ Panel de graficos combinados -------------------
-st.markdown("---")
-st.markdown("## 📈 Analisis Visual")
-
-fig = make_subplots(
-    rows=2, cols=2,
-    specs=[[{"type": "xy"}, {"type": "domain"}],
-           [{"type": "xy"}, {"type": "xy"}]],
-    subplot_titles=(
-        f"📊 Resoluciones por Periodo (Total: {df_filtered.shape[0]})",
-        f"🥧 Distribucion en {selected_month}",
-        f"📈 Evolucion Temporal ({intervalo_texto})",
-        "👥 Productividad por Analista",
-    ),
-)
+# ------------------ Montos y financiamiento -------------------
+def mostrar_montos(resumen_rango, resumenes_rango):
+    st.markdown("---")
+    st.markdown("## 💰 Montos y Financiamiento")
+
+    if not resumen_rango.montos:
+        st.info("ℹ️ Sin montos para el periodo seleccionado")
+        return
 
-def add_warning(fig_obj, row, col, text):
-    fig_obj.add_annotation(
-        x=0.5, y=0.5, row=row, col=col,
-        text=f"⚠️ {text}", showarrow=False,
-        font=dict(size=16, color="red")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Distribucion de montos por resolucion (histogramas precalculados)
+        etiquetas_monto = [f"{int(b):,}".replace(",", ".") for b in BORDES_MONTO[:-1]]
+        fig_montos = go.Figure()
+        for resolucion in orden_categorias:
+            histograma = resumen_rango.montos.get(resolucion)
+            if histograma is None or histograma.total == 0:
+                continue
+            fig_montos.add_trace(go.Bar(
+                x=etiquetas_monto, y=histograma.conteos, name=resolucion,
+                marker_color=color_map.get(resolucion, "#CCCCCC"),
+            ))
+        fig_montos.update_layout(
+            barmode="stack", height=400, margin=MARGINS, template="plotly_white",
+            title="Distribucion de Montos por Resolucion",
+            xaxis_title="Monto solicitado (desde)", yaxis_title="Casos",
+            font=dict(size=TICK_FONT_SIZE),
+        )
+        st.plotly_chart(fig_montos, use_container_width=True)
+
+    with col2:
+        # Volumen aprobado por mes desde los resumenes diarios
+        volumen_mes = pd.Series(
+            {dia: resumen.monto_aprobado for dia, resumen in resumenes_rango.items()}
+        )
+        volumen_mes.index = pd.to_datetime(volumen_mes.index).to_period("M").astype(str)
+        volumen_mes = volumen_mes.groupby(level=0).sum()
+        fig_volumen = go.Figure(go.Bar(
+            x=volumen_mes.index, y=volumen_mes.values,
+            marker_color="#77DD77",
+            text=[f"{v:,.0f}".replace(",", ".") for v in volumen_mes.values],
+            textposition="outside",
+        ))
+        fig_volumen.update_layout(
+            height=400, margin=MARGINS, template="plotly_white",
+            title="Volumen Aprobado por Mes",
+            xaxis_title="Mes", yaxis_title="Monto aprobado",
+            font=dict(size=TICK_FONT_SIZE),
+        )
+        st.plotly_chart(fig_volumen, use_container_width=True)
+
+    # Ratio de financiamiento por resolucion
+    etiquetas_ratio = [f"{b:.0%}" for b in BORDES_RATIO[:-1]]
+    fig_ratio = go.Figure()
+    for resolucion in orden_categorias:
+        histograma = resumen_rango.ratios.get(resolucion)
+        if histograma is None or histograma.total == 0:
+            continue
+        fig_ratio.add_trace(go.Bar(
+            x=etiquetas_ratio, y=histograma.conteos, name=resolucion,
+            marker_color=color_map.get(resolucion, "#CCCCCC"),
+        ))
+    fig_ratio.update_layout(
+        barmode="stack", height=350, margin=MARGINS, template="plotly_white",
+        title="Ratio de Financiamiento por Resolucion",
+        xaxis_title="Ratio (desde)", yaxis_title="Casos",
+        font=dict(size=TICK_FONT_SIZE),
     )
+    st.plotly_chart(fig_ratio, use_container_width=True)
+    st.caption("Histogramas precalculados por dia en cada refresco; el ultimo intervalo incluye montos mayores")
 
-# Agregar graficos al subplot
-if show_graph1:
-    for t in fig_bar.data:
-        fig.add_trace(t, row=1, col=1)
-    fig.update_xaxes(title_text="Periodo", row=1, col=1)
-    fig.update_yaxes(title_text="Porcentaje (%)", row=1, col=1)
-else:
-    add_warning(fig, 1, 1, "Sin datos suficientes")
+# ------------------ Trayectoria de clientes -------------------
+def mostrar_trayectoria(dia_inicio, dia_fin):
+    st.markdown("---")
+    st.markdown("## 🔁 Trayectoria de Clientes")
 
-if show_graph2:
-    fig.add_trace(pie_trace, row=1, col=2)
-else:
-    add_warning(fig, 1, 2, "Sin datos para el mes")
-
-if show_graph3:
-    fig.add_trace(bar_trace, row=2, col=1)
-    if trend_trace is not None:
-        fig.add_trace(trend_trace, row=2, col=1)
-    
-    x_title = "Hora" if tipo_consulta == "📅 Dia especifico" else "Fecha"
-    fig.update_xaxes(title_text=x_title, row=2, col=1)
-    fig.update_yaxes(title_text="Numero de Casos", row=2, col=1)
-else:
-    add_warning(fig, 2, 1, "Sin datos temporales")
+    if historial is None or historial["transiciones"].empty:
+        st.info("ℹ️ Historial de clientes no disponible")
+        return
 
-if show_graph4:
-    for t in fig_analista.data:
-        fig.add_trace(t, row=2, col=2)
-    fig.update_yaxes(tickfont=dict(size=ANALYST_TICK_SIZE), row=2, col=2)
-else:
-    add_warning(fig, 2, 2, "Requiere filtro unico")
-
-# Layout final
-fig.update_layout(
-    height=900, margin=MARGINS,
-    title_text=f"📊 Dashboard de Evaluaciones - {intervalo_texto}",
-    title_font_size=MAIN_TITLE_SIZE,
-    font=dict(size=TICK_FONT_SIZE),
-    showlegend=False, template="plotly_white",
-)
+    transiciones = historial["transiciones"]
+    transiciones = transiciones[transiciones["mes"].between(clave_mes(dia_inicio), clave_mes(dia_fin))]
 
-st.plotly_chart(fig, use_container_width=True)
+    if not transiciones.empty:
+        matriz = transiciones.pivot_table(
+            index="desde", columns="hacia", values="cantidad", aggfunc="sum", fill_value=0, observed=True
+        )
+        orden = [c for c in orden_categorias if c in matriz.index.union(matriz.columns)]
+        matriz = matriz.reindex(index=orden, columns=orden, fill_value=0)
+        porcentajes = matriz.div(matriz.sum(axis=1).replace(0, np.nan), axis=0) * 100
+
+        fig_trans = go.Figure(go.Heatmap(
+            z=porcentajes.values, x=porcentajes.columns, y=porcentajes.index,
+            colorscale="Blues", zmin=0, zmax=100,
+            text=matriz.values, texttemplate="%{text}",
+            hovertemplate="%{y} → %{x}<br>%{z:.1f}% (%{text} casos)<extra></extra>",
+        ))
+        fig_trans.update_layout(
+            height=450, margin=MARGINS, template="plotly_white",
+            title="Resolucion siguiente segun resolucion anterior (mismo RUT)",
+            xaxis_title="Resolucion siguiente", yaxis_title="Resolucion anterior",
+            font=dict(size=TICK_FONT_SIZE),
+        )
+        st.plotly_chart(fig_trans, use_container_width=True)
+        st.caption(f"{int(matriz.values.sum())} reingresos con evaluacion siguiente en el periodo; porcentajes por fila")
+    else:
+        st.info("ℹ️ Sin reingresos de clientes en el periodo seleccionado")
 
-# ------------------ Informacion adicional -------------------
-if missing_graphs:
-    st.info(f"ℹ️ Graficos no disponibles: {', '.join(missing_graphs)}")
+    panel_trayectoria_rut()
 
-if not df_filtered.empty:
-    fecha_inicio = df_filtered["fecha_creacion"].min().strftime("%Y-%m-%d")
-    st.success(f"📅 Datos disponibles desde: **{fecha_inicio}**")
+@st.fragment
+def panel_trayectoria_rut():
+    """Busqueda de un RUT en el historial (no depende del periodo)"""
+    with medir_fragmento("trayectoria_rut"):
+        rut_historial = st.text_input(
+            "Ver trayectoria de un RUT (ej. 12345678-9)", key="rut_historial",
+            on_change=registrar_control, args=("rut_historial",)
+        )
+        if not rut_historial:
+            return
+
+        evaluaciones_rut = historial_rut(historial, rut_historial)
+        if evaluaciones_rut.empty:
+            st.info("ℹ️ El RUT no tiene evaluaciones en los datos actuales")
+        else:
+            columnas = [c for c in ["fecha_creacion", "resolucion_riesgo", "status", "monto_credito",
+                                    "analista_riesgo", "manualEvaluationId"] if c in evaluaciones_rut.columns]
+            st.dataframe(evaluaciones_rut[columnas], use_container_width=True, hide_index=True)
+
+# ------------------ Consultas analiticas -------------------
+@st.fragment
+def panel_consultas(start_datetime, end_datetime):
+    """Consultas declaradas sobre el almacen local (limites del periodo en UTC)"""
+    with medir_fragmento("consultas"):
+        with st.expander("🔎 Consultas analiticas sobre el historico local"):
+            nombres_consultas = list(motor_consultas.CONSULTAS)
+            consulta = st.selectbox(
+                "Consulta",
+                nombres_consultas,
+                format_func=lambda n: motor_consultas.CONSULTAS[n][0],
+                key="consulta_analitica", on_change=registrar_control, args=("consulta_analitica",)
+            )
+
+            if consulta == "historial_rut":
+                rut_consulta = st.text_input(
+                    "RUT (ej. 12345678-9)", key="rut_consulta",
+                    on_change=registrar_control, args=("rut_consulta",)
+                )
+                df_consulta = (
+                    motor_consultas.ejecutar_consulta(consulta, rut=rut_consulta.strip())
+                    if rut_consulta else pd.DataFrame()
+                )
+            elif consulta == "traspaso_por_mes":
+                df_consulta = motor_consultas.ejecutar_consulta(consulta)
+            elif consulta == "aprobacion_por_analista":
+                df_consulta = motor_consultas.ejecutar_consulta(
+                    consulta, desde=start_datetime, hasta=end_datetime, aprobada=RESOLUCION_APROBADA
+                )
+            else:
+                df_consulta = motor_consultas.ejecutar_consulta(
+                    consulta, desde=start_datetime, hasta=end_datetime
+                )
+
+            if df_consulta.empty:
+                st.info("ℹ️ Sin resultados para la consulta seleccionada")
+            else:
+                st.dataframe(df_consulta, use_container_width=True)
+
+# ------------------ Panel del periodo -------------------
+@st.fragment
+def panel_periodo():
+    """
+    Todo lo que depende del periodo seleccionado. Cambiar las fechas o el tipo
+    de consulta re-ejecuta solo este fragmento (los datos ya están cargados).
+    """
+    with medir_fragmento("periodo"):
+        periodo = seleccionar_periodo()
+        if periodo is None:
+            return
+        dia_inicio, dia_fin, tipo_consulta, intervalo_texto = periodo
+
+        # Filtro por claves de dia local precalculadas al ingerir
+        df_filtered = df_graf[df_graf["dia_local"].between(clave_dia(dia_inicio), clave_dia(dia_fin))]
+        if df_filtered.empty:
+            st.warning("⚠️ No hay datos para el periodo seleccionado")
+            return
+
+        # Limites del periodo en UTC para consultas sobre el almacen local
+        start_datetime = pd.Timestamp(dia_inicio).tz_localize(ZONA_HORARIA, nonexistent="shift_forward").tz_convert("UTC")
+        end_datetime = (pd.Timestamp(dia_fin) + pd.Timedelta(days=1)).tz_localize(ZONA_HORARIA, nonexistent="shift_forward").tz_convert("UTC")
+
+        resumenes_rango = {
+            dia: resumen for dia, resumen in resumenes["por_dia"].items()
+            if dia_inicio <= dia <= dia_fin
+        }
+        resumen_rango = ResumenDiario.fusionar_todos(resumenes_rango.values())
+
+        mostrar_metricas(resumen_rango)
+        mostrar_analisis_visual(df_filtered, tipo_consulta, intervalo_texto)
+        mostrar_sla(resumen_rango, resumenes_rango, dia_inicio, dia_fin)
+        mostrar_montos(resumen_rango, resumenes_rango)
+        mostrar_trayectoria(dia_inicio, dia_fin)
+
+        if motor_consultas.disponible():
+            panel_consultas(start_datetime, end_datetime)
+
+        fecha_inicio = df_filtered["fecha_creacion"].min().strftime("%Y-%m-%d")
+        st.success(f"📅 Datos disponibles desde: **{fecha_inicio}**")
+
+# ------------------ Auditoria historica -------------------
+@st.fragment
+def panel_auditoria():
+    """Estado de las evaluaciones a una fecha, desde los snapshots (independiente del periodo)"""
+    with medir_fragmento("auditoria"):
+        snapshots_disponibles = almacen_snapshots.listar_snapshots()
+        if snapshots_disponibles.empty:
+            return
+
+        with st.expander("🕰️ Auditoria: estado de las evaluaciones a una fecha"):
+            primera = pd.to_datetime(snapshots_disponibles["fecha"].min()).date()
+            fecha_auditoria = st.date_input(
+                "📅 Estado vigente al",
+                value=date.today(),
+                min_value=primera,
+                key="fecha_auditoria",
+                help="Se responde desde los snapshots diarios almacenados, sin descargar archivos antiguos",
+                on_change=registrar_control, args=("fecha_auditoria",)
+            )
+            df_estado = almacen_snapshots.estado_a_fecha(fecha_auditoria.strftime("%Y-%m-%d"))
+            if not df_estado.empty:
+                df_estado = procesar_datos_manual_evaluation(df_estado)
+
+            if df_estado.empty:
+                st.info("ℹ️ No hay snapshots almacenados para esa fecha")
+            else:
+                mezcla = df_estado["resolucion_riesgo"].value_counts().rename_axis("resolucion_riesgo")
+                mezcla = mezcla[mezcla > 0]
+                st.dataframe(
+                    pd.DataFrame({
+                        "cantidad": mezcla,
+                        "porcentaje": (mezcla / mezcla.sum() * 100).round(1),
+                    }),
+                    use_container_width=True
+                )
+
+# ------------------ Filtrado en el navegador -------------------
+def mostrar_vista_cliente():
+    """Componente HTML que filtra y re-agrega en el navegador; False si no hay matriz precalculada"""
+    matriz = resumenes.get("matriz_diaria")
+    if not matriz or not matriz["dias"]:
+        return False
+    components.html(
+        vista_cliente.generar_html(matriz, color_map, RESOLUCION_APROBADA),
+        height=vista_cliente.ALTURA_COMPONENTE, scrolling=False,
+    )
+    st.caption("Filtrado en el navegador: SLA, montos, trayectorias y consultas requieren desactivar este modo")
+    return True
+
+if not (modo_cliente and mostrar_vista_cliente()):
+    panel_periodo()
+panel_auditoria()
 
 # ------------------ Footer -------------------
 st.markdown("---")
@@ -446,3 +767,8 @@ st.markdown(
     "</div>",
     unsafe_allow_html=True
 )
+
+logger.info("rerun", extra={
+    "etapa": "rerun", "ambito": "pagina", "control": control_pagina,
+    "duracion_s": round(perf_counter() - inicio_pagina, 3),
+})
@@ -4,14 +4,59 @@ Maneja la descarga, actualización y procesamiento de datos desde Google Drive
 """
 
 import pandas as pd
+import numpy as np
 import os
 from datetime import date, datetime, time
-from funciones_google import login, listar_archivos_carpeta, bajar_archivo_por_id
+from funciones_google import listar_archivos_carpeta, bajar_archivo_por_id, escritura_atomica, leer_csv_drive
+import cache_datos
+import almacen_snapshots
+import motor_consultas
+import detector_anomalias
+from resumenes_probabilisticos import (
+    TDigest, ResumenDiario, HistogramaFijo, BORDES_MONTO, BORDES_RATIO
+)
+from registro import obtener_logger, medir
+
+logger = obtener_logger("data_manager")
 
 # Configuración de IDs
 ID_CARPETA_RAIZ = "1KRTHc_bOSF4WxX_RIXVpa2_kaypxMMYP"
 ID_CARPETA_ACTUALIZADOS = "1H--_ASpw__9OTnUG1bDfGZ22zRlUpMdF"
 RUTA_TEMP = "temp_archives"
+ESPACIO_CACHE = "datos_principales"
+FORMATO_CACHE = 6  # Subir al cambiar columnas o resúmenes cacheados
+
+# Zona horaria de los usuarios para días, horas, meses y semanas del dashboard
+ZONA_HORARIA = os.environ.get("DASHBOARD_ZONA_HORARIA", "America/Santiago")
+
+# Resoluciones canónicas (orden de leyendas y categorías de resolucion_riesgo)
+RESOLUCIONES = ["Aprobado", "Aprobado con propuesta", "Devuelto a comercial", "Rechazado", "Desconocido"]
+RESOLUCION_APROBADA = "Aprobado"
+RESOLUCION_RECHAZADA = "Rechazado"
+
+# Variantes de escritura de la exportación -> resolución canónica (claves en minúsculas)
+ALIAS_RESOLUCION = {
+    "aprobado": "Aprobado",
+    "100% aprobado": "Aprobado",
+    "aprobado con propuesta": "Aprobado con propuesta",
+    "devuelto a comercial": "Devuelto a comercial",
+    "devuelto comercial": "Devuelto a comercial",
+    "rechazado": "Rechazado",
+    "desconocido": "Desconocido",
+}
+
+# Resolución implícita por status cuando la exportación no la trae ("0" o vacía)
+RESOLUCION_POR_STATUS = {
+    "RETURNED_DUE_TO_RISK": "Devuelto a comercial",
+    "REFUSED": "Rechazado",
+}
+
+# Columnas de la evaluación tras renombrar: requeridas y opcionales (exportación cruda)
+COLUMNAS_REQUERIDAS = ["rut", "resolucion_riesgo", "fecha_creacion", "status", "manualEvaluationId"]
+COLUMNAS_OPCIONALES = ["fecha_evaluacion", "monto_credito", "ratio_financiamiento"]
+
+# Archivos fuente ya resueltos, indexados por versión
+_fuentes_resueltas = {}
 
 # IDs de Google Sheets para analistas
 SHEET_ID_ANALISTAS_1 = '1rmSOvyghKM5WpDESHOEnRvVAgtMhELnjys6V9cZ9MG0'
@@ -68,7 +113,7 @@ def obtener_archivo_mas_reciente():
         return carp_mes.iloc[0]
         
     except Exception as e:
-        print(f"Error al obtener archivo más reciente: {e}")
+        logger.error("Error al obtener archivo más reciente: %s", e)
         return None
 
 def verificar_necesidad_actualizacion():
@@ -100,22 +145,16 @@ def verificar_necesidad_actualizacion():
         return True, None
         
     except Exception as e:
-        print(f"Error al verificar necesidad de actualización: {e}")
+        logger.error("Error al verificar necesidad de actualización: %s", e)
         return True, None
 
-def cargar_google_sheet_analistas(sheet_id, ruta_descarga="."):
-    """Carga un Google Sheet específico con datos de analistas"""
+def cargar_google_sheet_analistas(sheet_id):
+    """Carga un Google Sheet específico con datos de analistas (en memoria, sin archivos temporales)"""
     try:
-        drive = login()
-        archivo = drive.CreateFile({'id': sheet_id})
-        
-        ruta_archivo = os.path.join(ruta_descarga, f'analistas_{sheet_id}.csv')
-        archivo.GetContentFile(ruta_archivo, mimetype='text/csv')
-        
-        df = pd.read_csv(ruta_archivo)
+        df, _ = leer_csv_drive(sheet_id)
         return df
     except Exception as e:
-        print(f"Error al cargar Google Sheet {sheet_id}: {e}")
+        logger.error("Error al cargar Google Sheet %s: %s", sheet_id, e)
         return pd.DataFrame()
 
 def obtener_datos_analistas():
@@ -160,15 +199,80 @@ def obtener_datos_analistas():
         return df[["rut", "analista_riesgo"]]
         
     except Exception as e:
-        print(f"Error al obtener datos de analistas: {e}")
+        logger.error("Error al obtener datos de analistas: %s", e)
         return pd.DataFrame()
 
+def clave_dia(fecha):
+    """Clave entera AAAAMMDD de una fecha"""
+    return fecha.year * 10000 + fecha.month * 100 + fecha.day
+
+def fecha_de_clave(clave):
+    """Fecha correspondiente a una clave AAAAMMDD"""
+    return date(clave // 10000, clave // 100 % 100, clave % 100)
+
+def clave_mes(fecha):
+    """Clave entera AAAAMM de una fecha"""
+    return fecha.year * 100 + fecha.month
+
+def etiqueta_mes(clave):
+    """Texto AAAA-MM de una clave de mes"""
+    return f"{clave // 100}-{clave % 100:02d}"
+
+def agregar_calendario_local(df, columna="fecha_creacion", zona=ZONA_HORARIA):
+    """
+    Materializa columnas de calendario en hora local como claves enteras:
+    dia_local (AAAAMMDD), hora_local (0-23), mes_local (AAAAMM) y
+    semana_iso (AAAASS, año ISO). Las fechas nulas quedan con clave 0.
+    """
+    local = df[columna].dt.tz_convert(zona)
+    validas = local.notna()
+    iso = local.dt.isocalendar()
+    
+    df["dia_local"] = (local.dt.year * 10000 + local.dt.month * 100 + local.dt.day).where(validas, 0).astype("int32")
+    df["hora_local"] = local.dt.hour.where(validas, 0).astype("int8")
+    df["mes_local"] = (local.dt.year * 100 + local.dt.month).where(validas, 0).astype("int32")
+    df["semana_iso"] = (iso["year"].astype("float") * 100 + iso["week"].astype("float")).where(validas, 0).astype("int32")
+    return df
+
+def _resolucion_canonica(status, resolucion):
+    """Regla de normalización para un par (status, resolución cruda)"""
+    texto = "" if pd.isna(resolucion) else str(resolucion).strip()
+    if texto in ("", "0", "nan"):
+        return RESOLUCION_POR_STATUS.get(status, "Desconocido")
+    return ALIAS_RESOLUCION.get(texto.lower(), "Desconocido")
+
+def normalizar_resoluciones(status, resoluciones):
+    """
+    Resolución canónica por fila como Categorical de RESOLUCIONES.
+    La regla se evalúa una vez por combinación distinta (status, resolución)
+    y se aplica a todas las filas indexando la tabla de códigos resultante.
+    Retorna (status en mayúsculas, resoluciones canónicas).
+    """
+    codigos_status, status_unicos = pd.factorize(status, use_na_sentinel=False)
+    codigos_resolucion, resoluciones_unicas = pd.factorize(resoluciones, use_na_sentinel=False)
+    status_unicos = np.array([str(s).upper() for s in status_unicos], dtype=object)
+    
+    posicion = {nombre: i for i, nombre in enumerate(RESOLUCIONES)}
+    tabla = np.array([
+        [posicion[_resolucion_canonica(s, r)] for r in resoluciones_unicas]
+        for s in status_unicos
+    ], dtype=np.int8).reshape(len(status_unicos), len(resoluciones_unicas))
+    
+    canonicas = pd.Categorical.from_codes(
+        tabla[codigos_status, codigos_resolucion], categories=RESOLUCIONES
+    )
+    return status_unicos[codigos_status], canonicas
+
 def procesar_datos_manual_evaluation(archivo_path):
     """
-    Procesa el archivo manual_evaluation descargado y aplica transformaciones
+    Procesa el archivo manual_evaluation descargado y aplica transformaciones.
+    Acepta la ruta del CSV o la exportación cruda ya leída como DataFrame.
     """
     try:
-        df = pd.read_csv(archivo_path)
+        if isinstance(archivo_path, pd.DataFrame):
+            df = archivo_path
+        else:
+            df = pd.read_csv(archivo_path)
         
         # Filtrar por status
         df = df[~df["status"].isin(["FINISHED", "CREATED"])]
@@ -177,31 +281,42 @@ def procesar_datos_manual_evaluation(archivo_path):
         df = df.rename(columns={
             "idNumber": "rut",
             "resolution": "resolucion_riesgo",
-            "manualEvaluationUpdatedDate": "fecha_creacion"
+            "manualEvaluationDate": "fecha_evaluacion",
+            "manualEvaluationUpdatedDate": "fecha_creacion",
+            "creditAmount": "monto_credito",
+            "finantialRatio": "ratio_financiamiento"
         })
         
-        # Seleccionar columnas necesarias
-        df = df[["rut", "resolucion_riesgo", "fecha_creacion", "status", "manualEvaluationId"]]
+        # Seleccionar columnas necesarias; las opcionales no vienen en el archivo
+        # ya procesado (manual_evaluations_AAAA-MM-DD.csv) y quedan en NaN
+        df = df[COLUMNAS_REQUERIDAS].join(df.reindex(columns=COLUMNAS_OPCIONALES))
         
-        # Procesar resoluciones según status
-        df["resolucion_riesgo"] = df["resolucion_riesgo"].astype(str)
-        df["status"] = df["status"].astype(str).str.upper()
+        # Resolución canónica según (status, resolución cruda)
+        status, resoluciones = normalizar_resoluciones(df["status"].to_numpy(), df["resolucion_riesgo"].to_numpy())
+        df["status"] = status
+        df["resolucion_riesgo"] = pd.Series(resoluciones, index=df.index)
         
-        # Aplicar lógica de transformación
-        mask_zero = df["resolucion_riesgo"] == "0"
-        mask_ret = df["status"] == "RETURNED_DUE_TO_RISK"
-        mask_ref = df["status"] == "REFUSED"
+        # Procesar fechas manteniendo UTC (ISO8601: el archivo procesado omite
+        # la fracción de segundo cuando es cero)
+        df["fecha_creacion"] = pd.to_datetime(df["fecha_creacion"], errors="coerce", utc=True, format="ISO8601")
+        df["fecha_evaluacion"] = pd.to_datetime(df["fecha_evaluacion"], errors="coerce", utc=True, format="ISO8601")
         
-        df.loc[mask_zero & mask_ret, "resolucion_riesgo"] = "Devuelto a comercial"
-        df.loc[mask_zero & mask_ref, "resolucion_riesgo"] = "Rechazado"
-        df.loc[mask_zero & ~mask_ret & ~mask_ref, "resolucion_riesgo"] = "Desconocido"
-          # Procesar fechas manteniendo UTC
-        df["fecha_creacion"] = pd.to_datetime(df["fecha_creacion"], errors="coerce", utc=True)
+        # Montos y ratio de financiamiento
+        df["monto_credito"] = pd.to_numeric(df["monto_credito"], errors="coerce")
+        df["ratio_financiamiento"] = pd.to_numeric(df["ratio_financiamiento"], errors="coerce")
+        
+        # Tiempo de respuesta (SLA): desde el ingreso a evaluación manual hasta la resolución
+        df["tiempo_respuesta_min"] = (
+            (df["fecha_creacion"] - df["fecha_evaluacion"]).dt.total_seconds() / 60
+        )
+        
+        # Calendario local precalculado para filtros y agrupaciones
+        agregar_calendario_local(df)
         
         return df
         
     except Exception as e:
-        print(f"Error al procesar datos manual evaluation: {e}")
+        logger.error("Error al procesar datos manual evaluation: %s", e)
         return pd.DataFrame()
 
 def guardar_archivo_actualizado(df, carpeta_id):
@@ -214,8 +329,9 @@ def guardar_archivo_actualizado(df, carpeta_id):
         # Crear directorio si no existe
         os.makedirs(RUTA_TEMP, exist_ok=True)
         
-        # Guardar archivo localmente
-        df.to_csv(ruta_local, index=False)
+        # Guardar archivo localmente (escritura atómica)
+        with escritura_atomica(ruta_local) as ruta_temporal:
+            df.to_csv(ruta_temporal, index=False)
         
         # Subir a Drive (esto requeriría implementar función de subida en funciones_google)
         # Por ahora solo guardamos localmente
@@ -223,7 +339,7 @@ def guardar_archivo_actualizado(df, carpeta_id):
         return ruta_local
         
     except Exception as e:
-        print(f"Error al guardar archivo actualizado: {e}")
+        logger.error("Error al guardar archivo actualizado: %s", e)
         return None
 
 def agregar_datos_analistas(df_graf, incluir_analistas=False):
@@ -242,6 +358,8 @@ def agregar_datos_analistas(df_graf, incluir_analistas=False):
             df_graf["analista_riesgo"] = "Desconocido"
             return df_graf
         
+        motor_consultas.registrar_tabla("analistas", df_analistas)
+        
         # Asegurar tipos de datos
         df_graf["rut"] = df_graf["rut"].astype(str)
         df_analistas["rut"] = df_analistas["rut"].astype(str)
@@ -259,58 +377,367 @@ def agregar_datos_analistas(df_graf, incluir_analistas=False):
         return df_graf
         
     except Exception as e:
-        print(f"Error al agregar datos de analistas: {e}")
+        logger.error("Error al agregar datos de analistas: %s", e)
         df_graf["analista_riesgo"] = "Desconocido"
         return df_graf
 
-def obtener_datos_principales(incluir_analistas=False):
+def resolver_archivo_fuente():
     """
-    Función principal que gestiona todo el flujo de obtención de datos
+    Determina qué archivo de Drive alimenta el dashboard.
+    Retorna (archivo, necesita_actualizacion) consultando solo metadatos.
     """
+    # Verificar si necesita actualización
+    necesita_actualizacion, archivo_existente = verificar_necesidad_actualizacion()
+    
+    if not necesita_actualizacion and archivo_existente is not None:
+        return archivo_existente, False
+    
+    # Obtener archivo más reciente
+    archivo_reciente = obtener_archivo_mas_reciente()
+    
+    if archivo_reciente is None:
+        raise ValueError("No se pudo obtener archivo más reciente")
+    
+    return archivo_reciente, True
+
+def obtener_version_fuente():
+    """Versión del archivo fuente actual: ID + fecha de creación en Drive"""
     try:
-        # Crear directorio temporal si no existe
-        os.makedirs(RUTA_TEMP, exist_ok=True)
-        
-        # Verificar si necesita actualización
-        necesita_actualizacion, archivo_existente = verificar_necesidad_actualizacion()
-        
-        if not necesita_actualizacion and archivo_existente is not None:
-            # Usar archivo existente del día
-            ruta_archivo = os.path.join(RUTA_TEMP, f"cached_{archivo_existente['Nombre']}")
-            
-            # Si no existe localmente, descargarlo
-            if not os.path.exists(ruta_archivo):
-                ruta_archivo = bajar_archivo_por_id(archivo_existente["ID"], RUTA_TEMP)
-            
-        else:
-            # Obtener archivo más reciente y descargarlo
-            archivo_reciente = obtener_archivo_mas_reciente()
-            
-            if archivo_reciente is None:
-                raise ValueError("No se pudo obtener archivo más reciente")
-            
-            ruta_archivo = bajar_archivo_por_id(archivo_reciente["ID"], RUTA_TEMP)
-        
-        # Procesar datos
-        df_graf = procesar_datos_manual_evaluation(ruta_archivo)
-        
-        if df_graf.empty:
-            raise ValueError("No se pudieron procesar los datos")
-        
-        # Agregar datos de analistas si es necesario
-        df_graf = agregar_datos_analistas(df_graf, incluir_analistas)
+        archivo, necesita_actualizacion = resolver_archivo_fuente()
+        version = f"{archivo['ID']}@{archivo['Fecha Creación']}"
+        # Recordar el archivo resuelto para no volver a listar carpetas al descargar
+        _fuentes_resueltas[version] = (archivo, necesita_actualizacion)
+        return version
+    except Exception as e:
+        logger.error("Error al obtener versión de la fuente: %s", e)
+        return None
+
+def descargar_archivo_fuente(archivo):
+    """
+    Descarga el archivo fuente a RUTA_TEMP. Las descargas concurrentes del
+    mismo ID se unifican: una sesión descarga y las demás esperan su resultado.
+    """
+    return cache_datos.ejecutar_una_vez(
+        ("descarga", archivo["ID"]),
+        lambda: bajar_archivo_por_id(archivo["ID"], RUTA_TEMP)
+    )
+
+def archivar_exportacion(ruta_archivo, archivo):
+    """
+    Guarda la exportación cruda en el almacén de snapshots (base + delta),
+    aplica la retención y elimina el CSV completo de RUTA_TEMP
+    """
+    try:
+        fecha = almacen_snapshots.fecha_de_exportacion(archivo["Nombre"])
+        if fecha is None:
+            fecha = pd.to_datetime(archivo["Fecha Creación"], utc=True).strftime("%Y-%m-%d")
         
-        # Si fue necesaria actualización, guardar archivo
-        if necesita_actualizacion:
-            guardar_archivo_actualizado(df_graf, ID_CARPETA_ACTUALIZADOS)
+        if os.path.exists(ruta_archivo):
+            almacen_snapshots.guardar_snapshot(fecha, ruta_archivo)
+            os.remove(ruta_archivo)
+        almacen_snapshots.aplicar_retencion()
         
+    except Exception as e:
+        logger.error("Error al archivar exportación en snapshots: %s", e)
+
+def cargar_exportacion(archivo):
+    """
+    Descarga la exportación cruda del mes, la archiva como snapshot y la
+    retorna como DataFrame. Se ejecuta una vez por ID aunque varias
+    sesiones la pidan a la vez; el DataFrame retornado es de solo lectura.
+    """
+    def descargar():
+        ruta_archivo = bajar_archivo_por_id(archivo["ID"], RUTA_TEMP)
+        if ruta_archivo is None:
+            raise ValueError(f"No se pudo descargar el archivo {archivo['ID']}")
+        
+        df_crudo = pd.read_csv(ruta_archivo)
+        archivar_exportacion(ruta_archivo, archivo)
+        return df_crudo
+    
+    return cache_datos.ejecutar_una_vez(("exportacion", archivo["ID"]), descargar)
+
+def descargar_y_procesar(archivo, necesita_actualizacion, incluir_analistas=False):
+    """Descarga el archivo fuente indicado y aplica todas las transformaciones"""
+    # Crear directorio temporal si no existe
+    os.makedirs(RUTA_TEMP, exist_ok=True)
+    
+    if not necesita_actualizacion:
+        # Usar archivo existente del día
+        origen = os.path.join(RUTA_TEMP, f"cached_{archivo['Nombre']}")
+        
+        # Si no existe localmente, descargarlo
+        if not os.path.exists(origen):
+            origen = descargar_archivo_fuente(archivo)
+    else:
+        # Exportación cruda: se lee en memoria y se archiva como snapshot
+        origen = cargar_exportacion(archivo)
+    
+    # Procesar datos
+    df_graf = procesar_datos_manual_evaluation(origen)
+    
+    if df_graf.empty:
+        raise ValueError("No se pudieron procesar los datos")
+    
+    # Mantener el almacén analítico local al día (upsert por manualEvaluationId)
+    motor_consultas.actualizar_evaluaciones(df_graf)
+    
+    # Agregar datos de analistas si es necesario
+    df_graf = agregar_datos_analistas(df_graf, incluir_analistas)
+    
+    # Si fue necesaria actualización, guardar archivo
+    if necesita_actualizacion:
+        guardar_archivo_actualizado(df_graf, ID_CARPETA_ACTUALIZADOS)
+    
+    return df_graf
+
+def deduplicar_por_rut(df_graf):
+    """Mantiene solo la resolución más reciente por RUT (estado actual del cliente)"""
+    return (
+        df_graf.sort_values("fecha_creacion", ascending=False)
+        .drop_duplicates("rut", keep="first")
+        .reset_index(drop=True)
+    )
+
+def calcular_resumenes(df_graf):
+    """
+    Construye los resúmenes fusionables del refresco:
+    - por_dia: ResumenDiario (conteos, HLL de RUTs/analistas, t-digest de tiempos,
+      histogramas de monto y ratio por resolución, monto aprobado)
+    - por_analista_dia: t-digest de tiempo de respuesta por (día, analista)
+    - matriz_diaria: conteos día × resolución y día × hora (ver calcular_matriz_diaria)
+    Cualquier rango de fechas se resuelve fusionando los resúmenes de sus días.
+    """
+    datos = df_graf.dropna(subset=["fecha_creacion"])
+    dias = datos["dia_local"]
+    aprobado = datos["resolucion_riesgo"] == RESOLUCION_APROBADA
+    con_analista = (
+        "analista_riesgo" in datos.columns
+        and not datos["analista_riesgo"].isin(["N/A", "Desconocido"]).all()
+    )
+    
+    por_dia = {}
+    for clave, grupo in datos.groupby(dias):
+        dia = fecha_de_clave(clave)
+        resumen = ResumenDiario()
+        resumen.casos = len(grupo)
+        resumen.aprobados = int(aprobado.loc[grupo.index].sum())
+        resumen.rechazados = int((grupo["resolucion_riesgo"] == RESOLUCION_RECHAZADA).sum())
+        resumen.primera = grupo["fecha_creacion"].min()
+        resumen.ultima = grupo["fecha_creacion"].max()
+        resumen.ruts.agregar(grupo["rut"].to_numpy())
+        if con_analista:
+            conocidos = grupo["analista_riesgo"]
+            resumen.analistas.agregar(conocidos[conocidos != "Desconocido"].to_numpy())
+        resumen.tiempo_respuesta.agregar(grupo["tiempo_respuesta_min"].to_numpy())
+        resumen.monto_aprobado = float(grupo.loc[aprobado.loc[grupo.index], "monto_credito"].sum())
+        for resolucion, por_resolucion in grupo.groupby("resolucion_riesgo", observed=True):
+            # Sin montos/ratios (archivo ya procesado) no se crea histograma
+            montos = por_resolucion["monto_credito"].dropna().to_numpy()
+            if len(montos):
+                resumen.montos[resolucion] = HistogramaFijo.desde_valores(montos, BORDES_MONTO)
+            ratios = por_resolucion["ratio_financiamiento"].dropna().to_numpy()
+            if len(ratios):
+                resumen.ratios[resolucion] = HistogramaFijo.desde_valores(ratios, BORDES_RATIO)
+        por_dia[dia] = resumen
+    
+    por_analista_dia = {}
+    if con_analista:
+        tiempos = datos["tiempo_respuesta_min"]
+        por_analista_dia = {
+            (fecha_de_clave(dia), analista): TDigest.desde_valores(grupo.to_numpy())
+            for (dia, analista), grupo in tiempos.groupby([dias, datos["analista_riesgo"]])
+        }
+    
+    return {
+        "por_dia": por_dia,
+        "por_analista_dia": por_analista_dia,
+        "matriz_diaria": calcular_matriz_diaria(datos),
+    }
+
+def calcular_matriz_diaria(df_graf):
+    """
+    Carga compacta para filtrar en el navegador (unos pocos KB):
+    - dias: claves AAAAMMDD de los días con casos, en orden
+    - conteos: por día, casos de cada resolución en el orden de RESOLUCIONES
+    - horas: por día, casos de cada hora local (0-23)
+    """
+    datos = df_graf[df_graf["dia_local"] > 0]
+    conteos = (
+        datos.groupby(["dia_local", "resolucion_riesgo"], observed=True).size()
+        .unstack(fill_value=0)
+        .reindex(columns=RESOLUCIONES, fill_value=0)
+        .sort_index()
+    )
+    horas = (
+        datos.groupby(["dia_local", "hora_local"]).size()
+        .unstack(fill_value=0)
+        .reindex(index=conteos.index, columns=range(24), fill_value=0)
+    )
+    return {
+        "dias": [int(dia) for dia in conteos.index],
+        "resoluciones": list(RESOLUCIONES),
+        "conteos": conteos.to_numpy(dtype=int).tolist(),
+        "horas": horas.to_numpy(dtype=int).tolist(),
+    }
+
+def calcular_historial(df_graf):
+    """
+    Índice de historial por RUT para análisis de reingresos:
+    - datos: evaluaciones ordenadas por (rut, fecha_creacion)
+    - posiciones: rut -> (inicio, fin) con las filas del cliente en `datos`
+    - transiciones: conteo de cambios de resolución entre evaluaciones
+      consecutivas de un mismo RUT, por mes local (AAAAMM) de la evaluación de destino
+    """
+    datos = (
+        df_graf.dropna(subset=["fecha_creacion"])
+        .sort_values(["rut", "fecha_creacion"], kind="mergesort")
+        .reset_index(drop=True)
+    )
+    
+    ruts = datos["rut"].to_numpy()
+    inicios = np.flatnonzero(np.r_[True, ruts[1:] != ruts[:-1]]) if len(ruts) else np.empty(0, dtype=int)
+    fines = np.r_[inicios[1:], len(ruts)]
+    posiciones = {
+        ruts[inicio]: (int(inicio), int(fin)) for inicio, fin in zip(inicios, fines)
+    }
+    
+    # Pares consecutivos dentro del mismo RUT
+    mismo_rut = datos["rut"].eq(datos["rut"].shift(-1))
+    pares = pd.DataFrame({
+        "mes": datos["mes_local"].shift(-1)[mismo_rut].astype("int32"),
+        "desde": datos["resolucion_riesgo"][mismo_rut],
+        "hacia": datos["resolucion_riesgo"].shift(-1)[mismo_rut],
+    })
+    transiciones = pares.groupby(["mes", "desde", "hacia"], observed=True).size().reset_index(name="cantidad")
+    
+    return {"datos": datos, "posiciones": posiciones, "transiciones": transiciones}
+
+def historial_rut(historial, rut):
+    """Evaluaciones de un RUT en orden cronológico (búsqueda directa por posiciones)"""
+    inicio, fin = historial["posiciones"].get(str(rut).strip(), (0, 0))
+    return historial["datos"].iloc[inicio:fin]
+
+def _espacio_datos(incluir_analistas):
+    return f"{ESPACIO_CACHE}_v{FORMATO_CACHE}_{'analistas' if incluir_analistas else 'base'}"
+
+def _espacio_resumenes(incluir_analistas):
+    return f"resumenes_v{FORMATO_CACHE}_{'analistas' if incluir_analistas else 'base'}"
+
+def _espacio_historial(incluir_analistas):
+    return f"historial_v{FORMATO_CACHE}_{'analistas' if incluir_analistas else 'base'}"
+
+def _calcular_resumenes_vista(df_graf, incluir_analistas):
+    """
+    Resúmenes sobre las mismas filas que muestra el dashboard (único por RUT con analistas).
+    El detector de anomalías avanza aquí con los días nuevos de la vista.
+    """
+    resumenes = calcular_resumenes(deduplicar_por_rut(df_graf) if incluir_analistas else df_graf)
+    try:
+        resumenes["anomalias"] = detector_anomalias.actualizar(
+            _espacio_resumenes(incluir_analistas), resumenes["por_dia"]
+        )
+    except Exception as e:
+        logger.warning("Error en detector de anomalías: %s", e)
+        resumenes["anomalias"] = {}
+    return resumenes
+
+def _hay_datos_en_disco(version):
+    """Una versión persistida sirve para arrancar en caliente si alguna vista tiene sus datos"""
+    return any(cache_datos.existe(_espacio_datos(incluir), version) for incluir in (False, True))
+
+def _preparar_version(anterior, nueva):
+    """
+    Calcula en segundo plano las vistas que estaban en uso con la versión
+    anterior, para publicar la nueva sin que un usuario espere la descarga
+    """
+    for incluir_analistas in (False, True):
+        if cache_datos.existe(_espacio_datos(incluir_analistas), anterior):
+            _datos_de_version(nueva, incluir_analistas)
+
+def version_vigente():
+    """
+    Versión vigente de la fuente (None si no se pudo determinar).
+    Tras un reinicio se usa la última versión con datos en disco y Drive se
+    revalida en segundo plano (ver cache_datos.version_vigente).
+    """
+    return cache_datos.version_vigente(
+        ESPACIO_CACHE, obtener_version_fuente,
+        al_cambiar=_preparar_version, es_utilizable=_hay_datos_en_disco
+    )
+
+def _version_actual():
+    version = version_vigente()
+    if version is None:
+        raise ValueError("No se pudo determinar la versión de la fuente")
+    return version
+
+def _datos_de_version(version, incluir_analistas):
+    """Datos procesados de una versión; al calcularlos se precalculan resúmenes e historial"""
+    def calcular():
+        fuente = _fuentes_resueltas.get(version)
+        archivo, necesita_actualizacion = fuente if fuente else resolver_archivo_fuente()
+        with medir(logger, "carga_datos", id_archivo=archivo["ID"], incluir_analistas=incluir_analistas) as campos:
+            df_graf = descargar_y_procesar(archivo, necesita_actualizacion, incluir_analistas)
+            campos["filas"] = len(df_graf)
+        with medir(logger, "resumenes", filas=len(df_graf)):
+            cache_datos.guardar(
+                _espacio_resumenes(incluir_analistas), version,
+                _calcular_resumenes_vista(df_graf, incluir_analistas)
+            )
+            cache_datos.guardar(
+                _espacio_historial(incluir_analistas), version, calcular_historial(df_graf)
+            )
         return df_graf
+    
+    return cache_datos.obtener_o_calcular(_espacio_datos(incluir_analistas), version, calcular)
+
+def obtener_datos_principales(incluir_analistas=False):
+    """
+    Función principal que gestiona todo el flujo de obtención de datos.
+    El resultado se cachea por versión del archivo fuente (ver cache_datos);
+    los resúmenes diarios (KPIs y SLA) y el índice de historial por RUT
+    se precalculan en el mismo refresco.
+    """
+    try:
+        return _datos_de_version(_version_actual(), incluir_analistas)
         
     except Exception as e:
-        print(f"Error en obtener_datos_principales: {e}")
+        logger.error("Error en obtener_datos_principales: %s", e)
         # Retornar DataFrame vacío en caso de error
         return pd.DataFrame()
 
+def obtener_resumenes(incluir_analistas=False):
+    """Resúmenes diarios de la versión vigente (ver calcular_resumenes)"""
+    try:
+        version = _version_actual()
+        return cache_datos.obtener_o_calcular(
+            _espacio_resumenes(incluir_analistas), version,
+            lambda: _calcular_resumenes_vista(obtener_datos_principales(incluir_analistas), incluir_analistas)
+        )
+    except Exception as e:
+        logger.error("Error en obtener_resumenes: %s", e)
+        return {"por_dia": {}, "por_analista_dia": {}, "anomalias": {}, "matriz_diaria": None}
+
+def obtener_historial(incluir_analistas=False):
+    """Índice de historial por RUT de la versión vigente (ver calcular_historial)"""
+    try:
+        version = _version_actual()
+        return cache_datos.obtener_o_calcular(
+            _espacio_historial(incluir_analistas), version,
+            lambda: calcular_historial(obtener_datos_principales(incluir_analistas))
+        )
+    except Exception as e:
+        logger.error("Error en obtener_historial: %s", e)
+        return None
+
+def refrescar_datos():
+    """
+    Solicita revalidar la fuente en el próximo acceso sin vaciar el caché
+    de otros usuarios: los datos solo se recargan si Drive tiene otra versión
+    """
+    cache_datos.revalidar(ESPACIO_CACHE)
+
 # Función de compatibilidad con código existente
 def cargar_datos(incluir_analistas=False):
     """Wrapper para compatibilidad con el dashboard existente"""
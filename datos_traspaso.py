@@ -0,0 +1,177 @@
+"""
+Datos del monitoreo de traspaso de producto (Google Sheet) particionados por mes
+Los meses cerrados se guardan en disco como particiones inmutables y en cada
+refresco solo se pide al Sheet lo posterior al último mes cerrado (consulta
+gviz filtrada por la columna `mes`). Si la consulta falla o su esquema no
+coincide con el guardado, se usa la exportación completa como respaldo.
+"""
+
+import os
+import json
+import threading
+import pandas as pd
+from funciones_google import (
+    leer_csv_drive, consultar_sheet, obtener_version_archivo, escritura_atomica, safe_filename
+)
+import cache_datos
+import motor_consultas
+from registro import obtener_logger, medir
+
+logger = obtener_logger("datos_traspaso")
+
+# Configuración
+SHEET_ID_TRASPASO = '1wEcS8JvfKqjHA5PlD5N6ZaixG0rFYVq_pUQK1eMz5t4'
+ESPACIO_CACHE = "traspaso_producto"
+RUTA_PARTICIONES = os.path.join("almacen_traspaso", "meses")
+RUTA_MANIFIESTO = os.path.join("almacen_traspaso", "manifiesto.json")
+COLUMNA_MES = "mes"
+
+_lock_particiones = threading.Lock()
+
+
+def _manifiesto_vacio():
+    return {
+        "meses_cerrados": [],   # valores de `mes` ya persistidos como partición
+        "columnas": [],         # orden de columnas del Sheet
+        "tipos": {},            # columna -> dtype.kind al cerrar el primer mes
+    }
+
+def _leer_manifiesto():
+    if not os.path.exists(RUTA_MANIFIESTO):
+        return _manifiesto_vacio()
+    with open(RUTA_MANIFIESTO, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _guardar_manifiesto(manifiesto):
+    os.makedirs(os.path.dirname(RUTA_MANIFIESTO), exist_ok=True)
+    with escritura_atomica(RUTA_MANIFIESTO) as ruta_temporal:
+        with open(ruta_temporal, "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+
+def _ruta_particion(mes):
+    return os.path.join(RUTA_PARTICIONES, f"mes={safe_filename(str(mes))}.csv.gz")
+
+def _leer_particiones(manifiesto):
+    """Concatena las particiones de meses cerrados (vacío si no hay)"""
+    partes = [pd.read_csv(_ruta_particion(mes)) for mes in manifiesto["meses_cerrados"]]
+    if not partes:
+        return pd.DataFrame(columns=manifiesto["columnas"])
+    return pd.concat(partes, ignore_index=True)
+
+def _cerrar_meses(df, manifiesto):
+    """
+    Persiste como partición cada mes anterior al más reciente de `df`
+    (el último mes sigue abierto). Las particiones existentes no se reescriben.
+    """
+    if df.empty:
+        return
+
+    mes_abierto = df[COLUMNA_MES].max()
+    cerrados = set(manifiesto["meses_cerrados"])
+    nuevos = [mes for mes in sorted(df[COLUMNA_MES].dropna().unique()) if mes < mes_abierto and mes not in cerrados]
+    if not nuevos:
+        return
+
+    if not manifiesto["columnas"]:
+        manifiesto["columnas"] = list(df.columns)
+        manifiesto["tipos"] = {columna: df[columna].dtype.kind for columna in df.columns}
+
+    os.makedirs(RUTA_PARTICIONES, exist_ok=True)
+    for mes in nuevos:
+        with escritura_atomica(_ruta_particion(mes)) as ruta_temporal:
+            df[df[COLUMNA_MES] == mes].to_csv(ruta_temporal, index=False, compression="gzip")
+        # Valor nativo para que el manifiesto JSON conserve el tipo (int o str)
+        manifiesto["meses_cerrados"].append(mes.item() if hasattr(mes, "item") else mes)
+
+    manifiesto["meses_cerrados"].sort()
+    _guardar_manifiesto(manifiesto)
+    logger.info("Meses cerrados como particiones: %s", nuevos, extra={"etapa": "particiones_traspaso"})
+
+def _letra_columna(indice):
+    """Letra de columna de hoja de cálculo para un índice 0-based (0 -> A, 26 -> AA)"""
+    letras = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(ord("A") + resto) + letras
+    return letras
+
+def _consultar_meses_abiertos(manifiesto):
+    """
+    Filas posteriores al último mes cerrado mediante consulta gviz.
+    Retorna None si el resultado no tiene el esquema de las particiones.
+    """
+    columnas = manifiesto["columnas"]
+    ultimo_cerrado = manifiesto["meses_cerrados"][-1]
+    letra = _letra_columna(columnas.index(COLUMNA_MES))
+    valor = str(ultimo_cerrado) if isinstance(ultimo_cerrado, (int, float)) else f"'{ultimo_cerrado}'"
+
+    df, _ = consultar_sheet(SHEET_ID_TRASPASO, f"select * where {letra} > {valor}")
+
+    if list(df.columns) != columnas:
+        return None
+    for columna in (COLUMNA_MES, "count"):
+        if columna in df.columns and len(df) and df[columna].dtype.kind != manifiesto["tipos"].get(columna):
+            return None
+    return df
+
+def descargar_traspaso():
+    """
+    Reconstruye el DataFrame completo: particiones cerradas desde disco y
+    meses abiertos desde el Sheet. Registra el resultado en el almacén local.
+    """
+    with _lock_particiones, medir(logger, "carga_traspaso", id_archivo=SHEET_ID_TRASPASO) as campos:
+        manifiesto = _leer_manifiesto()
+        cerrados = _leer_particiones(manifiesto)
+
+        abiertos = None
+        if manifiesto["meses_cerrados"]:
+            try:
+                abiertos = _consultar_meses_abiertos(manifiesto)
+            except Exception as e:
+                logger.warning("Consulta incremental del Sheet falló (%s); se usa exportación completa", e,
+                               extra={"etapa": "carga_traspaso", "id_archivo": SHEET_ID_TRASPASO})
+        campos["incremental"] = abiertos is not None
+
+        if abiertos is None:
+            completo, _ = leer_csv_drive(SHEET_ID_TRASPASO)
+            if COLUMNA_MES not in completo.columns:
+                return completo  # Formato inesperado: la página informa las columnas faltantes
+            abiertos = completo[~completo[COLUMNA_MES].isin(manifiesto["meses_cerrados"])]
+
+        _cerrar_meses(abiertos, manifiesto)
+        df = pd.concat([cerrados, abiertos], ignore_index=True) if not cerrados.empty else abiertos.reset_index(drop=True)
+        campos["filas"] = len(df)
+
+    motor_consultas.registrar_tabla("traspaso", df)
+    return df
+
+def cargar_datos_traspaso():
+    """
+    Datos del Sheet de traspaso, cacheados por fecha de modificación del Sheet.
+    Retorna un DataFrame vacío si no se pudieron cargar.
+    """
+    try:
+        version = cache_datos.version_vigente(
+            ESPACIO_CACHE, lambda: obtener_version_archivo(SHEET_ID_TRASPASO)
+        )
+        if version is None:
+            return descargar_traspaso()
+        return cache_datos.obtener_o_calcular(ESPACIO_CACHE, version, descargar_traspaso)
+
+    except Exception as e:
+        logger.error("Error cargando datos desde Google Sheet: %s", e,
+                     extra={"etapa": "carga_traspaso", "id_archivo": SHEET_ID_TRASPASO})
+        return pd.DataFrame()
+
+def reconstruir_particiones():
+    """Descarta las particiones para releer el historial completo en la próxima carga"""
+    with _lock_particiones:
+        manifiesto = _leer_manifiesto()
+        for mes in manifiesto["meses_cerrados"]:
+            ruta = _ruta_particion(mes)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        if os.path.exists(RUTA_MANIFIESTO):
+            os.remove(RUTA_MANIFIESTO)
+    cache_datos.invalidar(ESPACIO_CACHE)
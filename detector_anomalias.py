@@ -0,0 +1,136 @@
+"""
+Detección incremental de anomalías en la serie diaria de casos
+Mantiene una línea base por día de la semana (media y varianza con peso
+exponencial) del volumen diario y de la tasa de rechazo. En cada refresco solo
+se procesan los días completos posteriores al último ya visto; el estado se
+guarda en disco junto al caché.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from funciones_google import escritura_atomica
+from registro import obtener_logger
+
+logger = obtener_logger("detector_anomalias")
+
+# Configuración del detector
+RUTA_ESTADOS = os.path.join("cache_datos", "detector_anomalias")
+ALFA = 0.2                 # Peso de cada nueva observación del mismo día de semana (~5 semanas)
+UMBRAL_Z = 3.0             # Desviaciones estándar para marcar un día como anómalo
+MIN_OBSERVACIONES = 4      # Semanas de historia antes de empezar a marcar
+MIN_CASOS_TASA = 10        # Casos mínimos del día para evaluar la tasa de rechazo
+TASA_DESVIACION_MINIMA = 0.02
+
+
+def _estado_vacio():
+    return {
+        "ultimo_dia": None,
+        "volumen": {},     # día de semana -> [media, varianza, n]
+        "rechazo": {},
+        "anomalias": {},   # "YYYY-MM-DD" -> lista de anomalías del día
+    }
+
+def _ruta_estado(nombre):
+    return os.path.join(RUTA_ESTADOS, f"{nombre}.json")
+
+def cargar_estado(nombre):
+    """Estado persistido del detector (vacío si no existe o es ilegible)"""
+    ruta = _ruta_estado(nombre)
+    if not os.path.exists(ruta):
+        return _estado_vacio()
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning("Estado del detector ilegible (%s): %s", ruta, e)
+        return _estado_vacio()
+
+def guardar_estado(nombre, estado):
+    try:
+        os.makedirs(RUTA_ESTADOS, exist_ok=True)
+        with escritura_atomica(_ruta_estado(nombre)) as ruta_temporal:
+            with open(ruta_temporal, "w", encoding="utf-8") as f:
+                json.dump(estado, f, ensure_ascii=False)
+    except Exception as e:
+        logger.warning("No se pudo guardar el estado del detector: %s", e)
+
+def _evaluar_y_actualizar(lineas_base, dia_semana, valor, desviacion_minima):
+    """
+    Compara `valor` con la línea base de su día de semana y luego la actualiza.
+    Retorna (esperado, z) o None si aún no hay historia suficiente.
+    """
+    media, varianza, n = lineas_base.get(dia_semana, [valor, 0.0, 0])
+
+    resultado = None
+    desviacion = max(np.sqrt(varianza), desviacion_minima(media))
+    if n >= MIN_OBSERVACIONES:
+        resultado = (float(media), float((valor - media) / desviacion))
+
+    alfa = max(ALFA, 1.0 / (n + 1))
+    diferencia = valor - media
+    media += alfa * diferencia
+    varianza = (1 - alfa) * (varianza + alfa * diferencia ** 2)
+    lineas_base[dia_semana] = [media, varianza, n + 1]
+    return resultado
+
+def actualizar(nombre, resumenes_por_dia):
+    """
+    Avanza el detector `nombre` con los días nuevos de `resumenes_por_dia`
+    (dict fecha -> ResumenDiario) y retorna todas las anomalías conocidas.
+    El último día de la serie se considera incompleto y no se procesa.
+    """
+    estado = cargar_estado(nombre)
+    if not resumenes_por_dia:
+        return estado["anomalias"]
+
+    ultimo_completo = max(resumenes_por_dia) - pd.Timedelta(days=1)
+    desde = (
+        pd.Timestamp(estado["ultimo_dia"]).date() + pd.Timedelta(days=1)
+        if estado["ultimo_dia"] else min(resumenes_por_dia)
+    )
+    if desde > ultimo_completo:
+        return estado["anomalias"]
+
+    # Los días sin casos cuentan como volumen cero
+    for dia in pd.date_range(desde, ultimo_completo, freq="D").date:
+        resumen = resumenes_por_dia.get(dia)
+        casos = resumen.casos if resumen is not None else 0
+        dia_semana = str(dia.weekday())
+        anomalias_dia = []
+
+        evaluacion = _evaluar_y_actualizar(
+            estado["volumen"], dia_semana, float(casos),
+            lambda media: np.sqrt(max(media, 1.0))
+        )
+        if evaluacion is not None and abs(evaluacion[1]) >= UMBRAL_Z:
+            anomalias_dia.append({
+                "metrica": "volumen", "valor": casos,
+                "esperado": round(evaluacion[0], 1), "z": round(evaluacion[1], 1),
+            })
+
+        if casos >= MIN_CASOS_TASA:
+            tasa = resumen.rechazados / casos
+            evaluacion = _evaluar_y_actualizar(
+                estado["rechazo"], dia_semana, tasa,
+                lambda media: max(np.sqrt(media * (1 - media) / casos), TASA_DESVIACION_MINIMA)
+            )
+            if evaluacion is not None and evaluacion[1] >= UMBRAL_Z:
+                anomalias_dia.append({
+                    "metrica": "tasa_rechazo", "valor": round(tasa, 3),
+                    "esperado": round(evaluacion[0], 3), "z": round(evaluacion[1], 1),
+                })
+
+        if anomalias_dia:
+            estado["anomalias"][dia.isoformat()] = anomalias_dia
+
+    estado["ultimo_dia"] = ultimo_completo.isoformat()
+    guardar_estado(nombre, estado)
+    return estado["anomalias"]
+
+def reiniciar(nombre):
+    """Descarta el estado para recalcular la línea base desde cero"""
+    ruta = _ruta_estado(nombre)
+    if os.path.exists(ruta):
+        os.remove(ruta)
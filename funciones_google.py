@@ -5,12 +5,23 @@ from collections import defaultdict
 import time
 import os
 from PyPDF2 import PdfReader, PdfWriter
-from io import StringIO
+from io import StringIO, BytesIO
 from openai import OpenAI
 import re
-from typing import Optional
+from typing import Optional, Tuple
 import json
 import tempfile
+import hashlib
+import gzip
+import queue
+import random
+import atexit
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from registro import obtener_logger, medir
+
+logger = obtener_logger("funciones_google")
 
 # Función de respaldo para cargar datos
 def archivo_actualizado():
@@ -28,7 +39,7 @@ def archivo_actualizado():
         else:
             return pd.DataFrame()
     except Exception as e:
-        print(f"Error cargando archivo local: {e}")
+        logger.error("Error cargando archivo local: %s", e)
         return pd.DataFrame()
 
 
@@ -43,7 +54,7 @@ def login():
         
         # Verificar si estamos en Streamlit Cloud (secrets disponibles)
         if hasattr(st, 'secrets') and 'google_drive' in st.secrets:
-            print("🔑 Autenticando con Streamlit Cloud secrets...")
+            logger.debug("Autenticando con Streamlit Cloud secrets", extra={"etapa": "login"})
             
             # Crear diccionario de credenciales desde secrets
             credentials_dict = {
@@ -75,7 +86,7 @@ def login():
                 }
                 gauth.ServiceAuth()
                 
-                print("✅ Autenticación exitosa con service account")
+                logger.debug("Autenticación exitosa con service account", extra={"etapa": "login"})
                 return GoogleDrive(gauth)
                 
             finally:
@@ -86,13 +97,13 @@ def login():
                     pass
             
         else:
-            print("🔑 Autenticando localmente con archivos JSON...")
+            logger.debug("Autenticando localmente con archivos JSON", extra={"etapa": "login"})
             
             # Configuración local usando archivos JSON
             CREDENTIALS_FILE = 'drive_automat.json'
             
             if not os.path.exists(CREDENTIALS_FILE):
-                print(f"❌ No se encontró {CREDENTIALS_FILE}")
+                logger.error("No se encontró %s", CREDENTIALS_FILE, extra={"etapa": "login"})
                 return None
                 
             GoogleAuth.DEFAULT_SETTINGS['client_config_file'] = CREDENTIALS_FILE
@@ -109,13 +120,13 @@ def login():
             gauth.LoadCredentialsFile("mycreds.txt")
             
             if gauth.credentials is None:
-                print("🔄 Realizando autenticación web...")
+                logger.info("Realizando autenticación web", extra={"etapa": "login"})
                 gauth.LocalWebserverAuth()
             elif gauth.access_token_expired:
-                print("🔄 Refrescando token expirado...")
+                logger.debug("Refrescando token expirado", extra={"etapa": "login"})
                 gauth.Refresh()
             else:
-                print("✅ Usando credenciales existentes")
+                logger.debug("Usando credenciales existentes", extra={"etapa": "login"})
                 gauth.Authorize()
             
             # Guardar credenciales para la próxima vez
@@ -124,7 +135,7 @@ def login():
             return GoogleDrive(gauth)
             
     except Exception as e:
-        print(f"❌ Error en login: {e}")
+        logger.error("Error en login: %s", e, extra={"etapa": "login"})
         return None
 
 def listar_archivos_carpeta(folder_id):
@@ -133,7 +144,7 @@ def listar_archivos_carpeta(folder_id):
     """
     credenciales = login()
     if credenciales is None:
-        print("❌ No se pudo conectar a Google Drive")
+        logger.error("No se pudo conectar a Google Drive", extra={"etapa": "listar", "id_carpeta": folder_id})
         return pd.DataFrame()
         
     query = f"'{folder_id}' in parents and trashed = false"
@@ -141,28 +152,49 @@ def listar_archivos_carpeta(folder_id):
     id_archive = []
     type_archive = []
     fechas_creacion = []
+    fechas_modificacion = []
     
     try:
         lista_archivos = credenciales.ListFile({'q': query}).GetList()
         if not lista_archivos:
-            print(f"No se encontraron archivos en la carpeta con ID {folder_id}.")
+            logger.info("No se encontraron archivos en la carpeta", extra={"etapa": "listar", "id_carpeta": folder_id})
         else:
             for f in lista_archivos:
                 nombres.append(f['title'])
                 id_archive.append(f['id'])
                 type_archive.append(f['mimeType'])
                 fechas_creacion.append(f['createdDate'])
+                fechas_modificacion.append(f.get('modifiedDate', f['createdDate']))
 
     except Exception as e:
-        print(f"Se produjo un error al listar los archivos: {e}")
+        logger.error("Se produjo un error al listar los archivos: %s", e, extra={"etapa": "listar", "id_carpeta": folder_id})
         
     df_carpeta = pd.DataFrame({
         'Nombre': nombres,
         'ID': id_archive,
         'Tipo': type_archive,
-        'Fecha Creación': fechas_creacion
+        'Fecha Creación': fechas_creacion,
+        'Fecha Modificación': fechas_modificacion
     })
     return df_carpeta
+def obtener_version_archivo(id_drive: str) -> Optional[str]:
+    """
+    Retorna la fecha de modificación de un archivo de Drive (solo metadatos),
+    útil como versión para invalidar cachés. Si algo falla, retorna None.
+    """
+    try:
+        credenciales = login()
+        if credenciales is None:
+            return None
+
+        archivo = credenciales.CreateFile({'id': id_drive})
+        archivo.FetchMetadata(fields='modifiedDate')
+        return archivo['modifiedDate']
+
+    except Exception as e:
+        logger.error("Error al obtener versión del archivo: %s", e, extra={"etapa": "version", "id_archivo": id_drive})
+        return None
+
 # ───────────────────────────────────────────────
 # 1) Utilidad para nombres seguros
 # ───────────────────────────────────────────────
@@ -174,18 +206,149 @@ def safe_filename(name: str, replacement: str = "-") -> str:
     """
     return re.sub(_INVALID_CHARS, replacement, name)
 
+@contextmanager
+def escritura_atomica(ruta_destino: str):
+    """
+    Entrega una ruta temporal en la misma carpeta que `ruta_destino`.
+    Al salir sin errores el archivo se renombra atómicamente al destino;
+    si hay error se elimina, de modo que nunca quedan archivos a medio escribir.
+    """
+    carpeta = os.path.dirname(ruta_destino) or "."
+    os.makedirs(carpeta, exist_ok=True)
+    fd, ruta_temporal = tempfile.mkstemp(
+        dir=carpeta, prefix=f".{os.path.basename(ruta_destino)}.", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        yield ruta_temporal
+        os.replace(ruta_temporal, ruta_destino)
+    except BaseException:
+        try:
+            os.remove(ruta_temporal)
+        except OSError:
+            pass
+        raise
+
+# ───────────────────────────────────────────────
+# 2) Descargas por bloques con reanudación
+# ───────────────────────────────────────────────
+TAMANO_BLOQUE_DESCARGA = 8 * 1024 * 1024   # 8 MB por petición Range
+MAX_REINTENTOS_DESCARGA = 5
+ESPERA_BASE_REINTENTO = 1.0                # segundos, se duplica en cada reintento
+_ESTADOS_TRANSITORIOS = {408, 429, 500, 502, 503, 504}
+
+
+class ErrorDescarga(Exception):
+    """Error no recuperable durante una descarga por bloques"""
+
+
+def _md5_archivo(ruta: str) -> str:
+    """Calcula el MD5 de un archivo leyendo por bloques"""
+    md5 = hashlib.md5()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(bloque)
+    return md5.hexdigest()
+
+def descargar_por_bloques(archivo, ruta_destino: str,
+                          tamano_bloque: int = TAMANO_BLOQUE_DESCARGA,
+                          max_reintentos: int = MAX_REINTENTOS_DESCARGA) -> str:
+    """
+    Descarga el contenido de un archivo de Drive con peticiones Range.
+
+    - Escribe en `<ruta_destino>.part` y reanuda desde su tamaño si ya existe.
+    - Reintenta errores transitorios con espera exponencial acotada.
+    - Verifica el MD5 contra los metadatos de Drive antes de renombrar
+      atómicamente al destino; un archivo corrupto nunca queda en `ruta_destino`.
+
+    `archivo` debe tener los metadatos cargados (id, fileSize, md5Checksum).
+    """
+    tamano_total = int(archivo.get('fileSize') or 0)
+    md5_esperado = archivo.get('md5Checksum')
+    ruta_parcial = f"{ruta_destino}.part"
+
+    uri = archivo.auth.service.files().get_media(fileId=archivo['id']).uri
+    http = archivo.http
+
+    offset = os.path.getsize(ruta_parcial) if os.path.exists(ruta_parcial) else 0
+    if tamano_total and offset > tamano_total:
+        offset = 0  # parcial de otra versión del archivo
+    if offset:
+        logger.info("Reanudando descarga", extra={"etapa": "descarga", "id_archivo": archivo['id'], "bytes": offset})
+
+    reintentos = 0
+    with open(ruta_parcial, "r+b" if offset else "wb") as f:
+        f.seek(offset)
+        f.truncate()
+
+        while not tamano_total or offset < tamano_total:
+            fin = offset + tamano_bloque - 1
+            try:
+                resp, contenido = http.request(uri, headers={"range": f"bytes={offset}-{fin}"})
+            except Exception as e:
+                resp, contenido = None, e
+
+            if resp is not None and resp.status in (200, 206):
+                if resp.status == 200 and offset:
+                    # El servidor ignoró el rango: reiniciar desde cero
+                    f.seek(0)
+                    f.truncate()
+                    offset = 0
+
+                f.write(contenido)
+                offset += len(contenido)
+                reintentos = 0
+
+                rango = resp.get("content-range", "")
+                if "/" in rango and not rango.endswith("/*"):
+                    tamano_total = int(rango.rsplit("/", 1)[1])
+                elif resp.status == 200 or not contenido:
+                    tamano_total = offset
+                continue
+
+            if resp is not None and resp.status == 416:
+                break  # El parcial ya contiene el archivo completo
+
+            if resp is not None and resp.status not in _ESTADOS_TRANSITORIOS:
+                raise ErrorDescarga(f"HTTP {resp.status} descargando {archivo['id']}")
+
+            reintentos += 1
+            if reintentos > max_reintentos:
+                raise ErrorDescarga(
+                    f"Descarga de {archivo['id']} abortada tras {max_reintentos} reintentos "
+                    f"({offset:,} bytes conservados para reanudar)"
+                )
+            espera = ESPERA_BASE_REINTENTO * 2 ** (reintentos - 1)
+            detalle = contenido if resp is None else f"HTTP {resp.status}"
+            logger.warning(
+                "Error transitorio (%s); reintento %d/%d en %.0fs", detalle, reintentos, max_reintentos, espera,
+                extra={"etapa": "descarga", "id_archivo": archivo['id'], "bytes": offset}
+            )
+            f.flush()
+            time.sleep(espera)
+
+    if md5_esperado and _md5_archivo(ruta_parcial) != md5_esperado:
+        os.remove(ruta_parcial)
+        raise ErrorDescarga(f"MD5 no coincide para {archivo['id']}; parcial descartado")
+
+    os.replace(ruta_parcial, ruta_destino)
+    return ruta_destino
+
 def bajar_archivo_por_id(id_drive: str, ruta_descarga: str) -> Optional[str]:
     """
     Descarga un archivo desde Drive (PyDrive2) y lo guarda en `ruta_descarga`,
     devolviendo la ruta completa ya saneada. Si algo falla, retorna None.
+    Los archivos binarios se bajan por bloques con reanudación y verificación
+    MD5; los documentos nativos de Google se exportan en una sola petición.
     """
     try:
         credenciales = login()
         if credenciales is None:
-            print("❌ No se pudo conectar a Google Drive para descargar archivo")
+            logger.error("No se pudo conectar a Google Drive para descargar archivo", extra={"etapa": "descarga", "id_archivo": id_drive})
             return None
             
         archivo = credenciales.CreateFile({'id': id_drive})
+        archivo.FetchMetadata(fields='id,title,mimeType,fileSize,md5Checksum')
         
         # Nombre original y nombre seguro
         nombre_original = archivo['title']
@@ -195,12 +358,18 @@ def bajar_archivo_por_id(id_drive: str, ruta_descarga: str) -> Optional[str]:
         ruta_completa = os.path.join(ruta_descarga, nombre_seguro)
         os.makedirs(ruta_descarga, exist_ok=True)      # crea la carpeta si falta
 
-        archivo.GetContentFile(ruta_completa)
-        print(f"✅ Archivo descargado: {nombre_seguro}")
+        with medir(logger, "descarga", id_archivo=id_drive, nombre_archivo=nombre_seguro) as campos:
+            if archivo['mimeType'].startswith('application/vnd.google-apps.'):
+                # Documentos nativos: sin tamaño ni MD5, se exportan completos
+                with escritura_atomica(ruta_completa) as ruta_temporal:
+                    archivo.GetContentFile(ruta_temporal)
+            else:
+                descargar_por_bloques(archivo, ruta_completa)
+            campos["bytes"] = os.path.getsize(ruta_completa)
         return ruta_completa
 
     except Exception as e:
-        print(f"❌ Error al bajar el archivo con ID {id_drive}: {e}")
+        logger.error("Error al bajar el archivo: %s", e, extra={"etapa": "descarga", "id_archivo": id_drive})
         return None
 
 def subir_archivo(ruta_archivo_local: str, nombre_archivo: str = None, descripcion: str = "Archivo subido automáticamente") -> Optional[str]:
@@ -215,13 +384,10 @@ def subir_archivo(ruta_archivo_local: str, nombre_archivo: str = None, descripci
     Returns:
         Optional[str]: ID del archivo subido o None si hay error
     """
-    import random
-    from datetime import datetime
-    
     try:
         # Verificar que el archivo existe
         if not os.path.exists(ruta_archivo_local):
-            print(f"Error: El archivo {ruta_archivo_local} no existe.")
+            logger.error("El archivo %s no existe", ruta_archivo_local, extra={"etapa": "subida"})
             return None
         
         # Obtener credenciales de Drive
@@ -252,107 +418,191 @@ def subir_archivo(ruta_archivo_local: str, nombre_archivo: str = None, descripci
         archivo_drive.SetContentFile(ruta_archivo_local)
         archivo_drive.Upload()
         
-        print(f"✅ Archivo subido exitosamente: {nombre_archivo}")
-        print(f"📁 ID del archivo: {archivo_drive['id']}")
+        logger.info("Archivo subido", extra={
+            "etapa": "subida", "nombre_archivo": nombre_archivo, "id_archivo": archivo_drive['id'],
+            "id_carpeta": folder_id, "bytes": os.path.getsize(ruta_archivo_local),
+        })
         
         return archivo_drive['id']
         
     except Exception as e:
-        print(f"❌ Error al subir el archivo: {e}")
+        logger.error("Error al subir el archivo: %s", e, extra={"etapa": "subida", "nombre_archivo": nombre_archivo})
         return None
 
-def registrar_error(ejecutivo: str, error: str, ruta_carpeta_local: str = "registros_errores") -> Optional[str]:
+def descargar_a_buffer(id_drive: str, mimetype: Optional[str] = None) -> Tuple[BytesIO, dict]:
     """
-    Registra un error en un archivo de texto y lo sube a Google Drive.
-    
-    Args:
-        ejecutivo (str): Nombre del ejecutivo o usuario que generó el error
-        error (str): Descripción del error
-        ruta_carpeta_local (str): Carpeta local donde guardar temporalmente el archivo
-    
+    Descarga (o exporta, para documentos nativos como Sheets) un archivo de
+    Drive directamente a memoria, sin escribir en disco.
+
     Returns:
-        Optional[str]: ID del archivo subido o None si hay error
+        Tuple[BytesIO, dict]: buffer posicionado al inicio y métricas
+        {'bytes', 'segundos_descarga'}
     """
-    import random
-    from datetime import datetime
-    
-    try:
-        # Generar ID único para el error
-        id_error = random.randint(10000, 99999)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # Crear carpeta local si no existe
-        os.makedirs(ruta_carpeta_local, exist_ok=True)
-        
-        # Verificar si la carpeta fue creada
-        if os.path.exists(ruta_carpeta_local):
-            print(f"📁 Carpeta creada/verificada en: {ruta_carpeta_local}")
-        else:
-            print("❌ Error al crear la carpeta de registros.")
-            return None
-        
-        # Crear el archivo de error con información detallada
-        nombre_archivo_error = f"error_{timestamp}_{id_error}_{ejecutivo}.txt"
-        ruta_archivo_error = os.path.join(ruta_carpeta_local, nombre_archivo_error)
-        
-        contenido_error = f"""REGISTRO DE ERROR
-==================
-Fecha: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-Ejecutivo/Usuario: {ejecutivo}
-ID del Error: {id_error}
-
-DESCRIPCIÓN DEL ERROR:
-{error}
-
-INFORMACIÓN ADICIONAL:
-- Sistema: Dashboard de Riesgo
-- Archivo generado automáticamente
-"""
-          # Escribir el error al archivo
-        with open(ruta_archivo_error, "w", encoding="utf-8") as file:
-            file.write(contenido_error)
-        
-        print(f"📝 Archivo de error creado: {ruta_archivo_error}")
-        
-        # Subir el archivo a Google Drive
-        id_archivo_drive = subir_archivo(
-            ruta_archivo_error, 
-            nombre_archivo_error,
-            f"Registro de error - {ejecutivo} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        )
-        
-        if id_archivo_drive:
-            print(f"✅ Error registrado exitosamente. ID del archivo: {id_archivo_drive}")
-            
-            # Limpiar archivo local después de subir exitosamente
-            try:
-                os.remove(ruta_archivo_error)
-                print(f"🗑️ Archivo local temporal eliminado: {ruta_archivo_error}")
-            except Exception as cleanup_error:
-                print(f"⚠️ No se pudo eliminar el archivo temporal: {cleanup_error}")
-        else:
-            print("❌ Error al subir el archivo de registro a Google Drive.")
-        
-        return id_archivo_drive
-        
-    except Exception as e:
-        print(f"❌ Error al registrar el error: {e}")
-        return None
+    credenciales = login()
+    if credenciales is None:
+        raise ConnectionError("No se pudo conectar a Google Drive")
 
+    archivo = credenciales.CreateFile({'id': id_drive})
 
-def gestionar_archivo_busqueda_diario(folder_id="1H--_ASpw__9OTnUG1bDfGZ22zRlUpMdF"):
+    inicio = time.perf_counter()
+    buffer = BytesIO()
+    for bloque in archivo.GetContentIOBuffer(mimetype=mimetype):
+        buffer.write(bloque)
+    segundos = time.perf_counter() - inicio
+
+    buffer.seek(0)
+    return buffer, {'bytes': buffer.getbuffer().nbytes, 'segundos_descarga': segundos}
+
+def leer_csv_drive(id_drive: str, mimetype: str = 'text/csv', **opciones_csv) -> Tuple[pd.DataFrame, dict]:
+    """
+    Exporta un archivo/Sheet de Drive como CSV y lo parsea desde memoria.
+    Sesiones concurrentes no comparten rutas temporales en disco.
+
+    Returns:
+        Tuple[pd.DataFrame, dict]: datos y métricas
+        {'bytes', 'segundos_descarga', 'segundos_parseo'}
+    """
+    buffer, metricas = descargar_a_buffer(id_drive, mimetype)
+
+    inicio = time.perf_counter()
+    df = pd.read_csv(buffer, **opciones_csv)
+    metricas['segundos_parseo'] = time.perf_counter() - inicio
+
+    logger.info("CSV leído desde Drive", extra={
+        "etapa": "lectura_csv", "id_archivo": id_drive, "bytes": metricas['bytes'],
+        "duracion_descarga_s": round(metricas['segundos_descarga'], 3),
+        "duracion_parseo_s": round(metricas['segundos_parseo'], 3), "filas": len(df),
+    })
+    return df, metricas
+
+def consultar_sheet(id_sheet: str, consulta: str, **opciones_csv) -> Tuple[pd.DataFrame, dict]:
+    """
+    Ejecuta una consulta del lenguaje de Google Visualization (gviz `tq`) sobre
+    la primera hoja de un Sheet y retorna solo las filas resultantes como CSV.
+    Las columnas se referencian por letra (A, B, ...). Lanza excepción si falla.
+
+    Returns:
+        Tuple[pd.DataFrame, dict]: datos y métricas {'bytes', 'segundos_descarga'}
+    """
+    from urllib.parse import quote
+
+    credenciales = login()
+    if credenciales is None:
+        raise ConnectionError("No se pudo conectar a Google Drive")
+
+    url = (f"https://docs.google.com/spreadsheets/d/{id_sheet}/gviz/tq"
+           f"?tqx=out:csv&tq={quote(consulta)}")
+    http = credenciales.auth.Get_Http_Object()
+
+    inicio = time.perf_counter()
+    resp, contenido = http.request(url)
+    segundos = time.perf_counter() - inicio
+    if resp.status != 200:
+        raise ErrorDescarga(f"HTTP {resp.status} consultando Sheet {id_sheet}")
+
+    df = pd.read_csv(BytesIO(contenido), **opciones_csv)
+    metricas = {'bytes': len(contenido), 'segundos_descarga': segundos}
+    logger.info("Consulta gviz sobre Sheet", extra={
+        "etapa": "consulta_sheet", "id_archivo": id_sheet, "bytes": metricas['bytes'],
+        "duracion_s": round(segundos, 3), "filas": len(df),
+    })
+    return df, metricas
+
+# ───────────────────────────────────────────────
+# 3) Subidas comprimidas y reanudables
+# ───────────────────────────────────────────────
+TAMANO_BLOQUE_SUBIDA = 5 * 1024 * 1024     # múltiplo de 256 KB exigido por Drive
+UMBRAL_SUBIDA_REANUDABLE = 5 * 1024 * 1024
+FORMATO_SNAPSHOT = "gzip"                  # "gzip" o "csv" (sin comprimir)
+_EXTENSIONES_SNAPSHOT = {"gzip": ".csv.gz", "csv": ".csv"}
+_MIMETYPES_SNAPSHOT = {"gzip": "application/gzip", "csv": "text/csv"}
+
+
+def nombre_snapshot_diario(fecha: str, formato: str = FORMATO_SNAPSHOT) -> str:
+    """Nombre en Drive del archivo de búsqueda diario para `fecha` (YYYY-MM-DD)"""
+    return f"busqueda_diaria_{fecha}{_EXTENSIONES_SNAPSHOT[formato]}"
+
+def _buscar_snapshot_diario(df_archivos: pd.DataFrame, fecha: str) -> pd.DataFrame:
+    """Filtra el listado de la carpeta por el snapshot del día en cualquier formato"""
+    nombres = [nombre_snapshot_diario(fecha, formato) for formato in _EXTENSIONES_SNAPSHOT]
+    return df_archivos[df_archivos["Nombre"].isin(nombres)]
+
+def subir_archivo_reanudable(drive, ruta_local: str, nombre_archivo: str, folder_id: str,
+                             id_existente: Optional[str] = None,
+                             mimetype: str = "application/octet-stream") -> dict:
+    """
+    Sube `ruta_local` a Drive midiendo bytes y duración.
+
+    - Si `id_existente` se indica, reemplaza el contenido de ese archivo en el
+      lugar (files.update), conservando ID, enlaces y permisos.
+    - Archivos mayores a UMBRAL_SUBIDA_REANUDABLE usan una sesión reanudable
+      por bloques; un corte solo repite el bloque en curso.
+
+    Returns:
+        dict: {'id', 'bytes', 'segundos', 'mb_por_segundo'}
+    """
+    from googleapiclient.http import MediaFileUpload
+
+    tamano = os.path.getsize(ruta_local)
+    reanudable = tamano > UMBRAL_SUBIDA_REANUDABLE
+    media = MediaFileUpload(
+        ruta_local,
+        mimetype=mimetype,
+        chunksize=TAMANO_BLOQUE_SUBIDA if reanudable else -1,
+        resumable=reanudable
+    )
+
+    archivos = drive.auth.service.files()
+    cuerpo = {'title': nombre_archivo, 'mimeType': mimetype}
+    if id_existente:
+        peticion = archivos.update(fileId=id_existente, body=cuerpo, media_body=media,
+                                   supportsAllDrives=True)
+    else:
+        cuerpo['parents'] = [{'id': folder_id}]
+        peticion = archivos.insert(body=cuerpo, media_body=media, supportsAllDrives=True)
+
+    # Cliente HTTP propio: el de drive.auth no es seguro entre hilos
+    http = drive.auth.Get_Http_Object()
+
+    inicio = time.perf_counter()
+    if reanudable:
+        respuesta = None
+        while respuesta is None:
+            estado, respuesta = peticion.next_chunk(http=http, num_retries=MAX_REINTENTOS_DESCARGA)
+            if estado:
+                logger.debug("Subida %s: %.0f%%", nombre_archivo, estado.progress() * 100, extra={"etapa": "subida"})
+    else:
+        respuesta = peticion.execute(http=http, num_retries=MAX_REINTENTOS_DESCARGA)
+    segundos = time.perf_counter() - inicio
+
+    metricas = {
+        'id': respuesta['id'],
+        'bytes': tamano,
+        'segundos': segundos,
+        'mb_por_segundo': (tamano / 1024 / 1024) / segundos if segundos > 0 else 0.0
+    }
+    logger.info("Subida completada", extra={
+        "etapa": "subida", "nombre_archivo": nombre_archivo, "id_archivo": metricas['id'],
+        "id_carpeta": folder_id, "bytes": tamano, "duracion_s": round(segundos, 3),
+        "mb_por_segundo": round(metricas['mb_por_segundo'], 2),
+    })
+    return metricas
+
+def gestionar_archivo_busqueda_diario(folder_id="1H--_ASpw__9OTnUG1bDfGZ22zRlUpMdF", formato=FORMATO_SNAPSHOT):
     """
     Gestiona el archivo de búsqueda diario en Google Drive con detección automática de actualización.
     
     1. Verifica si existe un archivo del día actual actualizado después de las 10:00 AM
     2. Si existe y está actualizado, lo descarga y retorna la ruta local
-    3. Si no existe o está desactualizado, genera uno nuevo y lo sube
+    3. Si no existe o está desactualizado, genera uno nuevo comprimido y lo sube
+       (reemplazando en el lugar el contenido del archivo existente)
     4. Retorna la ruta del archivo local para ser usado
     
     Args:
         folder_id (str): ID del folder de Google Drive donde almacenar los archivos
-          Returns:
-        str: Ruta del archivo local descargado/generado
+        formato (str): "gzip" (por defecto) o "csv" para subir sin comprimir
+    Returns:
+        str: Ruta del archivo local descargado/generado (pd.read_csv infiere la compresión)
     """
     from datetime import date, datetime, time
     
@@ -362,140 +612,100 @@ def gestionar_archivo_busqueda_diario(folder_id="1H--_ASpw__9OTnUG1bDfGZ22zRlUpM
         hoy = date.today().strftime("%Y-%m-%d")
         hora_limite = time(10, 0)  # 10:00 AM
         
-        nombre_archivo_esperado = f"busqueda_diaria_{hoy}.csv"
+        nombre_archivo_esperado = nombre_snapshot_diario(hoy, formato)
         
-        print(f"🔍 Buscando archivo del día {hoy} en Google Drive...")
-        print(f"⏰ Hora actual: {ahora.strftime('%H:%M:%S')}")
+        logger.info("Buscando archivo del día %s en Google Drive", hoy, extra={"etapa": "snapshot_diario", "id_carpeta": folder_id})
         
         # Listar archivos en el folder
         df_archivos = listar_archivos_carpeta(folder_id)
         
         archivo_hoy_id = None
+        archivo_hoy_nombre = None
         archivo_hoy_encontrado = False
         archivo_actualizado_hoy = False
         
         if df_archivos.empty:
-            print("📂 No se encontraron archivos en el folder")
+            logger.info("No se encontraron archivos en el folder", extra={"etapa": "snapshot_diario", "id_carpeta": folder_id})
         else:
-            # Buscar archivo del día actual
-            archivo_hoy = df_archivos[df_archivos["Nombre"] == nombre_archivo_esperado]
+            # Buscar archivo del día actual (comprimido o CSV heredado)
+            archivo_hoy = _buscar_snapshot_diario(df_archivos, hoy)
             
             if archivo_hoy.empty:
-                print(f"📄 No se encontró archivo del día: {nombre_archivo_esperado}")
+                logger.info("No se encontró archivo del día: %s", nombre_archivo_esperado, extra={"etapa": "snapshot_diario"})
             else:
                 archivo_hoy_encontrado = True
                 archivo_info = archivo_hoy.iloc[0]
                 archivo_hoy_id = archivo_info["ID"]
-                fecha_creacion_str = archivo_info["Fecha Creación"]
-                  # Parsear fecha de creación del archivo en Google Drive
+                archivo_hoy_nombre = archivo_info["Nombre"]
+                # Fecha de modificación: la actualización en el lugar no cambia createdDate
+                fecha_modificacion_str = archivo_info["Fecha Modificación"]
                 try:
                     # Formato típico: 2024-05-31T14:30:00.000Z
-                    fecha_creacion = datetime.fromisoformat(fecha_creacion_str.replace('Z', '+00:00'))
-                    fecha_creacion_local = fecha_creacion.replace(tzinfo=None)  # Remover timezone para comparar
+                    fecha_modificacion = datetime.fromisoformat(fecha_modificacion_str.replace('Z', '+00:00'))
+                    fecha_modificacion_local = fecha_modificacion.replace(tzinfo=None)  # Remover timezone para comparar
                     
                     # Verificar si el archivo fue creado/actualizado después de las 10:00 AM de hoy
                     limite_actualizacion = datetime.combine(date.today(), hora_limite)
-                    if fecha_creacion_local >= limite_actualizacion:
+                    if fecha_modificacion_local >= limite_actualizacion:
                         archivo_actualizado_hoy = True
-                        print(f"✅ Archivo encontrado y actualizado: {nombre_archivo_esperado}")
-                        print(f"📅 Creado/actualizado: {fecha_creacion_local.strftime('%Y-%m-%d %H:%M:%S')}")
+                        logger.info("Archivo del día actualizado (modificado %s)", fecha_modificacion_local.strftime('%Y-%m-%d %H:%M:%S'),
+                                    extra={"etapa": "snapshot_diario", "id_archivo": archivo_hoy_id})
                     else:
                         archivo_actualizado_hoy = False
-                        print(f"⚠️ Archivo encontrado pero desactualizado: {nombre_archivo_esperado}")
-                        print(f"📅 Creado: {fecha_creacion_local.strftime('%Y-%m-%d %H:%M:%S')} (antes de 10:00 AM)")
+                        logger.warning("Archivo del día desactualizado (modificado %s, antes de 10:00 AM)",
+                                       fecha_modificacion_local.strftime('%Y-%m-%d %H:%M:%S'),
+                                       extra={"etapa": "snapshot_diario", "id_archivo": archivo_hoy_id})
                 
                 except Exception as e:
-                    print(f"⚠️ Error parseando fecha de creación: {e}")
+                    logger.warning("Error parseando fecha de modificación: %s", e, extra={"etapa": "snapshot_diario"})
                     archivo_actualizado_hoy = False
         
-        # Ruta local donde guardar/cargar el archivo
-        ruta_local = f"datos_busqueda_{hoy}.csv"
-        
         if archivo_hoy_encontrado and archivo_actualizado_hoy:
-            # Descargar el archivo actualizado existente
-            print(f"📥 Descargando archivo actualizado existente...")
-            drive = login()
-            archivo = drive.CreateFile({'id': archivo_hoy_id})
-            archivo.GetContentFile(ruta_local)
-            print(f"✅ Archivo actualizado descargado exitosamente: {ruta_local}")
+            # Descargar el archivo actualizado existente (conserva su extensión)
+            ruta_local = bajar_archivo_por_id(archivo_hoy_id, ".")
             
         else:
             # Generar nuevo archivo usando el proceso actual
-            if archivo_hoy_encontrado and not archivo_actualizado_hoy:
-                print(f"🔄 Archivo existe pero está desactualizado. Sobrescribiendo archivo existente...")
-                
-                # Obtener datos actualizados usando la función existente
-                print(f"🔍 Ejecutando búsqueda completa de datos actualizados...")
-                df_actualizado = archivo_actualizado()
-                
-                # Guardar localmente
-                df_actualizado.to_csv(ruta_local, index=False)
-                print(f"💾 Archivo generado localmente: {ruta_local}")
-                
-                # Sobrescribir el archivo existente en Google Drive en lugar de crear uno nuevo
-                try:
-                    drive = login()
-                    archivo_existente = drive.CreateFile({'id': archivo_hoy_id})
-                    archivo_existente.SetContentFile(ruta_local)
-                    archivo_existente.Upload()
-                    print(f"✅ Archivo existente sobrescrito exitosamente en Google Drive (ID: {archivo_hoy_id})")
-                    print(f"⏰ Archivo actualizado a las {datetime.now().strftime('%H:%M:%S')}")
-                except Exception as e:
-                    print(f"⚠️ Error sobrescribiendo archivo existente: {e}")
-                    print(f"🔄 Intentando eliminar y crear nuevo archivo...")
-                    # Fallback: eliminar y crear nuevo
-                    try:
-                        archivo_viejo = drive.CreateFile({'id': archivo_hoy_id})
-                        archivo_viejo.Trash()
-                        print(f"🗑️ Archivo viejo movido a la papelera")
-                        
-                        # Crear nuevo archivo
-                        archivo_drive = drive.CreateFile({
-                            'title': nombre_archivo_esperado,
-                            'parents': [{'id': folder_id}]
-                        })
-                        archivo_drive.SetContentFile(ruta_local)
-                        archivo_drive.Upload()
-                        print(f"✅ Nuevo archivo creado exitosamente (ID: {archivo_drive['id']})")
-                    except Exception as fallback_error:
-                        print(f"❌ Error en fallback: {fallback_error}")
-                        
-            else:
-                print(f"📊 No se encontró archivo del día. Generando nuevo archivo...")
-                
-                # Obtener datos actualizados usando la función existente
-                print(f"🔍 Ejecutando búsqueda completa de datos actualizados...")
-                df_actualizado = archivo_actualizado()
-                
-                # Guardar localmente                df_actualizado.to_csv(ruta_local, index=False)
-                print(f"💾 Archivo generado localmente: {ruta_local}")
-                
-                # Subir el nuevo archivo a Google Drive
-                print(f"📤 Subiendo archivo nuevo a Google Drive...")
-                drive = login()
-                archivo_drive = drive.CreateFile({
-                    'title': nombre_archivo_esperado,
-                    'parents': [{'id': folder_id}]
-                })
-                archivo_drive.SetContentFile(ruta_local)
-                archivo_drive.Upload()
-                
-                print(f"✅ Archivo subido exitosamente a Google Drive con ID: {archivo_drive['id']}")
-                print(f"⏰ Archivo creado a las {datetime.now().strftime('%H:%M:%S')}")
+            logger.info(
+                "Reemplazando contenido del archivo del día" if archivo_hoy_encontrado else "Generando nuevo archivo del día",
+                extra={"etapa": "snapshot_diario", "id_archivo": archivo_hoy_id}
+            )
+            
+            # Obtener datos actualizados usando la función existente
+            df_actualizado = archivo_actualizado()
+            
+            # Guardar localmente (comprimido según formato)
+            ruta_local = f"datos_busqueda_{hoy}{_EXTENSIONES_SNAPSHOT[formato]}"
+            with escritura_atomica(ruta_local) as ruta_temporal:
+                df_actualizado.to_csv(
+                    ruta_temporal, index=False,
+                    compression="gzip" if formato == "gzip" else None
+                )
+            
+            # Subir: actualiza en el lugar si ya existe, crea si no
+            drive = login()
+            metricas = subir_archivo_reanudable(
+                drive, ruta_local, nombre_archivo_esperado, folder_id,
+                id_existente=archivo_hoy_id,
+                mimetype=_MIMETYPES_SNAPSHOT[formato]
+            )
+            accion = "actualizado en el lugar" if archivo_hoy_id else "creado"
+            logger.info("Archivo del día %s en Google Drive", accion,
+                        extra={"etapa": "snapshot_diario", "id_archivo": metricas['id'], "id_carpeta": folder_id})
         
         return ruta_local
         
     except Exception as e:
-        print(f"❌ Error en gestión del archivo de búsqueda diario: {e}")
         # Fallback: usar el proceso local tradicional
-        print(f"🔄 Usando proceso local como respaldo...")
+        logger.error("Error en gestión del archivo de búsqueda diario: %s; usando proceso local como respaldo", e,
+                     extra={"etapa": "snapshot_diario", "id_carpeta": folder_id})
         try:
             df_respaldo = archivo_actualizado()
             ruta_respaldo = f"datos_respaldo_{date.today().strftime('%Y-%m-%d')}.csv"
             df_respaldo.to_csv(ruta_respaldo, index=False)
             return ruta_respaldo
         except Exception as fallback_error:
-            print(f"❌ Error en proceso de respaldo: {fallback_error}")
+            logger.error("Error en proceso de respaldo: %s", fallback_error, extra={"etapa": "snapshot_diario"})
             return None
 
 
@@ -514,14 +724,14 @@ def obtener_archivo_historico_desde_drive(folder_id="1H--_ASpw__9OTnUG1bDfGZ22zR
         
         if ruta_archivo and os.path.exists(ruta_archivo):
             df = pd.read_csv(ruta_archivo)
-            print(f"✅ Datos históricos cargados desde: {ruta_archivo}")
+            logger.info("Datos históricos cargados desde %s", ruta_archivo, extra={"etapa": "historico", "filas": len(df)})
             return df
         else:
-            print(f"❌ No se pudo obtener el archivo histórico")
+            logger.error("No se pudo obtener el archivo histórico", extra={"etapa": "historico", "id_carpeta": folder_id})
             return pd.DataFrame()  # DataFrame vacío como fallback
             
     except Exception as e:
-        print(f"❌ Error al obtener archivo histórico: {e}")
+        logger.error("Error al obtener archivo histórico: %s", e, extra={"etapa": "historico", "id_carpeta": folder_id})
         return pd.DataFrame()  # DataFrame vacío como fallback
 
 def verificar_estado_actualizacion_drive(folder_id="1H--_ASpw__9OTnUG1bDfGZ22zRlUpMdF"):
@@ -547,8 +757,6 @@ def verificar_estado_actualizacion_drive(folder_id="1H--_ASpw__9OTnUG1bDfGZ22zRl
         hoy = date.today().strftime("%Y-%m-%d")
         hora_limite = time(10, 0)  # 10:00 AM
         
-        nombre_archivo_esperado = f"busqueda_diaria_{hoy}.csv"
-        
         # Listar archivos en el folder
         df_archivos = listar_archivos_carpeta(folder_id)
         
@@ -563,8 +771,8 @@ def verificar_estado_actualizacion_drive(folder_id="1H--_ASpw__9OTnUG1bDfGZ22zRl
             resultado['mensaje'] = "No se encontraron archivos en Google Drive"
             return resultado
         
-        # Buscar archivo del día actual
-        archivo_hoy = df_archivos[df_archivos["Nombre"] == nombre_archivo_esperado]
+        # Buscar archivo del día actual (comprimido o CSV heredado)
+        archivo_hoy = _buscar_snapshot_diario(df_archivos, hoy)
         
         if archivo_hoy.empty:
             resultado['mensaje'] = f"No existe archivo para el día {hoy}"
@@ -580,14 +788,16 @@ def verificar_estado_actualizacion_drive(folder_id="1H--_ASpw__9OTnUG1bDfGZ22zRl
             fecha_creacion_local = fecha_creacion.replace(tzinfo=None)
             resultado['fecha_creacion'] = fecha_creacion_local
             
-            # Verificar si está actualizado
+            # Verificar si está actualizado (por modificación: se actualiza en el lugar)
+            fecha_modificacion = datetime.fromisoformat(archivo_info["Fecha Modificación"].replace('Z', '+00:00'))
+            fecha_modificacion_local = fecha_modificacion.replace(tzinfo=None)
             limite_actualizacion = datetime.combine(date.today(), hora_limite)
             
-            if fecha_creacion_local >= limite_actualizacion:
+            if fecha_modificacion_local >= limite_actualizacion:
                 resultado['actualizado'] = True
-                resultado['mensaje'] = f"Archivo actualizado (creado a las {fecha_creacion_local.strftime('%H:%M:%S')})"
+                resultado['mensaje'] = f"Archivo actualizado (modificado a las {fecha_modificacion_local.strftime('%H:%M:%S')})"
             else:
-                resultado['mensaje'] = f"Archivo desactualizado (creado a las {fecha_creacion_local.strftime('%H:%M:%S')}, antes de 10:00 AM)"
+                resultado['mensaje'] = f"Archivo desactualizado (modificado a las {fecha_modificacion_local.strftime('%H:%M:%S')}, antes de 10:00 AM)"
                 
         except Exception as e:
             resultado['mensaje'] = f"Error parseando fecha: {e}"
@@ -600,4 +810,152 @@ def verificar_estado_actualizacion_drive(folder_id="1H--_ASpw__9OTnUG1bDfGZ22zRl
             'actualizado': False,
             'fecha_creacion': None,
             'mensaje': f"Error verificando estado: {e}"
-        }
\ No newline at end of file
+        }
+
+
+# ───────────────────────────────────────────────
+# 4) Registro de errores en segundo plano
+# ───────────────────────────────────────────────
+# registrar_error solo encola; un hilo escribe los registros en un spool
+# local (JSONL) y cada INTERVALO_ENVIO_ERRORES sube los lotes comprimidos.
+# Los lotes que no alcanzaron a subirse se reintentan al reiniciar.
+INTERVALO_ENVIO_ERRORES = 60   # Segundos entre subidas de lotes
+MAX_REGISTROS_POR_LOTE = 500   # Un lote lleno se sube sin esperar el intervalo
+_ARCHIVO_PENDIENTES = "pendientes.jsonl"
+
+_cola_errores = queue.Queue()
+_hilo_errores = None
+_lock_hilo_errores = threading.Lock()
+
+
+def _rotar_pendientes(carpeta: str) -> None:
+    """Cierra el archivo de pendientes como lote comprimido listo para subir"""
+    ruta_pendientes = os.path.join(carpeta, _ARCHIVO_PENDIENTES)
+    if not os.path.exists(ruta_pendientes) or os.path.getsize(ruta_pendientes) == 0:
+        return
+
+    nombre_lote = f"errores_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{random.randint(10000, 99999)}.jsonl.gz"
+    with escritura_atomica(os.path.join(carpeta, nombre_lote)) as ruta_temporal:
+        with open(ruta_pendientes, "rb") as origen, gzip.open(ruta_temporal, "wb") as destino:
+            destino.write(origen.read())
+    os.remove(ruta_pendientes)
+
+def _subir_lotes(carpeta: str) -> None:
+    """Sube los lotes comprimidos del spool; se eliminan solo si la subida funcionó"""
+    for nombre in sorted(os.listdir(carpeta)):
+        if not nombre.endswith(".jsonl.gz"):
+            continue
+        ruta_lote = os.path.join(carpeta, nombre)
+        if subir_archivo(ruta_lote, nombre, "Registro de errores - Dashboard de Riesgo"):
+            os.remove(ruta_lote)
+        else:
+            break  # Sin conexión: se reintenta en el próximo ciclo
+
+def _enviar_spool(carpetas: set) -> None:
+    for carpeta in carpetas:
+        try:
+            _rotar_pendientes(carpeta)
+            _subir_lotes(carpeta)
+        except Exception as e:
+            logger.warning("No se pudieron enviar los registros de error de %s: %s", carpeta, e, extra={"etapa": "registro_errores"})
+
+def _escribir_en_spool(carpeta: str, registros: list) -> int:
+    """Agrega registros al archivo de pendientes y retorna cuántos contiene"""
+    os.makedirs(carpeta, exist_ok=True)
+    ruta_pendientes = os.path.join(carpeta, _ARCHIVO_PENDIENTES)
+    with open(ruta_pendientes, "a", encoding="utf-8") as f:
+        for registro in registros:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+    with open(ruta_pendientes, "rb") as f:
+        return sum(1 for _ in f)
+
+def _procesar_cola_errores(carpeta_inicial: str) -> None:
+    """Bucle del hilo de envío: vacía la cola al spool y sube lotes periódicamente"""
+    carpetas = {carpeta_inicial}
+    # Lotes pendientes de una ejecución anterior
+    if os.path.isdir(carpeta_inicial):
+        _enviar_spool(carpetas)
+    proximo_envio = time.monotonic() + INTERVALO_ENVIO_ERRORES
+
+    while True:
+        try:
+            espera = max(0.0, proximo_envio - time.monotonic())
+            carpeta, registro = _cola_errores.get(timeout=espera)
+            por_carpeta = {carpeta: [registro]}
+            while True:
+                try:
+                    carpeta, registro = _cola_errores.get_nowait()
+                except queue.Empty:
+                    break
+                por_carpeta.setdefault(carpeta, []).append(registro)
+
+            for carpeta, registros in por_carpeta.items():
+                carpetas.add(carpeta)
+                if _escribir_en_spool(carpeta, registros) >= MAX_REGISTROS_POR_LOTE:
+                    proximo_envio = time.monotonic()
+        except queue.Empty:
+            pass
+        except Exception as e:
+            logger.warning("Error en el spool de registros de error: %s", e, extra={"etapa": "registro_errores"})
+
+        if time.monotonic() >= proximo_envio:
+            _enviar_spool(carpetas)
+            proximo_envio = time.monotonic() + INTERVALO_ENVIO_ERRORES
+
+def _vaciar_cola_al_salir() -> None:
+    """Al terminar el proceso los registros encolados quedan en el spool"""
+    por_carpeta = {}
+    while True:
+        try:
+            carpeta, registro = _cola_errores.get_nowait()
+        except queue.Empty:
+            break
+        por_carpeta.setdefault(carpeta, []).append(registro)
+    for carpeta, registros in por_carpeta.items():
+        try:
+            _escribir_en_spool(carpeta, registros)
+        except Exception as e:
+            logger.warning("No se pudieron guardar registros de error pendientes: %s", e, extra={"etapa": "registro_errores"})
+
+def _iniciar_hilo_errores(carpeta: str) -> None:
+    global _hilo_errores
+    with _lock_hilo_errores:
+        if _hilo_errores is not None and _hilo_errores.is_alive():
+            return
+        _hilo_errores = threading.Thread(
+            target=_procesar_cola_errores, args=(carpeta,),
+            name="envio-registros-error", daemon=True
+        )
+        _hilo_errores.start()
+        atexit.register(_vaciar_cola_al_salir)
+
+def registrar_error(ejecutivo: str, error: str, ruta_carpeta_local: str = "registros_errores") -> Optional[str]:
+    """
+    Registra un error sin bloquear: lo encola para que el hilo de envío lo
+    escriba en el spool local y lo suba a Google Drive en el próximo lote
+    comprimido (JSONL, un registro por línea).
+    
+    Args:
+        ejecutivo (str): Nombre del ejecutivo o usuario que generó el error
+        error (str): Descripción del error
+        ruta_carpeta_local (str): Carpeta del spool local de registros
+    
+    Returns:
+        Optional[str]: ID del error registrado o None si no se pudo encolar
+    """
+    try:
+        id_error = str(random.randint(10000, 99999))
+        registro = {
+            "fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "ejecutivo": ejecutivo,
+            "id_error": id_error,
+            "error": str(error),
+            "sistema": "Dashboard de Riesgo",
+        }
+        _cola_errores.put((ruta_carpeta_local, registro))
+        _iniciar_hilo_errores(ruta_carpeta_local)
+        return id_error
+        
+    except Exception as e:
+        logger.error("Error al registrar el error: %s", e, extra={"etapa": "registro_errores"})
+        return None
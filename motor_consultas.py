@@ -0,0 +1,389 @@
+"""
+Motor de consultas analíticas embebido (DuckDB) sobre el almacén local
+Las tablas de evaluaciones, analistas y traspaso se guardan en Parquet y las
+vistas del dashboard se declaran como consultas SQL; DuckDB lee del disco solo
+las columnas y grupos de filas que cada consulta necesita.
+Las evaluaciones se particionan por año/mes (UTC) de fecha_creacion, como las
+carpetas de Drive; una consulta con rango desde/hasta solo abre sus meses y
+una escritura solo reescribe los meses que cambian.
+"""
+
+import os
+import re
+import time
+import shutil
+import threading
+import pandas as pd
+from funciones_google import escritura_atomica
+from registro import obtener_logger
+
+logger = obtener_logger("motor_consultas")
+
+try:
+    import duckdb
+except ImportError:  # Dependencia opcional: sin DuckDB el dashboard sigue funcionando
+    duckdb = None
+
+# Configuración del almacén
+RUTA_ALMACEN = "almacen_evaluaciones"
+TABLAS = {
+    "analistas": "analistas.parquet",
+    "traspaso": "traspaso.parquet",
+}
+
+# Consultas declaradas: nombre -> (descripción, SQL con parámetros $nombre)
+CONSULTAS = {
+    "aprobacion_por_analista": (
+        "Tasa de aprobación por analista",
+        """
+        SELECT a.analista_riesgo,
+               COUNT(*) AS casos,
+               COUNT(*) FILTER (WHERE e.resolucion_riesgo = $aprobada) AS aprobados,
+               ROUND(100.0 * aprobados / casos, 1) AS tasa_aprobacion
+        FROM evaluaciones e
+        JOIN analistas a USING (rut)
+        WHERE e.fecha_creacion >= $desde AND e.fecha_creacion < $hasta
+        GROUP BY a.analista_riesgo
+        ORDER BY casos DESC
+        """,
+    ),
+    "mezcla_estados_por_mes": (
+        "Mezcla de resoluciones por mes",
+        """
+        SELECT printf('%d-%02d', mes_local // 100, mes_local % 100) AS mes,
+               resolucion_riesgo,
+               COUNT(*) AS cantidad,
+               ROUND(100.0 * cantidad / SUM(cantidad) OVER (PARTITION BY mes), 1) AS porcentaje
+        FROM evaluaciones
+        WHERE fecha_creacion >= $desde AND fecha_creacion < $hasta
+        GROUP BY mes, resolucion_riesgo
+        ORDER BY mes, cantidad DESC
+        """,
+    ),
+    "historial_rut": (
+        "Historial de evaluaciones de un RUT",
+        """
+        SELECT fecha_creacion, resolucion_riesgo, status, manualEvaluationId
+        FROM evaluaciones
+        WHERE rut = $rut
+        ORDER BY fecha_creacion
+        """,
+    ),
+    "traspaso_por_mes": (
+        "Evaluaciones One vs Producto por mes",
+        """
+        SELECT mes,
+               SUM("count") FILTER (WHERE username = 'producdigitalriesgo') AS Producto,
+               SUM("count") FILTER (WHERE username <> 'producdigitalriesgo') AS One,
+               SUM("count") AS Total
+        FROM traspaso
+        GROUP BY mes
+        ORDER BY mes
+        """,
+    ),
+}
+
+# Evaluaciones: <RUTA_EVALUACIONES>/<versión>/anio=AAAA/mes=M/*.parquet
+# El archivo VIGENTE apunta a la versión completa más reciente (reemplazo atómico)
+RUTA_EVALUACIONES = os.path.join(RUTA_ALMACEN, "evaluaciones")
+ARCHIVO_VIGENTE = "VIGENTE"
+ARCHIVO_EVALUACIONES_ANTERIOR = os.path.join(RUTA_ALMACEN, "evaluaciones.parquet")  # formato sin particiones
+_PATRON_ANIO = re.compile(r"^anio=(\d+)$")
+_PATRON_MES = re.compile(r"^mes=(\d+)$")
+_ANIO_PARTICION = "COALESCE(year(fecha_creacion AT TIME ZONE 'UTC'), 0)"
+_MES_PARTICION = "COALESCE(month(fecha_creacion AT TIME ZONE 'UTC'), 0)"
+
+_lock_escritura = threading.Lock()
+
+
+def disponible():
+    """Indica si DuckDB está instalado"""
+    return duckdb is not None
+
+def _ruta_tabla(tabla):
+    return os.path.join(RUTA_ALMACEN, TABLAS[tabla]).replace("\\", "/")
+
+def _version_evaluaciones():
+    """Carpeta de la versión vigente de evaluaciones, o None si no hay"""
+    try:
+        with open(os.path.join(RUTA_EVALUACIONES, ARCHIVO_VIGENTE), "r", encoding="utf-8") as f:
+            carpeta = os.path.join(RUTA_EVALUACIONES, f.read().strip())
+    except OSError:
+        return None
+    return carpeta if os.path.isdir(carpeta) else None
+
+def _mes_utc(fecha):
+    """Clave (año, mes) en UTC de un límite de rango"""
+    fecha = pd.Timestamp(fecha)
+    fecha = fecha.tz_localize("UTC") if fecha.tzinfo is None else fecha.tz_convert("UTC")
+    return fecha.year, fecha.month
+
+def _carpetas_particiones(carpeta):
+    """Carpetas de partición de una versión: (año, mes) -> ruta, en orden"""
+    particiones = {}
+    for nombre_anio in sorted(os.listdir(carpeta)):
+        anio = _PATRON_ANIO.match(nombre_anio)
+        if anio is None:
+            continue
+        for nombre_mes in sorted(os.listdir(os.path.join(carpeta, nombre_anio))):
+            mes = _PATRON_MES.match(nombre_mes)
+            if mes is None:
+                continue
+            clave = (int(anio.group(1)), int(mes.group(1)))
+            particiones[clave] = os.path.join(carpeta, nombre_anio, nombre_mes).replace("\\", "/")
+    return dict(sorted(particiones.items()))
+
+def _ruta_archivos(carpeta_particion):
+    return f"{carpeta_particion}/*.parquet"
+
+def particiones_evaluaciones(desde=None, hasta=None):
+    """
+    Rutas de los archivos Parquet de las particiones año/mes que intersectan
+    [desde, hasta) según fecha_creacion. Sin límites retorna todas (incluida
+    la de fechas nulas, anio=0).
+    """
+    carpeta = _version_evaluaciones()
+    if carpeta is None:
+        return []
+
+    minimo = _mes_utc(desde) if desde is not None else None
+    maximo = _mes_utc(pd.Timestamp(hasta) - pd.Timedelta(microseconds=1)) if hasta is not None else None
+
+    return [
+        _ruta_archivos(ruta) for clave, ruta in _carpetas_particiones(carpeta).items()
+        if (minimo is None or clave >= minimo) and (maximo is None or clave <= maximo)
+    ]
+
+def _leer_particiones_sql(rutas):
+    """read_parquet de las particiones indicadas, con las columnas de partición"""
+    lista = ", ".join(f"'{ruta}'" for ruta in rutas)
+    # union_by_name: las particiones no reescritas conservan el esquema con que se escribieron
+    return f"read_parquet([{lista}], hive_partitioning = true, union_by_name = true)"
+
+def _leer_evaluaciones_sql(rutas):
+    """Expresión SQL que lee las particiones indicadas sin las columnas de partición"""
+    return f"(SELECT * EXCLUDE (anio, mes) FROM {_leer_particiones_sql(rutas)})"
+
+def _origen_evaluaciones():
+    """Evaluaciones ya almacenadas como expresión SQL (particionadas o formato anterior), o None"""
+    rutas = particiones_evaluaciones()
+    if rutas:
+        return _leer_evaluaciones_sql(rutas)
+    if os.path.exists(ARCHIVO_EVALUACIONES_ANTERIOR):
+        return f"read_parquet('{ARCHIVO_EVALUACIONES_ANTERIOR.replace(os.sep, '/')}')"
+    return None
+
+def _conectar(desde=None, hasta=None):
+    """
+    Conexión en memoria con una vista por cada tabla existente en disco.
+    La vista de evaluaciones incluye solo las particiones del rango [desde, hasta).
+    """
+    con = duckdb.connect()
+    for tabla in TABLAS:
+        ruta = _ruta_tabla(tabla)
+        if os.path.exists(ruta):
+            con.execute(f"CREATE VIEW {tabla} AS SELECT * FROM read_parquet('{ruta}')")
+
+    todas = particiones_evaluaciones()
+    if todas:
+        rutas = particiones_evaluaciones(desde, hasta) if desde is not None or hasta is not None else todas
+        # Sin particiones en el rango: vista vacía con el esquema de la tabla
+        origen = _leer_evaluaciones_sql(rutas) if rutas else f"(SELECT * FROM {_leer_evaluaciones_sql(todas[:1])} LIMIT 0)"
+        con.execute(f"CREATE VIEW evaluaciones AS SELECT * FROM {origen}")
+        logger.debug("Particiones de evaluaciones leídas: %d de %d", len(rutas), len(todas),
+                     extra={"etapa": "consulta", "particiones": len(rutas)})
+    elif os.path.exists(ARCHIVO_EVALUACIONES_ANTERIOR):
+        con.execute(f"CREATE VIEW evaluaciones AS SELECT * FROM {_origen_evaluaciones()}")
+    return con
+
+def _copiar_parquet(con, sql, ruta):
+    """Materializa el resultado de `sql` en `ruta` con reemplazo atómico"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with escritura_atomica(ruta) as ruta_temporal:
+        ruta_temporal = ruta_temporal.replace("\\", "/")
+        con.execute(f"COPY ({sql}) TO '{ruta_temporal}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+
+def registrar_tabla(tabla, df):
+    """Reemplaza una tabla completa del almacén con el contenido de `df`"""
+    if not disponible() or df.empty:
+        return
+
+    try:
+        with _lock_escritura:
+            con = duckdb.connect()
+            con.register("origen", df)
+            _copiar_parquet(con, "SELECT * FROM origen", _ruta_tabla(tabla))
+            con.close()
+    except Exception as e:
+        logger.error("Error al registrar tabla %s en el almacén: %s", tabla, e)
+
+def _particiones_afectadas(con, particiones):
+    """
+    Particiones (año, mes) que cambian al incorporar la tabla `nuevos`: las
+    de sus filas y las que ya contienen alguno de sus manualEvaluationId
+    (una evaluación cambia de mes si cambia su fecha_creacion).
+    """
+    filas = con.execute(f"""
+        SELECT DISTINCT {_ANIO_PARTICION}, {_MES_PARTICION} FROM nuevos
+        UNION
+        SELECT DISTINCT anio, mes
+        FROM {_leer_particiones_sql([_ruta_archivos(ruta) for ruta in particiones.values()])}
+        WHERE manualEvaluationId IN (SELECT manualEvaluationId FROM nuevos)
+    """).fetchall()
+    return {(int(anio), int(mes)) for anio, mes in filas}
+
+def _enlazar_particion(origen, destino):
+    """Lleva una partición sin cambios a la nueva versión (enlace duro o copia)"""
+    os.makedirs(destino, exist_ok=True)
+    for nombre in os.listdir(origen):
+        try:
+            os.link(os.path.join(origen, nombre), os.path.join(destino, nombre))
+        except OSError:
+            shutil.copy2(os.path.join(origen, nombre), os.path.join(destino, nombre))
+
+def _escribir_evaluaciones(con, combinar):
+    """
+    Incorpora la tabla registrada `nuevos` en una nueva versión particionada
+    por año/mes de fecha_creacion y la publica. Solo se reescriben las
+    particiones afectadas, con `combinar(existentes)` (SQL que une `nuevos`
+    con las filas almacenadas de esas particiones); las demás pasan sin
+    cambios a la nueva versión.
+    Se conserva la versión reemplazada, que puede estar siendo leída por
+    consultas en curso; se eliminan las previas.
+    """
+    os.makedirs(RUTA_EVALUACIONES, exist_ok=True)
+    anterior = _version_evaluaciones()
+    particiones = _carpetas_particiones(anterior) if anterior else {}
+    if particiones:
+        afectadas = _particiones_afectadas(con, particiones)
+        rutas = [_ruta_archivos(ruta) for clave, ruta in particiones.items() if clave in afectadas]
+        existentes = _leer_evaluaciones_sql(rutas) if rutas else None
+    else:
+        # Sin versión particionada: se escribe todo (incluido el formato anterior)
+        afectadas = None
+        existentes = _origen_evaluaciones()
+    sql = combinar(existentes) if existentes is not None else "SELECT * FROM nuevos"
+
+    version = f"v{time.time_ns()}"
+    carpeta = os.path.join(RUTA_EVALUACIONES, version).replace("\\", "/")
+    try:
+        con.execute(f"""
+            COPY (
+                SELECT *,
+                       {_ANIO_PARTICION} AS anio,
+                       {_MES_PARTICION} AS mes
+                FROM ({sql})
+                ORDER BY fecha_creacion
+            ) TO '{carpeta}' (FORMAT PARQUET, COMPRESSION ZSTD, PARTITION_BY (anio, mes))
+        """)
+        if afectadas is not None:
+            sin_cambios = [clave for clave in particiones if clave not in afectadas]
+            for clave in sin_cambios:
+                _enlazar_particion(particiones[clave], os.path.join(carpeta, os.path.relpath(particiones[clave], anterior)))
+            logger.debug("Particiones de evaluaciones reescritas: %d; sin cambios: %d", len(afectadas), len(sin_cambios),
+                         extra={"etapa": "almacen", "particiones": len(afectadas)})
+        with escritura_atomica(os.path.join(RUTA_EVALUACIONES, ARCHIVO_VIGENTE)) as ruta_temporal:
+            with open(ruta_temporal, "w", encoding="utf-8") as f:
+                f.write(version)
+    except BaseException:
+        shutil.rmtree(carpeta, ignore_errors=True)
+        raise
+
+    # Los lectores no toman _lock_escritura: la versión recién reemplazada se
+    # elimina recién en la escritura siguiente
+    conservar = {version, os.path.basename(anterior) if anterior else None}
+    for nombre in os.listdir(RUTA_EVALUACIONES):
+        if nombre not in conservar and os.path.isdir(os.path.join(RUTA_EVALUACIONES, nombre)):
+            shutil.rmtree(os.path.join(RUTA_EVALUACIONES, nombre), ignore_errors=True)
+    if os.path.exists(ARCHIVO_EVALUACIONES_ANTERIOR):
+        os.remove(ARCHIVO_EVALUACIONES_ANTERIOR)
+
+def actualizar_evaluaciones(df):
+    """
+    Inserta o reemplaza evaluaciones por manualEvaluationId, conservando las
+    evaluaciones históricas que ya no vienen en la exportación actual.
+    Cada partición queda ordenada por fecha_creacion para podar grupos de filas.
+    """
+    if not disponible() or df.empty:
+        return
+
+    try:
+        with _lock_escritura:
+            con = duckdb.connect()
+            con.register("nuevos", df)
+            _escribir_evaluaciones(con, lambda existentes: f"""
+                SELECT * FROM nuevos
+                UNION ALL BY NAME
+                SELECT * FROM {existentes}
+                WHERE manualEvaluationId NOT IN (SELECT manualEvaluationId FROM nuevos)
+            """)
+            con.close()
+    except Exception as e:
+        logger.error("Error al actualizar evaluaciones en el almacén: %s", e)
+
+def fusionar_evaluaciones(df):
+    """
+    Incorpora evaluaciones de exportaciones históricas: por manualEvaluationId
+    se conserva la versión con fecha_creacion más reciente (ante empate, la
+    que ya estaba en el almacén), de modo que una exportación antigua nunca
+    reemplaza un estado posterior.
+    """
+    if not disponible() or df.empty:
+        return
+
+    try:
+        with _lock_escritura:
+            con = duckdb.connect()
+            con.register("nuevos", df)
+            _escribir_evaluaciones(con, lambda existentes: f"""
+                SELECT * EXCLUDE (_prioridad, _orden) FROM (
+                    SELECT *, row_number() OVER (
+                        PARTITION BY manualEvaluationId
+                        ORDER BY fecha_creacion DESC NULLS LAST, _prioridad
+                    ) AS _orden
+                    FROM (
+                        SELECT *, 0 AS _prioridad FROM {existentes}
+                        UNION ALL BY NAME
+                        SELECT *, 1 AS _prioridad FROM nuevos
+                    )
+                )
+                WHERE _orden = 1
+            """)
+            con.close()
+    except Exception as e:
+        logger.error("Error al fusionar evaluaciones históricas en el almacén: %s", e)
+
+def _tablas_faltantes(con, sql):
+    """Tablas del almacén referenciadas en `sql` que no tienen vista en `con`"""
+    vistas = {fila[0] for fila in con.execute("SELECT view_name FROM duckdb_views() WHERE NOT internal").fetchall()}
+    return [
+        tabla for tabla in ["evaluaciones", *TABLAS]
+        if tabla not in vistas and re.search(rf"\b(FROM|JOIN)\s+{tabla}\b", sql, re.IGNORECASE)
+    ]
+
+def ejecutar_sql(sql, parametros=None):
+    """Ejecuta SQL arbitrario sobre las vistas del almacén y retorna un DataFrame"""
+    if not disponible():
+        logger.warning("DuckDB no está instalado; consultas analíticas deshabilitadas")
+        return pd.DataFrame()
+
+    parametros = parametros or {}
+    try:
+        con = _conectar(parametros.get("desde"), parametros.get("hasta"))
+        faltantes = _tablas_faltantes(con, sql)
+        if faltantes:
+            # Tablas que aún no se cargaron (p. ej. analistas antes de abrir su vista)
+            logger.debug("Consulta omitida; tablas aún no disponibles: %s", ", ".join(faltantes))
+            con.close()
+            return pd.DataFrame()
+        df = con.execute(sql, parametros).df()
+        con.close()
+        return df
+    except Exception as e:
+        logger.error("Error al ejecutar consulta analítica: %s", e)
+        return pd.DataFrame()
+
+def ejecutar_consulta(nombre, **parametros):
+    """Ejecuta una consulta declarada en CONSULTAS con sus parámetros"""
+    _, sql = CONSULTAS[nombre]
+    return ejecutar_sql(sql, parametros)
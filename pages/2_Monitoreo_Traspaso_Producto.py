@@ -1,5 +1,4 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
@@ -9,7 +8,7 @@ import os
 
 # Agregar el directorio padre al path para importar funciones
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from funciones_google import login
+from datos_traspaso import cargar_datos_traspaso, SHEET_ID_TRASPASO
 
 st.set_page_config(page_title="Monitoreo Traspaso Producto", layout="wide")
 
@@ -19,43 +18,12 @@ st.markdown("---")
 # ───────────────────────────────────────────
 # 1. CARGA DE DATOS DESDE GOOGLE SHEETS
 # ───────────────────────────────────────────
-
-@st.cache_data(ttl=3600)  # Cache por 1 hora
-def cargar_datos_google_sheet():
-    """Carga datos desde Google Sheet específico"""
-    try:
-        # ID del Google Sheet para monitoreo de traspasos
-        sheet_id = '1wEcS8JvfKqjHA5PlD5N6ZaixG0rFYVq_pUQK1eMz5t4'
-        
-        drive = login()
-        if drive is None:
-            st.error("❌ No se pudo conectar a Google Drive")
-            return pd.DataFrame()
-            
-        archivo = drive.CreateFile({'id': sheet_id})
-        
-        # Descargar como CSV temporal
-        ruta_archivo = f'sheet_monitoreo_{sheet_id}.csv'
-        archivo.GetContentFile(ruta_archivo, mimetype='text/csv')
-        
-        # Cargar en DataFrame
-        df = pd.read_csv(ruta_archivo)
-        
-        # Limpiar archivo temporal
-        try:
-            os.remove(ruta_archivo)
-        except:
-            pass
-            
-        return df
-        
-    except Exception as e:
-        st.error(f"Error cargando datos desde Google Sheet: {str(e)}")
-        return pd.DataFrame()
+# Meses cerrados desde particiones locales; solo el mes en curso se pide al Sheet
 
 # Cargar datos desde Google Sheet
 with st.spinner("📊 Cargando datos desde Google Sheet..."):
-    df_resoluciones = cargar_datos_google_sheet()
+    # Copia local: el DataFrame cacheado es compartido entre sesiones
+    df_resoluciones = cargar_datos_traspaso().copy()
 
 if not df_resoluciones.empty:
     try:
@@ -493,12 +461,12 @@ if not df_resoluciones.empty:
 
 else:
     st.info("❌ No se pudieron cargar los datos desde Google Sheet.")
-    st.markdown("""
+    st.markdown(f"""
     ### Formato esperado en Google Sheet:
     - **username**: Usuario que realizó la evaluación
     - **name**: Tipo de resolución (APROBADO_100, APROBADO_CON_PROPUESTA, etc.)
     - **count**: Cantidad de evaluaciones
     - **mes**: Mes de la evaluación
     
-    **ID del Google Sheet:** `1wEcS8JvfKqjHA5PlD5N6ZaixG0rFYVq_pUQK1eMz5t4`
+    **ID del Google Sheet:** `{SHEET_ID_TRASPASO}`
     """)
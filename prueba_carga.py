@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga del dashboard con sesiones concurrentes sin navegador
+Lanza N sesiones de streamlit.testing (hilos del mismo proceso, como en el
+servidor de Streamlit) que recorren guiones de interacción típicos: cambio de
+rango de fechas, alternar "Valores únicos por RUT" y cambio de mes (gráfico
+circular y página de traspaso). Drive y los Sheets se reemplazan por una
+carpeta local con exportaciones, así que no se necesitan credenciales.
+Informa la latencia de cada re-ejecución (p50/p95) y el RSS máximo del proceso.
+
+Uso:
+    python prueba_carga.py --sesiones 8 --iteraciones 5 --fuente temp_archives
+"""
+
+import os
+import re
+import sys
+import glob
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import contextlib
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage, el RSS no se informa
+    resource = None
+
+from streamlit.testing.v1 import AppTest, app_test, local_script_runner, util
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+import funciones_google
+import data_manager
+import datos_traspaso
+from registro import obtener_logger
+
+logger = obtener_logger("prueba_carga")
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DASHBOARD = os.path.join(RAIZ, "dashboard.py")
+SCRIPT_TRASPASO = os.path.join(RAIZ, "pages", "2_Monitoreo_Traspaso_Producto.py")
+PATRON_EXPORTACIONES = "*manual-evaluations.csv"  # Exportaciones crudas, como las nombra Drive
+
+SESIONES_POR_DEFECTO = 4
+ITERACIONES_POR_DEFECTO = 3
+LATENCIA_DRIVE = 0.2        # Segundos simulados por llamada a Drive
+TIEMPO_MAXIMO_RERUN = 300   # Segundos antes de dar una re-ejecución por colgada
+VENTANAS_DIAS = (7, 30, 90)  # Rangos de fechas que alternan los guiones
+
+TIPO_CARPETA = "application/vnd.google-apps.folder"
+USUARIO_PRODUCTO = "producdigitalriesgo"
+NOMBRE_TRASPASO = {  # Resolución canónica -> `name` del Sheet de traspaso
+    "Aprobado": "APROBADO_100",
+    "Aprobado con propuesta": "APROBADO_CON_PROPUESTA",
+    "Devuelto a comercial": "DEVUELTO_A_COMERCIAL",
+    "Rechazado": "RECHAZADO",
+}
+
+# ------------------ Drive local -------------------
+_drive_local = {}  # ID de carpeta o archivo -> listado (DataFrame) o ruta local
+
+
+def _esperar_drive():
+    time.sleep(_drive_local.get("latencia", LATENCIA_DRIVE))
+
+def _listado(filas):
+    listado = pd.DataFrame(filas, columns=["Nombre", "ID", "Tipo", "Fecha Creación"])
+    listado["Fecha Modificación"] = listado["Fecha Creación"]
+    return listado
+
+def _sheet_traspaso(exportaciones):
+    """
+    Sheet de traspaso sintético a partir de las exportaciones: conteos por
+    mes, usuario (One o Producto, repartido por ID de evaluación) y resolución
+    """
+    df = pd.concat(
+        [pd.read_csv(ruta, usecols=["manualEvaluationId", "manualEvaluationDate", "status", "resolution"])
+         for ruta in exportaciones],
+        ignore_index=True
+    ).drop_duplicates("manualEvaluationId", keep="last")
+    _, resoluciones = data_manager.normalizar_resoluciones(df["status"], df["resolution"])
+    df = df.assign(
+        mes=pd.to_datetime(df["manualEvaluationDate"], utc=True, errors="coerce").dt.strftime("%Y-%m"),
+        username=np.where(df["manualEvaluationId"].astype(str).str[-1].isin(list("02468ace")),
+                          USUARIO_PRODUCTO, "analista_one"),
+        name=pd.Series(resoluciones, index=df.index).astype(str).map(NOMBRE_TRASPASO),
+    ).dropna(subset=["mes", "name"])
+    return df.groupby(["username", "name", "mes"]).size().rename("count").reset_index()
+
+def instalar_drive_local(carpeta_fuente, latencia=LATENCIA_DRIVE):
+    """
+    Reemplaza las funciones de Drive usadas por data_manager y datos_traspaso
+    por una carpeta local: las exportaciones quedan en la carpeta del mes en
+    curso, los Sheets de analistas se leen de analistas_<ID>.csv y el Sheet de
+    traspaso se sintetiza desde las exportaciones. Solo afecta a este proceso.
+    """
+    exportaciones = sorted(glob.glob(os.path.join(os.path.abspath(carpeta_fuente), PATRON_EXPORTACIONES)))
+    if not exportaciones:
+        raise ValueError(f"No hay exportaciones {PATRON_EXPORTACIONES} en {carpeta_fuente}")
+
+    anio, mes = data_manager.obtener_fecha_actual()
+    archivos = []
+    for ruta in exportaciones:
+        fecha = datetime.fromtimestamp(os.path.getmtime(ruta), timezone.utc).isoformat()
+        archivos.append((os.path.basename(ruta), os.path.basename(ruta), "text/csv", fecha))
+        _drive_local[os.path.basename(ruta)] = ruta
+
+    _drive_local.update({
+        "latencia": latencia,
+        data_manager.ID_CARPETA_RAIZ: _listado([(anio, "local_anio", TIPO_CARPETA, archivos[-1][3])]),
+        "local_anio": _listado([(mes, "local_mes", TIPO_CARPETA, archivos[-1][3])]),
+        "local_mes": _listado(archivos),
+        datos_traspaso.SHEET_ID_TRASPASO: _sheet_traspaso(exportaciones),
+        "version_traspaso": archivos[-1][3],
+    })
+
+    def listar_archivos_carpeta(folder_id):
+        _esperar_drive()
+        listado = _drive_local.get(folder_id)
+        return listado.copy() if isinstance(listado, pd.DataFrame) else _listado([])
+
+    def bajar_archivo_por_id(id_drive, ruta_descarga):
+        _esperar_drive()
+        origen = _drive_local.get(id_drive)
+        if not isinstance(origen, str):
+            return None
+        os.makedirs(ruta_descarga, exist_ok=True)
+        return shutil.copy(origen, os.path.join(ruta_descarga, id_drive))
+
+    def leer_csv_drive(id_drive, mimetype="text/csv", **opciones_csv):
+        _esperar_drive()
+        sheet = _drive_local.get(id_drive)
+        if sheet is None:
+            sheet = pd.read_csv(os.path.join(RAIZ, f"analistas_{id_drive}.csv"), **opciones_csv)
+        return sheet.copy(), {"bytes": int(sheet.memory_usage(deep=True).sum()), "segundos_descarga": 0.0}
+
+    def consultar_sheet(id_sheet, consulta, **opciones_csv):
+        # Solo la forma que usa datos_traspaso: "select * where <letra> > <valor>"
+        _esperar_drive()
+        letra, valor = re.fullmatch(r"select \* where ([A-Z]+) > '?(.*?)'?", consulta).groups()
+        sheet = _drive_local[id_sheet]
+        columna = sheet.columns[sum((ord(c) - 64) * 26 ** i for i, c in enumerate(reversed(letra))) - 1]
+        umbral = type(sheet[columna].iloc[0])(valor) if len(sheet) else valor
+        return sheet[sheet[columna] > umbral].reset_index(drop=True), {"bytes": 0, "segundos_descarga": 0.0}
+
+    def obtener_version_archivo(id_drive):
+        _esperar_drive()
+        return _drive_local["version_traspaso"] if id_drive in _drive_local else None
+
+    reemplazos = {
+        "listar_archivos_carpeta": listar_archivos_carpeta,
+        "bajar_archivo_por_id": bajar_archivo_por_id,
+        "leer_csv_drive": leer_csv_drive,
+        "consultar_sheet": consultar_sheet,
+        "obtener_version_archivo": obtener_version_archivo,
+    }
+    for modulo in (funciones_google, data_manager, datos_traspaso):
+        for nombre, funcion in reemplazos.items():
+            if hasattr(modulo, nombre):
+                setattr(modulo, nombre, funcion)
+    return exportaciones
+
+def dias_con_datos(ruta_exportacion):
+    """Primer y último día local de la exportación (para armar rangos con casos)"""
+    fechas = pd.to_datetime(
+        pd.read_csv(ruta_exportacion, usecols=["manualEvaluationDate"])["manualEvaluationDate"],
+        utc=True, errors="coerce"
+    ).dropna().dt.tz_convert(data_manager.ZONA_HORARIA)
+    return fechas.min().date(), fechas.max().date()
+
+# ------------------ Sesiones -------------------
+_lock_mediciones = threading.Lock()
+
+# AppTest está pensado para una sesión a la vez. Con sesiones en hilos:
+# - crea ScriptCache nuevos en cada re-ejecución (runner y PagesManager) y
+#   compila el script en paralelo; el servidor comparte uno solo.
+# - activa "global.appTest" reemplazando config.get_option durante cada
+#   re-ejecución; al restaurarlo en un hilo se desactiva en los demás, así
+#   que la opción se activa una vez para toda la prueba (ejecutar_prueba).
+_cache_scripts = ScriptCache()
+local_script_runner.ScriptCache = app_test.ScriptCache = lambda: _cache_scripts
+app_test.patch_config_options = lambda opciones: contextlib.nullcontext()
+
+def _rss_maximo_mb():
+    if resource is None:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maximo / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes en macOS, KB en Linux
+
+def _medir_rerun(at, guion, mediciones):
+    """Ejecuta la re-ejecución pendiente de la sesión y registra su duración y errores"""
+    inicio = time.perf_counter()
+    at.run()
+    duracion = time.perf_counter() - inicio
+    errores = len(at.exception) + len(at.error)
+    if not at.main.children:
+        errores += 1  # La página no dibujó nada (excepción antes del primer elemento)
+    with _lock_mediciones:
+        mediciones.append({"guion": guion, "segundos": duracion, "errores": errores})
+    if errores:
+        detalle = [e.value for e in at.exception] + [e.value for e in at.error]
+        logger.warning("Re-ejecución con errores (%s): %s", guion, detalle[:3], extra={"etapa": "prueba_carga"})
+
+def _control(elementos, clave):
+    """Control de la última re-ejecución por clave; si la página no lo dibujó, la sesión no puede seguir"""
+    for elemento in elementos:
+        if elemento.key == clave:
+            return elemento
+    raise ValueError(f"La página no dibujó el control '{clave}' (re-ejecución anterior incompleta)")
+
+def sesion_dashboard(indice, iteraciones, dias, mediciones):
+    """Carga, rango de fechas, alternar únicos por RUT y cambio de mes del gráfico circular"""
+    primero, ultimo = dias
+    at = AppTest.from_file(SCRIPT_DASHBOARD, default_timeout=TIEMPO_MAXIMO_RERUN)
+    _medir_rerun(at, "carga", mediciones)
+
+    for i in range(iteraciones):
+        ventana = VENTANAS_DIAS[(indice + i) % len(VENTANAS_DIAS)]
+        _control(at.date_input, "fecha_fin").set_value(ultimo)
+        _control(at.date_input, "fecha_inicio").set_value(max(primero, ultimo - timedelta(days=ventana - 1)))
+        _medir_rerun(at, "rango_fechas", mediciones)
+
+        unicos = _control(at.checkbox, "unicos_graf")
+        unicos.set_value(not unicos.value)
+        _medir_rerun(at, "unicos_graf", mediciones)
+
+        # Sin casos en el rango la página no dibuja el gráfico circular
+        mes = next((s for s in at.selectbox if s.key == "mes_torta"), None)
+        if mes is not None and mes.options:
+            mes.set_value(mes.options[(indice + i) % len(mes.options)])
+            _medir_rerun(at, "cambio_mes", mediciones)
+
+def sesion_traspaso(indice, iteraciones, dias, mediciones):
+    """Carga de la página de traspaso y cambio del mes analizado"""
+    at = AppTest.from_file(SCRIPT_TRASPASO, default_timeout=TIEMPO_MAXIMO_RERUN)
+    _medir_rerun(at, "carga_traspaso", mediciones)
+
+    for i in range(iteraciones):
+        if not at.selectbox or not at.selectbox[0].options:
+            return
+        selector = at.selectbox[0]
+        selector.set_value(selector.options[(indice + i) % len(selector.options)])
+        _medir_rerun(at, "cambio_mes_traspaso", mediciones)
+
+def ejecutar_prueba(sesiones, sesiones_traspaso, iteraciones, dias, rampa=0.0):
+    """
+    Corre las sesiones en paralelo y retorna (mediciones, segundos totales).
+    Una sesión que falla se registra como una medición con error.
+    """
+    mediciones = []
+
+    def correr(guion, indice):
+        try:
+            guion(indice, iteraciones, dias, mediciones)
+        except Exception as e:
+            logger.error("Sesión %d abortada: %s", indice, e, extra={"etapa": "prueba_carga"})
+            with _lock_mediciones:
+                mediciones.append({"guion": "sesion_abortada", "segundos": 0.0, "errores": 1})
+
+    guiones = [sesion_dashboard] * sesiones + [sesion_traspaso] * sesiones_traspaso
+    hilos = [
+        threading.Thread(target=correr, args=(guion, indice), name=f"sesion-{indice}", daemon=True)
+        for indice, guion in enumerate(guiones)
+    ]
+    inicio = time.perf_counter()
+    with util.patch_config_options({"global.appTest": True}):
+        for hilo in hilos:
+            hilo.start()
+            time.sleep(rampa)
+        for hilo in hilos:
+            hilo.join()
+    return mediciones, time.perf_counter() - inicio
+
+def resumir(mediciones):
+    """Latencias p50/p95/máx y errores por guion, más una fila "total" """
+    df = pd.DataFrame(mediciones, columns=["guion", "segundos", "errores"])
+    df = df[df["guion"] != "sesion_abortada"]
+    filas = []
+    for guion, grupo in list(df.groupby("guion", sort=False)) + [("total", df)]:
+        if grupo.empty:
+            continue
+        segundos = grupo["segundos"].to_numpy()
+        filas.append({
+            "guion": guion, "reruns": len(grupo),
+            "p50_s": round(float(np.percentile(segundos, 50)), 3),
+            "p95_s": round(float(np.percentile(segundos, 95)), 3),
+            "max_s": round(float(segundos.max()), 3),
+            "errores": int(grupo["errores"].sum()),
+        })
+    return pd.DataFrame(filas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del dashboard con sesiones concurrentes")
+    parser.add_argument("--sesiones", type=int, default=SESIONES_POR_DEFECTO, help="Sesiones del dashboard")
+    parser.add_argument("--sesiones-traspaso", type=int, default=1, help="Sesiones de la página de traspaso")
+    parser.add_argument("--iteraciones", type=int, default=ITERACIONES_POR_DEFECTO,
+                        help="Repeticiones del guion por sesión")
+    parser.add_argument("--fuente", default=data_manager.RUTA_TEMP,
+                        help=f"Carpeta con exportaciones {PATRON_EXPORTACIONES} que simula Drive")
+    parser.add_argument("--latencia", type=float, default=LATENCIA_DRIVE, help="Segundos por llamada a Drive")
+    parser.add_argument("--rampa", type=float, default=0.0, help="Segundos entre el inicio de cada sesión")
+    parser.add_argument("--directorio",
+                        help="Directorio de trabajo (caché y almacenes); por defecto uno temporal que se elimina")
+    argumentos = parser.parse_args()
+
+    exportaciones = instalar_drive_local(argumentos.fuente, argumentos.latencia)
+    dias = dias_con_datos(exportaciones[-1])
+
+    # Caché, snapshots y almacén local de la prueba no se mezclan con los reales
+    directorio = argumentos.directorio or tempfile.mkdtemp(prefix="prueba_carga_")
+    os.makedirs(directorio, exist_ok=True)
+    os.chdir(directorio)
+
+    rss_inicial = _rss_maximo_mb()
+    logger.info("Iniciando prueba de carga", extra={
+        "etapa": "prueba_carga", "sesiones": argumentos.sesiones,
+        "sesiones_traspaso": argumentos.sesiones_traspaso, "iteraciones": argumentos.iteraciones,
+        "directorio": directorio,
+    })
+    try:
+        mediciones, segundos = ejecutar_prueba(
+            argumentos.sesiones, argumentos.sesiones_traspaso, argumentos.iteraciones, dias, argumentos.rampa
+        )
+    finally:
+        os.chdir(RAIZ)
+        if not argumentos.directorio:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    resumen = resumir(mediciones)
+    rss_maximo = _rss_maximo_mb()
+    print(resumen.to_string(index=False))
+    print(f"\nSesiones: {argumentos.sesiones} dashboard + {argumentos.sesiones_traspaso} traspaso, "
+          f"{len(mediciones)} re-ejecuciones en {segundos:.1f} s")
+    if rss_maximo is not None:
+        print(f"RSS máximo: {rss_maximo} MB (al inicio {rss_inicial} MB)")
+
+    errores = int(sum(m["errores"] for m in mediciones))
+    logger.info("Prueba de carga terminada", extra={
+        "etapa": "prueba_carga", "segundos": round(segundos, 2), "reruns": len(mediciones),
+        "errores": errores, "rss_maximo_mb": rss_maximo,
+    })
+    return 0 if mediciones and not errores else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Registro estructurado (logging) para el dashboard de riesgo
+Los módulos emiten a través de una cola (QueueHandler) y un único hilo
+(QueueListener) formatea cada registro como JSON y lo escribe en stderr, de
+modo que registrar nunca bloquea el camino de datos.
+El nivel se controla con la variable de entorno DASHBOARD_NIVEL_LOG
+(DEBUG, INFO, WARNING, ERROR); por defecto INFO.
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+import threading
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+LOGGER_RAIZ = "dashboard"
+NIVEL_POR_DEFECTO = "INFO"
+
+# Atributos propios de LogRecord: todo lo demás viene de `extra` y va al JSON
+_CAMPOS_ESTANDAR = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_lock_configuracion = threading.Lock()
+
+
+class FormateadorJSON(logging.Formatter):
+    """Un objeto JSON por línea: marca de tiempo, nivel, módulo, mensaje y campos extra"""
+
+    def format(self, record):
+        datos = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "modulo": record.name,
+            "mensaje": record.getMessage(),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _CAMPOS_ESTANDAR:
+                datos[clave] = valor
+        if record.exc_info:
+            datos["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+def configurar(nivel=None):
+    """
+    Instala la cola y el hilo de escritura una sola vez por proceso.
+    Llamadas posteriores solo ajustan el nivel si se indica.
+    """
+    global _listener
+    raiz = logging.getLogger(LOGGER_RAIZ)
+
+    with _lock_configuracion:
+        if _listener is None:
+            cola = queue.SimpleQueue()
+            salida = logging.StreamHandler()
+            salida.setFormatter(FormateadorJSON())
+
+            _listener = logging.handlers.QueueListener(cola, salida)
+            _listener.start()
+            atexit.register(_listener.stop)
+
+            raiz.addHandler(logging.handlers.QueueHandler(cola))
+            raiz.propagate = False
+            nivel = nivel or os.environ.get("DASHBOARD_NIVEL_LOG", NIVEL_POR_DEFECTO)
+
+        if nivel:
+            raiz.setLevel(str(nivel).upper())
+
+def obtener_logger(nombre):
+    """Logger hijo de LOGGER_RAIZ para un módulo"""
+    configurar()
+    return logging.getLogger(f"{LOGGER_RAIZ}.{nombre}")
+
+@contextmanager
+def medir(logger, etapa, nivel=logging.INFO, **campos):
+    """
+    Registra la duración de una etapa al terminar el bloque.
+    El diccionario entregado permite agregar campos (bytes, filas) dentro del bloque.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield campos
+    finally:
+        if logger.isEnabledFor(nivel):
+            logger.log(nivel, etapa, extra={
+                "etapa": etapa, "duracion_s": round(time.perf_counter() - inicio, 3), **campos
+            })
@@ -0,0 +1,245 @@
+"""
+Resúmenes probabilísticos (sketches) para métricas del dashboard
+Estructuras compactas y fusionables: se calculan una vez por día al refrescar
+los datos y cualquier rango de fechas se responde fusionando los días del rango.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class TDigest:
+    """
+    t-digest con fusión por lotes (escala k1) para cuantiles aproximados.
+    El error es menor en las colas (p90, p99), justo donde interesan los SLA.
+    """
+
+    def __init__(self, compresion=200):
+        self.compresion = compresion
+        self.medias = np.empty(0)
+        self.pesos = np.empty(0)
+        self.minimo = np.inf
+        self.maximo = -np.inf
+
+    @classmethod
+    def desde_valores(cls, valores, compresion=200):
+        return cls(compresion).agregar(valores)
+
+    @property
+    def total(self):
+        return float(self.pesos.sum())
+
+    def agregar(self, valores):
+        """Agrega un lote de observaciones (los NaN se ignoran)"""
+        valores = np.asarray(valores, dtype=float)
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return self
+
+        self.minimo = min(self.minimo, valores.min())
+        self.maximo = max(self.maximo, valores.max())
+        self._comprimir(
+            np.concatenate([self.medias, valores]),
+            np.concatenate([self.pesos, np.ones(len(valores))])
+        )
+        return self
+
+    def fusionar(self, otro):
+        """Incorpora los centroides de otro digest"""
+        if otro.total == 0:
+            return self
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+        self._comprimir(
+            np.concatenate([self.medias, otro.medias]),
+            np.concatenate([self.pesos, otro.pesos])
+        )
+        return self
+
+    @classmethod
+    def fusionar_todos(cls, digests, compresion=200):
+        """Digest nuevo con la fusión de una colección de digests"""
+        resultado = cls(compresion)
+        for digest in digests:
+            resultado.fusionar(digest)
+        return resultado
+
+    def _comprimir(self, medias, pesos):
+        orden = np.argsort(medias, kind="mergesort")
+        medias, pesos = medias[orden], pesos[orden]
+        total = pesos.sum()
+
+        # Cuantil del centro de cada punto y su índice en la escala k1
+        q = (np.cumsum(pesos) - pesos / 2) / total
+        k = np.floor(self.compresion / (2 * np.pi) * np.arcsin(2 * q - 1))
+
+        # Puntos consecutivos con el mismo índice k forman un centroide
+        inicios = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        nuevos_pesos = np.add.reduceat(pesos, inicios)
+        self.medias = np.add.reduceat(medias * pesos, inicios) / nuevos_pesos
+        self.pesos = nuevos_pesos
+
+    def cuantiles(self, qs):
+        """Cuantiles aproximados para los valores de `qs` en [0, 1]"""
+        qs = np.asarray(qs, dtype=float)
+        if self.total == 0:
+            return np.full(qs.shape, np.nan)
+
+        centros = np.cumsum(self.pesos) - self.pesos / 2
+        posiciones = np.r_[0.0, centros, self.total]
+        valores = np.r_[self.minimo, self.medias, self.maximo]
+        return np.interp(qs * self.total, posiciones, valores)
+
+    def cuantil(self, q):
+        return float(self.cuantiles([q])[0])
+
+
+def _hash64(valores):
+    """Hash estable de 64 bits para un arreglo de valores (vectorizado)"""
+    return pd.util.hash_array(np.asarray(valores, dtype=object).astype(str).astype(object))
+
+def _longitud_bits(x):
+    """Número de bits significativos de cada elemento uint64 (exacto, vectorizado)"""
+    x = x.copy()
+    n = np.zeros(len(x), dtype=np.uint8)
+    for desplazamiento in (32, 16, 8, 4, 2, 1):
+        mayores = x >= (np.uint64(1) << np.uint64(desplazamiento))
+        n[mayores] += desplazamiento
+        x[mayores] >>= np.uint64(desplazamiento)
+    return n + (x > 0).astype(np.uint8)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog para contar valores distintos (RUTs, analistas) con memoria fija.
+    Con precision=12 usa 4 KB y el error típico es ~1.6%; la fusión es exacta.
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registros = np.zeros(1 << precision, dtype=np.uint8)
+
+    @classmethod
+    def desde_valores(cls, valores, precision=12):
+        return cls(precision).agregar(valores)
+
+    def agregar(self, valores):
+        """Agrega un lote de valores (se cuentan por su representación de texto)"""
+        if len(valores) == 0:
+            return self
+
+        hashes = _hash64(valores)
+        bits_resto = 64 - self.precision
+        indices = (hashes >> np.uint64(bits_resto)).astype(np.int64)
+        resto = hashes & np.uint64((1 << bits_resto) - 1)
+        rangos = (bits_resto - _longitud_bits(resto).astype(np.int64) + 1).astype(np.uint8)
+        np.maximum.at(self.registros, indices, rangos)
+        return self
+
+    def fusionar(self, otro):
+        np.maximum(self.registros, otro.registros, out=self.registros)
+        return self
+
+    @classmethod
+    def fusionar_todos(cls, sketches, precision=12):
+        resultado = cls(precision)
+        for sketch in sketches:
+            resultado.fusionar(sketch)
+        return resultado
+
+    def estimar(self):
+        """Cardinalidad estimada (con corrección de rango pequeño)"""
+        m = len(self.registros)
+        alfa = 0.7213 / (1 + 1.079 / m)
+        estimacion = alfa * m * m / np.sum(2.0 ** -self.registros.astype(float))
+
+        vacios = np.count_nonzero(self.registros == 0)
+        if estimacion <= 2.5 * m and vacios:
+            estimacion = m * np.log(m / vacios)
+        return float(estimacion)
+
+
+# Bordes fijos de los histogramas (iguales en todos los días para poder sumarlos)
+BORDES_MONTO = np.arange(0, 5001, 250, dtype=float)
+BORDES_RATIO = np.linspace(0, 1, 21)
+
+
+class HistogramaFijo:
+    """
+    Histograma sobre bordes fijos; la fusión es la suma de conteos.
+    Los valores fuera de rango se acumulan en el primer o último intervalo.
+    """
+
+    def __init__(self, bordes):
+        self.bordes = bordes
+        self.conteos = np.zeros(len(bordes) - 1, dtype=np.int64)
+
+    @classmethod
+    def desde_valores(cls, valores, bordes):
+        return cls(bordes).agregar(valores)
+
+    @property
+    def total(self):
+        return int(self.conteos.sum())
+
+    def agregar(self, valores):
+        """Agrega un lote de observaciones (los NaN se ignoran)"""
+        valores = np.asarray(valores, dtype=float)
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return self
+
+        valores = np.clip(valores, self.bordes[0], self.bordes[-1])
+        self.conteos += np.histogram(valores, bins=self.bordes)[0]
+        return self
+
+    def fusionar(self, otro):
+        self.conteos += otro.conteos
+        return self
+
+
+class ResumenDiario:
+    """
+    Resumen fusionable de las evaluaciones de un día: conteos exactos,
+    HyperLogLog de RUTs y analistas, t-digest de tiempos de respuesta e
+    histogramas de monto y ratio de financiamiento por resolución.
+    Rango de fechas = fusión de los resúmenes de sus días.
+    """
+
+    def __init__(self):
+        self.casos = 0
+        self.aprobados = 0
+        self.rechazados = 0
+        self.primera = None   # Timestamp del primer caso
+        self.ultima = None    # Timestamp del último caso
+        self.ruts = HyperLogLog()
+        self.analistas = HyperLogLog()
+        self.tiempo_respuesta = TDigest()
+        self.monto_aprobado = 0.0
+        self.montos = {}   # resolucion_riesgo -> HistogramaFijo(BORDES_MONTO)
+        self.ratios = {}   # resolucion_riesgo -> HistogramaFijo(BORDES_RATIO)
+
+    def fusionar(self, otro):
+        self.casos += otro.casos
+        self.aprobados += otro.aprobados
+        self.rechazados += otro.rechazados
+        if otro.primera is not None:
+            self.primera = otro.primera if self.primera is None else min(self.primera, otro.primera)
+            self.ultima = otro.ultima if self.ultima is None else max(self.ultima, otro.ultima)
+        self.ruts.fusionar(otro.ruts)
+        self.analistas.fusionar(otro.analistas)
+        self.tiempo_respuesta.fusionar(otro.tiempo_respuesta)
+        self.monto_aprobado += otro.monto_aprobado
+        for propios, ajenos in ((self.montos, otro.montos), (self.ratios, otro.ratios)):
+            for resolucion, histograma in ajenos.items():
+                if resolucion not in propios:
+                    propios[resolucion] = HistogramaFijo(histograma.bordes)
+                propios[resolucion].fusionar(histograma)
+        return self
+
+    @classmethod
+    def fusionar_todos(cls, resumenes):
+        resultado = cls()
+        for resumen in resumenes:
+            resultado.fusionar(resumen)
+        return resultado
@@ -0,0 +1,41 @@
+"""
+Pruebas del procesamiento de evaluaciones en data_manager
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_manager
+
+
+def test_procesa_archivo_ya_procesado(tmp_path):
+    """El archivo diario ya procesado no trae fechas de ingreso, montos ni ratios"""
+    ruta = tmp_path / "manual_evaluations_2025-06-03.csv"
+    pd.DataFrame({
+        "rut": ["11111111-1", "22222222-2", "33333333-3"],
+        "resolucion_riesgo": ["Aprobado", "Rechazado", "0"],
+        "fecha_creacion": [
+            "2025-06-02 13:40:56.935000+00:00",
+            "2025-06-02 15:10:00+00:00",
+            "2025-06-03 12:00:00+00:00",
+        ],
+        "status": ["RATIFIED", "REFUSED", "REFUSED"],
+        "manualEvaluationId": ["a1", "a2", "a3"],
+        "analista_riesgo": ["Desconocido"] * 3,
+    }).to_csv(ruta, index=False)
+
+    df = data_manager.procesar_datos_manual_evaluation(str(ruta))
+
+    assert len(df) == 3
+    assert df[data_manager.COLUMNAS_OPCIONALES].isna().all().all()
+    assert df["tiempo_respuesta_min"].isna().all()
+    assert df["resolucion_riesgo"].tolist() == ["Aprobado", "Rechazado", "Rechazado"]
+
+    resumenes = data_manager.calcular_resumenes(df)
+    assert sum(resumen.casos for resumen in resumenes["por_dia"].values()) == 3
+    assert all(not resumen.montos and not resumen.ratios for resumen in resumenes["por_dia"].values())
+    assert all(resumen.tiempo_respuesta.total == 0 for resumen in resumenes["por_dia"].values())
@@ -0,0 +1,128 @@
+"""
+Vista con filtrado en el navegador para el dashboard de riesgo
+La página envía una sola vez la matriz compacta día × resolución (ver
+data_manager.calcular_matriz_diaria) y un componente HTML con plotly.js
+filtra por fechas y re-agrega en el cliente: mover el rango de fechas no
+provoca ejecuciones en el servidor.
+"""
+
+import json
+from plotly.offline import get_plotlyjs_version
+
+ALTURA_COMPONENTE = 1150
+DIAS_POR_DEFECTO = 30   # Rango inicial del intervalo (últimos días con datos)
+
+_PLANTILLA = """
+<div id="controles" style="font-family: sans-serif; display: flex; gap: 1.5rem; align-items: end; flex-wrap: wrap;">
+  <label><input type="radio" name="modo" value="intervalo" checked> 📊 Intervalo de fechas</label>
+  <label><input type="radio" name="modo" value="dia"> 📅 Dia especifico</label>
+  <label>📅 Fecha inicio<br><input type="date" id="desde"></label>
+  <label id="etiqueta_hasta">📅 Fecha fin<br><input type="date" id="hasta"></label>
+</div>
+<div id="kpis" style="font-family: sans-serif; display: flex; gap: 1rem; margin: 1rem 0;"></div>
+<div style="display: flex;">
+  <div id="grafico_meses" style="flex: 3; height: 420px;"></div>
+  <div id="grafico_torta" style="flex: 2; height: 420px;"></div>
+</div>
+<div id="grafico_serie" style="height: 420px;"></div>
+<script src="https://cdn.plot.ly/plotly-__VERSION_PLOTLY__.min.js"></script>
+<script>
+const D = __DATOS__;
+const desde = document.getElementById("desde");
+const hasta = document.getElementById("hasta");
+
+const aTexto = c => { const s = String(c); return s.slice(0, 4) + "-" + s.slice(4, 6) + "-" + s.slice(6, 8); };
+const aClave = t => parseInt(t.replaceAll("-", ""), 10);
+const modo = () => document.querySelector("input[name=modo]:checked").value;
+
+function kpi(titulo, valor) {
+  return '<div style="flex: 1; padding: 1rem; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">'
+       + '<div style="color: #666;">' + titulo + '</div><div style="font-size: 1.8rem;">' + valor + '</div></div>';
+}
+
+function actualizar() {
+  const dia = modo() === "dia";
+  document.getElementById("etiqueta_hasta").style.display = dia ? "none" : "";
+  const a = aClave(desde.value), b = dia ? a : aClave(hasta.value);
+  const R = D.resoluciones.length;
+
+  // Re-agregación del rango: total por resolución, por mes y serie diaria/horaria
+  const total = new Array(R).fill(0), meses = {}, serieX = [], serieY = [], horas = new Array(24).fill(0);
+  D.dias.forEach((d, i) => {
+    if (d < a || d > b) return;
+    const mes = Math.floor(d / 100);
+    meses[mes] = meses[mes] || new Array(R).fill(0);
+    let casosDia = 0;
+    D.conteos[i].forEach((n, r) => { total[r] += n; meses[mes][r] += n; casosDia += n; });
+    D.horas[i].forEach((n, h) => { horas[h] += n; });
+    serieX.push(aTexto(d)); serieY.push(casosDia);
+  });
+
+  const casos = total.reduce((x, y) => x + y, 0);
+  const aprobados = total[D.resoluciones.indexOf(D.aprobada)] || 0;
+  const nDias = dia ? 1 : serieX.length ? (new Date(serieX[serieX.length - 1]) - new Date(serieX[0])) / 864e5 + 1 : 0;
+  document.getElementById("kpis").innerHTML = casos
+    ? kpi("📊 Total de Casos", casos)
+      + kpi("✅ Tasa de Aprobacion", (100 * aprobados / casos).toFixed(1) + "%")
+      + kpi("📈 Promedio Diario", (casos / nDias).toFixed(1))
+    : '<div style="color: #b00;">⚠️ No hay datos para el periodo seleccionado</div>';
+
+  // Resoluciones por mes (porcentaje dentro de cada mes)
+  const claves = Object.keys(meses).sort();
+  const etiquetas = claves.map(m => {
+    const n = meses[m].reduce((x, y) => x + y, 0);
+    return m.slice(0, 4) + "-" + m.slice(4) + " (" + n + " casos)";
+  });
+  const trazasMes = D.resoluciones.map((res, r) => {
+    const y = claves.map(m => 100 * meses[m][r] / meses[m].reduce((x, z) => x + z, 0));
+    return { type: "bar", name: res, x: etiquetas, y: y, marker: { color: D.colores[res] || "#CCCCCC" },
+             text: y.map(v => v.toFixed(1) + "%"), textposition: "outside" };
+  }).filter(t => t.y.some(v => v > 0));
+  Plotly.react("grafico_meses", trazasMes, {
+    title: "📊 Resoluciones por Periodo (Total: " + casos + ")", barmode: "group",
+    template: "plotly_white", showlegend: false, yaxis: { title: "Porcentaje (%)" }, xaxis: { title: "Periodo" },
+  }, { responsive: true });
+
+  // Distribución del rango completo
+  const conCasos = D.resoluciones.map((res, r) => [res, total[r]]).filter(p => p[1] > 0);
+  Plotly.react("grafico_torta", [{
+    type: "pie", hole: 0.3, textinfo: "percent+label",
+    labels: conCasos.map(p => p[0]), values: conCasos.map(p => p[1]),
+    marker: { colors: conCasos.map(p => D.colores[p[0]] || "#CCCCCC") },
+  }], { title: "🥧 Distribucion del periodo", showlegend: false }, { responsive: true });
+
+  // Evolución temporal: por hora en un día, por día en un intervalo
+  const serie = dia
+    ? { type: "bar", x: [...Array(24).keys()], y: horas, marker: { color: "#87CEEB" } }
+    : { type: "bar", x: serieX, y: serieY, marker: { color: "#87CEEB" }, opacity: 0.7 };
+  Plotly.react("grafico_serie", [serie], {
+    title: "📈 Evolucion Temporal (" + (dia ? desde.value : desde.value + " - " + hasta.value) + ")",
+    template: "plotly_white", xaxis: { title: dia ? "Hora" : "Fecha" }, yaxis: { title: "Numero de Casos" },
+  }, { responsive: true });
+}
+
+if (D.dias.length) {
+  const primero = aTexto(D.dias[0]), ultimo = aTexto(D.dias[D.dias.length - 1]);
+  [desde, hasta].forEach(e => { e.min = primero; e.max = ultimo; });
+  hasta.value = ultimo;
+  desde.value = aTexto(D.dias[Math.max(0, D.dias.length - __DIAS_POR_DEFECTO__)]);
+}
+[desde, hasta].forEach(e => e.addEventListener("input", actualizar));
+document.querySelectorAll("input[name=modo]").forEach(e => e.addEventListener("change", actualizar));
+actualizar();
+</script>
+"""
+
+
+def generar_html(matriz, colores, resolucion_aprobada):
+    """
+    HTML autocontenido del componente: `matriz` es el resultado de
+    calcular_matriz_diaria y `colores` el mapa resolución -> color del dashboard.
+    """
+    datos = dict(matriz, colores=colores, aprobada=resolucion_aprobada)
+    return (
+        _PLANTILLA
+        .replace("__VERSION_PLOTLY__", get_plotlyjs_version())
+        .replace("__DIAS_POR_DEFECTO__", str(DIAS_POR_DEFECTO))
+        .replace("__DATOS__", json.dumps(datos, separators=(",", ":"), ensure_ascii=False))
+    )